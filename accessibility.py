@@ -0,0 +1,390 @@
+"""
+Поиск элементов через дерево доступности ОС (без скриншотов, OCR и vision)
+
+Нативные части сценариев - панели браузера, окна расширения кошелька, системные
+диалоги - видны в дереве доступности: у каждой кнопки есть роль, имя и точные
+границы. Поиск по снимку дерева активного окна занимает миллисекунды.
+
+Платформы (один интерфейс AccessibilityBackend):
+    Linux - AT-SPI (pyatspi), события через Registry;
+    macOS - AX API (pyobjc ApplicationServices), события через AXObserver.
+
+Снимок дерева кэшируется по окну и сбрасывается по событиям изменения
+(появление/удаление элементов, смена окна, смена имени) только того окна, к
+которому относится событие (если окно не определить - всех окон его
+приложения); без событий - по ttl. Координаты - точки экрана (как у
+pyautogui). Canvas и картинки в дереве не видны - для них остаются OCR и vision.
+
+Потоки: pyatspi не потокобезопасен, а цикл событий AT-SPI (Registry.start)
+работает в своем потоке. Все обращения бэкенда к дереву - из потоков поиска и
+из обработчика событий - идут под одной блокировкой бэкенда.
+"""
+
+import platform
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+# Общие роли -> роли платформ (AT-SPI getRoleName / AX AXRole)
+ROLE_ALIASES = {
+    "button": {"push button", "toggle button", "button", "AXButton", "AXPopUpButton", "AXMenuButton"},
+    "link": {"link", "AXLink"},
+    "textbox": {"entry", "text", "password text", "AXTextField", "AXTextArea", "AXSecureTextField"},
+    "checkbox": {"check box", "AXCheckBox"},
+    "menuitem": {"menu item", "AXMenuItem"},
+    "tab": {"page tab", "AXTab", "AXRadioButton"},
+}
+NATIVE_ROLES = {native: role for role, natives in ROLE_ALIASES.items() for native in natives}
+
+
+@dataclass
+class AxElement:
+    """Элемент дерева доступности (координаты экрана в точках)"""
+    box: Box
+    name: str
+    role: str  # общая роль (ROLE_ALIASES) или роль платформы
+    native_role: str
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        left, top, width, height = self.box
+        return (left + width // 2, top + height // 2)
+
+
+class AccessibilityBackend:
+    """Интерфейс платформы: активное окно, снимок его элементов, события изменения"""
+    name = "none"
+
+    def window_key(self) -> Optional[Hashable]:
+        """Идентификатор активного окна (None - окна нет)"""
+        raise NotImplementedError
+
+    def elements(self, max_elements: int) -> List[AxElement]:
+        """Видимые элементы с именем и размером в активном окне"""
+        raise NotImplementedError
+
+    def subscribe(self, callback: Callable[[str, Optional[Hashable], Optional[Hashable]], None]) -> bool:
+        """
+        Подписка на события изменения дерева; False - события недоступны
+
+        callback(тип события, ключ окна как у window_key или None, приложение - первый
+        элемент ключа окна - или None)
+        """
+        return False
+
+
+class AtspiBackend(AccessibilityBackend):
+    """Linux: AT-SPI через pyatspi"""
+    name = "at-spi"
+
+    EVENTS = ("object:children-changed", "object:state-changed:showing",
+              "object:property-change:accessible-name", "window:activate", "window:deactivate")
+
+    def __init__(self):
+        import pyatspi
+        self.pyatspi = pyatspi
+        # Обход дерева из потоков поиска и разбор событий в потоке Registry.start
+        self._lock = threading.RLock()
+
+    def _active_window(self):
+        for app in self.pyatspi.Registry.getDesktop(0):
+            if app is None:
+                continue
+            for window in app:
+                if window is not None and window.getState().contains(self.pyatspi.STATE_ACTIVE):
+                    return app, window
+        return None, None
+
+    def window_key(self) -> Optional[Hashable]:
+        with self._lock:
+            app, window = self._active_window()
+            return (app.name, window.name) if window is not None else None
+
+    def elements(self, max_elements: int) -> List[AxElement]:
+        with self._lock:
+            return self._elements(max_elements)
+
+    def _elements(self, max_elements: int) -> List[AxElement]:
+        _, window = self._active_window()
+        if window is None:
+            return []
+        showing = self.pyatspi.STATE_SHOWING
+        result = []
+        stack = [window]
+        visited = 0
+        while stack and visited < max_elements:
+            node = stack.pop()
+            visited += 1
+            try:
+                if node is not window and not node.getState().contains(showing):
+                    continue
+                name = (node.name or "").strip()
+                if name:
+                    extents = node.queryComponent().getExtents(self.pyatspi.DESKTOP_COORDS)
+                    if extents.width > 0 and extents.height > 0:
+                        native = node.getRoleName()
+                        result.append(AxElement((extents.x, extents.y, extents.width, extents.height),
+                                                name, NATIVE_ROLES.get(native, native), native))
+                stack.extend(child for child in node if child is not None)
+            except Exception:
+                continue  # элемент исчез во время обхода
+        return result
+
+    def _event_window(self, source, max_depth: int = 64) -> Tuple[Optional[Hashable], Optional[Hashable]]:
+        """(ключ окна, приложение) элемента события: подъем до потомка приложения"""
+        with self._lock:
+            try:
+                app = source.getApplication()
+                node = source
+                for _ in range(max_depth):
+                    parent = node.parent
+                    if parent is None or parent == app:
+                        return ((app.name, node.name) if parent is not None else None), app.name
+                    node = parent
+                return None, app.name
+            except Exception:
+                return None, None  # элемент уже удален
+
+    def subscribe(self, callback: Callable[[str, Optional[Hashable], Optional[Hashable]], None]) -> bool:
+        registry = self.pyatspi.Registry
+
+        def on_event(event):
+            window, app = self._event_window(event.source)
+            callback(event.type, window, app)
+
+        registry.registerEventListener(on_event, *self.EVENTS)
+        threading.Thread(target=registry.start, daemon=True, name="atspi-events").start()
+        return True
+
+
+class MacAxBackend(AccessibilityBackend):
+    """macOS: AX API через pyobjc (нужно разрешение "Универсальный доступ")"""
+    name = "ax"
+
+    NOTIFICATIONS = ("AXFocusedWindowChanged", "AXCreated", "AXUIElementDestroyed",
+                     "AXTitleChanged", "AXValueChanged")
+
+    def __init__(self):
+        import ApplicationServices
+        import CoreFoundation
+        self.ax = ApplicationServices
+        self.cf = CoreFoundation
+        self._system = ApplicationServices.AXUIElementCreateSystemWide()
+        self._callback: Optional[Callable[[str, Optional[Hashable], Optional[Hashable]], None]] = None
+        self._observers: Dict[int, object] = {}
+        self._run_loop = None
+
+    def _attr(self, element, name: str):
+        error, value = self.ax.AXUIElementCopyAttributeValue(element, name, None)
+        return value if error == 0 else None
+
+    def _focused(self):
+        app = self._attr(self._system, "AXFocusedApplication")
+        window = self._attr(app, "AXFocusedWindow") if app is not None else None
+        return app, window
+
+    def _box(self, element) -> Optional[Box]:
+        position = self._attr(element, "AXPosition")
+        size = self._attr(element, "AXSize")
+        if position is None or size is None:
+            return None
+        _, point = self.ax.AXValueGetValue(position, self.ax.kAXValueCGPointType, None)
+        _, extent = self.ax.AXValueGetValue(size, self.ax.kAXValueCGSizeType, None)
+        return (int(point.x), int(point.y), int(extent.width), int(extent.height))
+
+    def window_key(self) -> Optional[Hashable]:
+        app, window = self._focused()
+        if window is None:
+            return None
+        _, pid = self.ax.AXUIElementGetPid(app)
+        self._observe(pid, app)
+        return (pid, self._attr(window, "AXTitle"))
+
+    def elements(self, max_elements: int) -> List[AxElement]:
+        _, window = self._focused()
+        if window is None:
+            return []
+        result = []
+        stack = [window]
+        visited = 0
+        while stack and visited < max_elements:
+            node = stack.pop()
+            visited += 1
+            name = next((value for value in (self._attr(node, attribute)
+                                             for attribute in ("AXTitle", "AXDescription", "AXValue"))
+                         if isinstance(value, str) and value.strip()), "").strip()
+            if name:
+                box = self._box(node)
+                if box and box[2] > 0 and box[3] > 0:
+                    native = self._attr(node, "AXRole") or ""
+                    result.append(AxElement(box, name, NATIVE_ROLES.get(native, native), native))
+            stack.extend(self._attr(node, "AXChildren") or [])
+        return result
+
+    def subscribe(self, callback: Callable[[str, Optional[Hashable], Optional[Hashable]], None]) -> bool:
+        self._callback = callback
+        ready = threading.Event()
+
+        def run():
+            self._run_loop = self.cf.CFRunLoopGetCurrent()
+            ready.set()
+            while True:
+                self.cf.CFRunLoopRunInMode(self.cf.kCFRunLoopDefaultMode, 1.0, False)
+
+        threading.Thread(target=run, daemon=True, name="ax-events").start()
+        ready.wait(1.0)
+        return True
+
+    def _observe(self, pid: int, app):
+        """AXObserver на приложение (создается при первой встрече окна этого приложения)"""
+        if self._callback is None or self._run_loop is None or pid in self._observers:
+            return
+
+        def notify(observer, element, notification, refcon):
+            # Окно элемента (у окна - оно само); удаленный элемент атрибутов уже не отдает
+            window = element if self._attr(element, "AXRole") == "AXWindow" else self._attr(element, "AXWindow")
+            title = self._attr(window, "AXTitle") if window is not None else None
+            self._callback(str(notification), (pid, title) if title is not None else None, pid)
+
+        error, observer = self.ax.AXObserverCreate(pid, notify, None)
+        if error != 0:
+            return
+        for notification in self.NOTIFICATIONS:
+            self.ax.AXObserverAddNotification(observer, app, notification, None)
+        self.cf.CFRunLoopAddSource(self._run_loop, self.ax.AXObserverGetRunLoopSource(observer),
+                                   self.cf.kCFRunLoopDefaultMode)
+        self.cf.CFRunLoopWakeUp(self._run_loop)
+        self._observers[pid] = (observer, notify)
+
+
+def default_backend(log: Callable[[str, str], None] = None) -> Optional[AccessibilityBackend]:
+    """Бэкенд текущей платформы (None - нет библиотеки или платформа не поддерживается)"""
+    log = log or (lambda message, level="INFO": None)
+    system = platform.system()
+    try:
+        if system == "Linux":
+            return AtspiBackend()
+        if system == "Darwin":
+            return MacAxBackend()
+    except ImportError as e:
+        log(f"Дерево доступности недоступно: {e}", "DEBUG")
+    return None
+
+
+class AccessibilityResolver:
+    """Поиск по роли и имени в кэшированном снимке дерева активного окна"""
+
+    def __init__(self, backend: AccessibilityBackend = None, ttl: float = 2.0, max_elements: int = 3000,
+                 max_windows: int = 8, log: Callable[[str, str], None] = None):
+        """
+        Args:
+            backend: Бэкенд платформы (по умолчанию default_backend())
+            ttl: Срок жизни снимка окна, с (с событиями - страховка от пропущенных событий)
+            max_elements: Предел обхода дерева
+            max_windows: Сколько окон держать в кэше
+            log: Функция логирования вида log(message, level)
+        """
+        self.log = log or (lambda message, level="INFO": None)
+        self.backend = backend or default_backend(self.log)
+        self.ttl = ttl
+        self.max_elements = max_elements
+        self.max_windows = max_windows
+        self._cache: "OrderedDict[Hashable, Tuple[float, List[AxElement]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"found": 0, "missed": 0, "cache_hits": 0, "snapshots": 0, "events": 0, "errors": 0}
+
+        self.events = False
+        if self.backend:
+            try:
+                self.events = self.backend.subscribe(self._on_event)
+            except Exception as e:
+                self.log(f"События дерева доступности недоступны: {e}", "DEBUG")
+
+    @property
+    def available(self) -> bool:
+        return self.backend is not None
+
+    def _on_event(self, event: str, window: Optional[Hashable] = None, app: Optional[Hashable] = None):
+        self.stats["events"] += 1
+        if window is not None:
+            self.invalidate(window)
+        elif app is not None:
+            self.invalidate_app(app)
+        else:
+            self.invalidate()
+
+    def invalidate(self, window: Hashable = None):
+        """Сброс снимка окна (или всех окон)"""
+        with self._lock:
+            if window is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(window, None)
+
+    def invalidate_app(self, app: Hashable):
+        """Сброс снимков всех окон приложения (ключ окна - (приложение, заголовок))"""
+        with self._lock:
+            for window in [key for key in self._cache if key[0] == app]:
+                del self._cache[window]
+
+    def snapshot(self) -> List[AxElement]:
+        """Элементы активного окна (из кэша, если окно не менялось)"""
+        window = self.backend.window_key()
+        if window is None:
+            return []
+        with self._lock:
+            cached = self._cache.get(window)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                self._cache.move_to_end(window)
+                self.stats["cache_hits"] += 1
+                return cached[1]
+
+        started = time.perf_counter()
+        elements = self.backend.elements(self.max_elements)
+        self.stats["snapshots"] += 1
+        self.log(f"Дерево доступности {window}: {len(elements)} элементов за "
+                 f"{(time.perf_counter() - started) * 1000:.0f} мс", "DEBUG")
+        with self._lock:
+            self._cache[window] = (time.monotonic(), elements)
+            while len(self._cache) > self.max_windows:
+                self._cache.popitem(last=False)
+        return elements
+
+    def find(self, role: str = None, names: Sequence[str] = (), exact: bool = False) -> Optional[AxElement]:
+        """
+        Элемент по роли и имени; имена проверяются по порядку (первое - предпочтительное),
+        среди совпадений берется самый маленький элемент
+
+        Returns:
+            Элемент или None (не найден или дерево недоступно)
+        """
+        if not self.backend:
+            return None
+        try:
+            elements = self.snapshot()
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.log(f"Ошибка чтения дерева доступности: {e}", "DEBUG")
+            return None
+
+        if role:
+            elements = [element for element in elements if element.role == role]
+        for name in names or [None]:
+            if name is None:
+                matches = elements
+            else:
+                needle = name.lower()
+                matches = [element for element in elements
+                           if (element.name.lower() == needle if exact else needle in element.name.lower())]
+            if matches:
+                self.stats["found"] += 1
+                element = min(matches, key=lambda element: element.box[2] * element.box[3])
+                self.log(f"Доступность: {role or '*'} '{element.name}' {element.center}", "DEBUG")
+                return element
+
+        self.stats["missed"] += 1
+        return None
@@ -0,0 +1,127 @@
+"""
+Компактная грамматика плана действий для vision планировщика
+
+Модель отвечает короткими ключами и кодами действий:
+    {"x": [{"a": "c", "m": 7, "p": null, "v": null}, {"a": "t", "m": null, "p": null, "v": "hi"}]}
+
+    a - код действия (ACTION_CODES), m - номер метки set-of-marks,
+    p - координаты [x, y] (режим без меток), v - значение (текст, клавиша, URL, секунды, направление)
+
+Схема передается провайдеру через response_format (structured outputs), ответ
+проверяется строгим валидатором без починки регулярками. Системные промпты -
+неизменные константы: одинаковый префикс запроса кэшируется на стороне провайдера.
+"""
+
+import json
+from typing import Dict, List, Optional
+
+ACTION_CODES = {
+    "c": "click",
+    "t": "type",
+    "k": "key",
+    "n": "navigate",
+    "w": "wait",
+    "s": "scroll"
+}
+
+# Действия, которым нужно значение v
+VALUE_ACTIONS = {"type", "key", "navigate", "wait", "scroll"}
+
+_NULLABLE_INT = {"type": ["integer", "null"]}
+_NULLABLE_STR = {"type": ["string", "null"]}
+_NULLABLE_POINT = {
+    "anyOf": [
+        {"type": "array", "items": {"type": "integer"}, "minItems": 2, "maxItems": 2},
+        {"type": "null"}
+    ]
+}
+
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "x": {
+            "type": "array",
+            "maxItems": 8,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "a": {"type": "string", "enum": list(ACTION_CODES)},
+                    "m": _NULLABLE_INT,
+                    "p": _NULLABLE_POINT,
+                    "v": _NULLABLE_STR
+                },
+                "required": ["a", "m", "p", "v"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["x"],
+    "additionalProperties": False
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "plan", "strict": True, "schema": PLAN_SCHEMA}
+}
+
+_GRAMMAR = """Reply with JSON {"x":[...]}; each action is {"a":code,"m":mark,"p":point,"v":value}, unused fields null.
+Codes: c=click, t=type text, k=press key (Return, Tab, Delete...), n=navigate to URL v, w=wait v seconds, s=scroll v (up/down).
+yupp.ai: the input field is at the bottom center; "I prefer this" buttons are small buttons below AI responses.
+Return {"x":[]} if the command cannot be done on this screen."""
+
+# Промпты - константы: не подставлять в них ничего динамического (кэш префикса у провайдера)
+SYSTEM_PROMPT_MARKS = """You plan browser actions on yupp.ai from a screenshot.
+Clickable elements are outlined and labeled with numbers (marks). Click actions set m to the mark number and p to null.
+""" + _GRAMMAR
+
+SYSTEM_PROMPT_COORDS = """You plan browser actions on yupp.ai from a screenshot.
+Click actions set p to [x, y] pixel coordinates of the element center on the screenshot and m to null.
+""" + _GRAMMAR
+
+
+def parse_plan(content: str) -> Optional[List[Dict]]:
+    """
+    Строгий валидатор ответа
+
+    Returns:
+        Список действий вида {"action_type", "mark", "point", "value"}
+        или None, если ответ не соответствует схеме (тогда побеждает другой провайдер)
+    """
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("x"), list):
+        return None
+
+    actions = []
+    for item in data["x"]:
+        if not isinstance(item, dict):
+            return None
+        action_type = ACTION_CODES.get(item.get("a"))
+        if action_type is None:
+            return None
+
+        mark, point, value = item.get("m"), item.get("p"), item.get("v")
+        if mark is not None and not isinstance(mark, int):
+            return None
+        if point is not None:
+            if (not isinstance(point, list) or len(point) != 2
+                    or not all(isinstance(v, (int, float)) for v in point)):
+                return None
+            point = (int(point[0]), int(point[1]))
+        if value is not None and not isinstance(value, str):
+            value = str(value)
+
+        if action_type == "click" and mark is None and point is None:
+            return None
+        if action_type in VALUE_ACTIONS and not value:
+            return None
+        if action_type == "wait":
+            try:
+                value = str(max(1, round(float(value))))
+            except ValueError:
+                return None
+
+        actions.append({"action_type": action_type, "mark": mark, "point": point, "value": value})
+    return actions
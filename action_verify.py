@@ -0,0 +1,204 @@
+"""
+Проверка результата действия по локальному сравнению кадров
+
+Действие может объявить ожидаемый эффект (Expectation):
+    - region_changes: область вокруг точки изменилась;
+    - screen_changes: изменился экран целиком;
+    - target_disappears: цель исчезла (текст больше не читается в области,
+      а без текста - область изменилась);
+    - text_appears: в области (или на экране) появился текст.
+
+До действия снимается опорный кадр области, после - область опрашивается до
+короткого дедлайна. Если эффекта нет, действие повторяется локально: сначала
+по заново найденной точке, затем со сдвигом на несколько пикселей - и только
+потом вызывающий код переходит к дорогому перепланированию моделью.
+
+Повтор может отправить форму дважды или переключить выбор обратно, поэтому
+перед каждым повтором область еще раз ждет любого изменения (эффект пришел с
+опозданием или оказался ниже порога) - тогда повтора нет. Сдвиг точки - только
+для действий, объявленных безопасными для повтора (repeatable).
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+Point = Tuple[int, int]
+
+KINDS = ("region_changes", "screen_changes", "target_disappears", "text_appears")
+
+
+@dataclass
+class Expectation:
+    """Ожидаемый эффект действия (координаты - пиксели захвата экрана)"""
+    kind: str = "region_changes"
+    region: Optional[Box] = None  # None - весь экран
+    text: Optional[str] = None
+    threshold: float = 4.0  # средняя разница уменьшенных серых копий (0-255)
+    deadline: float = 1.5  # сколько ждать эффекта, с
+    repeatable: bool = False  # повтор со сдвигом точки безопасен (фокус поля, а не отправка или выбор)
+
+    @classmethod
+    def from_config(cls, spec: Dict, point: Point = None, defaults: Dict = None) -> "Expectation":
+        """
+        Ожидание из конфигурации шага: {"kind", "radius", "text", "threshold", "deadline", "repeatable"}
+
+        Args:
+            spec: Описание эффекта
+            point: Точка действия (область = квадрат radius вокруг нее)
+            defaults: Значения по умолчанию (секция verify конфигурации)
+        """
+        options = {**(defaults or {}), **spec}
+        kind = options.get("kind", "region_changes")
+        if kind not in KINDS:
+            raise ValueError(f"Неизвестный тип ожидания: {kind}")
+
+        region = options.get("region")
+        if region is None and point is not None and kind != "screen_changes":
+            region = region_around(point, options.get("radius", 120))
+        return cls(
+            kind=kind,
+            region=tuple(region) if region else None,
+            text=options.get("text"),
+            threshold=options.get("threshold", 4.0),
+            deadline=options.get("deadline", 1.5),
+            repeatable=options.get("repeatable", False)
+        )
+
+
+def region_around(point: Point, radius: int) -> Box:
+    """Квадратная область вокруг точки (не выходит за левый/верхний край)"""
+    x, y = point
+    left, top = max(0, x - radius), max(0, y - radius)
+    return (left, top, x + radius - left, y + radius - top)
+
+
+def nudge_points(point: Point, step: int = 6) -> List[Point]:
+    """Соседние точки для повторного клика (вниз, вверх, вправо, влево)"""
+    x, y = point
+    return [(x, y + step), (x, y - step), (x + step, y), (x - step, y)]
+
+
+def image_diff(image_a, image_b, size: Tuple[int, int] = (64, 40)) -> float:
+    """Средняя разница уменьшенных серых копий двух изображений (0-255)"""
+    from PIL import ImageChops, ImageStat
+    a = image_a.convert("L").resize(size)
+    b = image_b.convert("L").resize(size)
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0]
+
+
+def contains_text(image, text: str) -> bool:
+    """Есть ли текст на изображении (OCR, без учета регистра)"""
+    import pytesseract
+    return text.lower() in pytesseract.image_to_string(image).lower()
+
+
+class ActionVerifier:
+    """Опорный кадр до действия и опрос эффекта после"""
+
+    def __init__(self, grab: Callable[[Optional[Box]], Any], poll_interval: float = 0.1,
+                 log: Callable[[str, str], None] = None):
+        """
+        Args:
+            grab: Захват экрана или области -> PIL изображение
+            poll_interval: Период опроса после действия, с
+            log: Функция логирования вида log(message, level)
+        """
+        self.grab = grab
+        self.poll_interval = poll_interval
+        self.log = log or (lambda message, level="INFO": None)
+        self.stats = {"verified": 0, "failed": 0, "retries": 0, "late": 0}
+
+    def baseline(self, expect: Expectation):
+        """Опорный кадр области до действия"""
+        return self.grab(expect.region)
+
+    def check(self, expect: Expectation, base, current, any_change: bool = False) -> bool:
+        """Выполнен ли эффект на текущем кадре (any_change - достаточно любого изменения области)"""
+        if any_change:
+            return image_diff(base, current) > 0
+        if expect.kind == "text_appears":
+            return contains_text(current, expect.text)
+        if expect.kind == "target_disappears" and expect.text:
+            return not contains_text(current, expect.text)
+        return image_diff(base, current) >= expect.threshold
+
+    def wait(self, expect: Expectation, base, any_change: bool = False) -> bool:
+        """Опрос эффекта до дедлайна"""
+        deadline = time.monotonic() + expect.deadline
+        while True:
+            if self.check(expect, base, self.grab(expect.region), any_change):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+    async def wait_async(self, expect: Expectation, base, any_change: bool = False) -> bool:
+        """Опрос эффекта до дедлайна без блокировки event loop"""
+        deadline = time.monotonic() + expect.deadline
+        while True:
+            current = await asyncio.to_thread(self.grab, expect.region)
+            if await asyncio.to_thread(self.check, expect, base, current, any_change):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(self.poll_interval)
+
+    def record(self, verified: bool, attempts: int):
+        self.stats["verified" if verified else "failed"] += 1
+        self.stats["retries"] += max(0, attempts - 1)
+
+    def late(self, attempts: int):
+        """Повтор не понадобился: область изменилась после дедлайна или ниже порога"""
+        self.stats["late"] += 1
+        self.record(True, attempts)
+        self.log("Область цели изменилась (эффект поздний или слабый) - повтор не нужен", "DEBUG")
+
+    def perform(self, act: Callable[[Point], bool], point: Point, expect: Expectation,
+                resolve: Callable[[], Optional[Point]] = None, nudge: int = 6) -> bool:
+        """
+        Действие с проверкой эффекта и локальными повторами
+
+        Args:
+            act: Действие по точке (например, клик) -> выполнено ли
+            point: Исходная точка
+            expect: Ожидаемый эффект
+            resolve: Повторный дешевый поиск цели (без модели) -> новая точка
+            nudge: Сдвиг точки при повторах, пикселей (0 - без сдвигов; только для expect.repeatable)
+
+        Returns:
+            True, если эффект подтвержден
+        """
+        base = self.baseline(expect)
+        tried = []
+
+        def retries():
+            # Заново найденная точка - на кадре после неудачной попытки, затем сдвиги
+            if resolve:
+                resolved = resolve()
+                if resolved:
+                    yield resolved
+            if nudge and expect.repeatable:
+                yield from nudge_points(point, nudge)
+
+        targets = retries()
+        target = point
+        while target is not None:
+            tried.append(target)
+            acted = act(target)
+            if acted and self.wait(expect, base):
+                self.record(True, len(tried))
+                return True
+            # Повтор только если область не изменилась вовсе: иначе действие уже сработало
+            if acted and self.wait(expect, base, any_change=True):
+                self.late(len(tried))
+                return True
+            target = next((candidate for candidate in targets if candidate not in tried), None)
+            if target is not None:
+                self.log(f"Эффект не подтвержден, повтор по {target}", "WARNING")
+
+        self.record(False, len(tried))
+        self.log(f"Эффект '{expect.kind}' не подтвержден после {len(tried)} попыток", "WARNING")
+        return False
@@ -0,0 +1,83 @@
+"""
+Бенчмарк захвата экрана: кадры в секунду и мс на захват
+
+Сравнивает текущие пути (pyautogui.screenshot(), ImageGrab.grab()) с бэкендами
+screen_capture на полном экране и на области, а также стоимость перевода
+кадра в PIL изображение.
+
+Использование:
+python bench_capture.py --frames 50 --region 0,0,400,200
+"""
+
+import argparse
+import time
+from typing import Callable, List
+
+from screen_capture import BACKENDS, create_backend
+
+
+def measure(name: str, grab: Callable, frames: int) -> dict:
+    """Замер одного варианта захвата"""
+    grab()  # прогрев (создание сегментов, загрузка библиотек)
+    times: List[float] = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        grab()
+        times.append(time.perf_counter() - start)
+
+    times.sort()
+    total = sum(times)
+    return {
+        "name": name,
+        "fps": frames / total if total else float("inf"),
+        "ms_mean": total / frames * 1000,
+        "ms_p50": times[len(times) // 2] * 1000,
+        "ms_p95": times[max(0, int(len(times) * 0.95) - 1)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк захвата экрана")
+    parser.add_argument("--frames", type=int, default=30, help="Кадров на вариант")
+    parser.add_argument("--region", default="0,0,400,200", help="Область left,top,width,height")
+    args = parser.parse_args()
+    region = tuple(int(v) for v in args.region.split(","))
+
+    cases = []
+
+    # Текущие пути модулей
+    try:
+        import pyautogui
+        cases.append(("pyautogui.screenshot() [ypp_stg]", lambda: pyautogui.screenshot()))
+    except Exception as e:
+        print(f"⚠️ pyautogui недоступен: {e}")
+    try:
+        from PIL import ImageGrab
+        cases.append(("ImageGrab.grab() [ypp_work]", lambda: ImageGrab.grab()))
+    except Exception as e:
+        print(f"⚠️ ImageGrab недоступен: {e}")
+
+    # Бэкенды слоя захвата
+    for name in BACKENDS:
+        try:
+            backend = create_backend(name)
+        except Exception as e:
+            print(f"⚠️ Бэкенд {name} недоступен: {e}")
+            continue
+        cases.append((f"{name}.grab()", lambda b=backend: b.grab()))
+        cases.append((f"{name}.grab(region)", lambda b=backend: b.grab(region)))
+        cases.append((f"{name}.grab().to_pil()", lambda b=backend: b.grab().to_pil()))
+
+    print(f"{'вариант':<36} {'fps':>8} {'мс ср.':>8} {'p50':>8} {'p95':>8}")
+    print("-" * 72)
+    for name, grab in cases:
+        try:
+            r = measure(name, grab, args.frames)
+        except Exception as e:
+            print(f"{name:<36} ошибка: {e}")
+            continue
+        print(f"{r['name']:<36} {r['fps']:>8.1f} {r['ms_mean']:>8.2f} {r['ms_p50']:>8.2f} {r['ms_p95']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
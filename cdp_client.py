@@ -0,0 +1,176 @@
+"""
+Подключение к браузеру по Chrome DevTools Protocol (remote debugging)
+
+SunBrowser основан на Chromium: профиль, запущенный с --remote-debugging-port,
+отдает список вкладок по http://host:port/json и WebSocket для каждой вкладки.
+Соединение живет в фоновом event loop, поэтому им можно пользоваться и из
+синхронного кода (call_sync), и из асинхронного (call).
+
+Если порт недоступен, подключение не повторяется retry_after секунд - поиск
+через DOM быстро уступает место другим способам.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+
+
+class CdpError(RuntimeError):
+    """Ошибка протокола или подключения"""
+
+
+class CdpConnection:
+    """WebSocket соединение с вкладкой браузера"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9222, url_filter: str = None,
+                 timeout: float = 2.0, retry_after: float = 10.0,
+                 log: Callable[[str, str], None] = None):
+        """
+        Args:
+            host, port: Адрес remote debugging профиля
+            url_filter: Подстрока URL нужной вкладки (None - первая вкладка-страница)
+            timeout: Таймаут подключения и одного вызова, с
+            retry_after: Пауза перед повторным подключением после неудачи, с
+            log: Функция логирования вида log(message, level)
+        """
+        self.host = host
+        self.port = port
+        self.url_filter = url_filter
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.log = log or (lambda message, level="INFO": None)
+
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._listeners: Dict[str, List[Callable[[Dict], None]]] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._unavailable_until = 0.0
+        self.target: Optional[Dict] = None
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    # --- фоновый loop ---
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True, name="cdp").start()
+            return self._loop
+
+    def run_sync(self, coro) -> Any:
+        """Выполнение корутины в фоновом loop из синхронного кода"""
+        return asyncio.run_coroutine_threadsafe(coro, self._background_loop()).result()
+
+    async def run(self, coro) -> Any:
+        """Выполнение корутины в фоновом loop из любого другого loop"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._background_loop()))
+
+    # --- подключение ---
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and not self._ws.closed
+
+    async def targets(self) -> List[Dict]:
+        """Вкладки профиля (/json)"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        url = f"http://{self.host}:{self.port}/json"
+        async with self._session.get(url, timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+            return await response.json(content_type=None)
+
+    async def _connect(self):
+        if self.connected:
+            return
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.connected:
+                return
+            if time.monotonic() < self._unavailable_until:
+                raise CdpError(f"DevTools {self.host}:{self.port} недоступен")
+            try:
+                pages = [t for t in await self.targets() if t.get("type") == "page"]
+                if self.url_filter:
+                    pages = [t for t in pages if self.url_filter in t.get("url", "")]
+                if not pages:
+                    raise CdpError("Нет подходящей вкладки")
+                self.target = pages[0]
+                self._ws = await self._session.ws_connect(
+                    self.target["webSocketDebuggerUrl"], timeout=self.timeout, max_msg_size=0)
+            except Exception as e:
+                self._unavailable_until = time.monotonic() + self.retry_after
+                raise CdpError(f"Не удалось подключиться к DevTools {self.host}:{self.port}: {e}") from e
+
+            self._reader = asyncio.get_running_loop().create_task(self._read())
+            self.log(f"DevTools: подключено к '{self.target.get('title', '')}'", "DEBUG")
+
+    async def _read(self):
+        """Разбор входящих сообщений: ответы на вызовы и события"""
+        try:
+            async for message in self._ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = message.json()
+                if "id" in data:
+                    future = self._pending.pop(data["id"], None)
+                    if future and not future.done():
+                        if "error" in data:
+                            future.set_exception(CdpError(data["error"].get("message", str(data["error"]))))
+                        else:
+                            future.set_result(data.get("result", {}))
+                else:
+                    for listener in self._listeners.get(data.get("method"), []):
+                        try:
+                            listener(data.get("params", {}))
+                        except Exception as e:
+                            self.log(f"Ошибка обработчика {data.get('method')}: {e}", "DEBUG")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CdpError("Соединение закрыто"))
+            self._pending.clear()
+            self._ws = None
+
+    def on(self, event: str, callback: Callable[[Dict], None]):
+        """Обработчик события протокола (вызывается в фоновом loop)"""
+        self._listeners.setdefault(event, []).append(callback)
+
+    async def send(self, method: str, params: Dict = None, timeout: float = None) -> Dict:
+        """Вызов метода протокола внутри фонового loop соединения (для корутин, запущенных через run)"""
+        await self._connect()
+        message_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        await self._ws.send_json({"id": message_id, "method": method, "params": params or {}})
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def call(self, method: str, params: Dict = None, timeout: float = None) -> Dict:
+        """Вызов метода протокола (из любого event loop)"""
+        return await self.run(self.send(method, params, timeout))
+
+    def call_sync(self, method: str, params: Dict = None, timeout: float = None) -> Dict:
+        """Вызов метода протокола из синхронного кода"""
+        return self.run_sync(self.send(method, params, timeout))
+
+    async def _close(self):
+        if self._ws is not None:
+            await self._ws.close()
+        if self._session is not None:
+            await self._session.close()
+
+    def close(self):
+        if self._loop is not None:
+            self.run_sync(self._close())
@@ -0,0 +1,176 @@
+"""
+Ввод и снимки страницы через DevTools без фокуса окна
+
+События мыши и клавиатуры уходят прямо во вкладку профиля (Input.dispatch*),
+снимок делается только для страницы (Page.captureScreenshot с clip). Окно не
+нужно активировать, глобальная мышь и клавиатура ОС не используются - на одном
+экране можно параллельно вести несколько профилей.
+
+Координаты:
+    page   - CSS пиксели области просмотра (так работают Input.* и снимки страницы);
+    screen - точки экрана ОС; перевод по положению окна (см. dom_resolver).
+Снимки страницы масштабируются в CSS пиксели: пиксель снимка = точка страницы.
+"""
+
+import base64
+import re
+import time
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+from cdp_client import CdpConnection
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+# Клавиши для Input.dispatchKeyEvent: key -> (code, windowsVirtualKeyCode, text)
+KEYS = {
+    "Return": ("Enter", 13, "\r"),
+    "Enter": ("Enter", 13, "\r"),
+    "Tab": ("Tab", 9, "\t"),
+    "Delete": ("Delete", 46, None),
+    "Backspace": ("Backspace", 8, None),
+    "Escape": ("Escape", 27, None),
+    "ArrowUp": ("ArrowUp", 38, None),
+    "ArrowDown": ("ArrowDown", 40, None),
+    "ArrowLeft": ("ArrowLeft", 37, None),
+    "ArrowRight": ("ArrowRight", 39, None),
+    "PageDown": ("PageDown", 34, None),
+    "PageUp": ("PageUp", 33, None)
+}
+
+# Модификаторы сочетаний вида "Command+A" (битовая маска Input.dispatchKeyEvent)
+MODIFIERS = {"Alt": 1, "Ctrl": 2, "Control": 2, "Command": 4, "Meta": 4, "Shift": 8}
+# Команды редактирования для сочетаний с модификатором (работают на любой ОС)
+EDIT_COMMANDS = {"a": "selectAll", "c": "copy", "v": "paste", "x": "cut", "z": "undo"}
+
+# Положение области просмотра на экране (как в dom_resolver.FIND_ELEMENT_JS)
+WINDOW_METRICS_JS = """
+(function (screenScale) {
+  const zoom = window.devicePixelRatio / screenScale;
+  const border = Math.max(0, (window.outerWidth - window.innerWidth * zoom) / 2);
+  const top = Math.max(0, window.outerHeight - window.innerHeight * zoom - border);
+  return {left: window.screenX + border, top: window.screenY + top, zoom: zoom,
+          width: window.innerWidth, height: window.innerHeight, dpr: window.devicePixelRatio};
+})
+"""
+
+
+class CdpInput:
+    """Клики, клавиатура, навигация, прокрутка и снимки страницы через DevTools"""
+
+    def __init__(self, connection: CdpConnection, screen_scale: float = 1.0, metrics_ttl: float = 1.0):
+        """
+        Args:
+            connection: Соединение с вкладкой профиля
+            screen_scale: Масштаб экрана ОС (для перевода координат экрана в координаты страницы)
+            metrics_ttl: Сколько секунд кэшировать положение окна
+        """
+        self.connection = connection
+        self.screen_scale = screen_scale
+        self.metrics_ttl = metrics_ttl
+        self._metrics: Optional[Dict] = None
+        self._metrics_time = 0.0
+
+    # --- внутренние корутины (выполняются в фоновом loop соединения) ---
+
+    async def _window_metrics(self) -> Dict:
+        if self._metrics is None or time.monotonic() - self._metrics_time > self.metrics_ttl:
+            result = await self.connection.send("Runtime.evaluate", {
+                "expression": f"{WINDOW_METRICS_JS}({self.screen_scale})",
+                "returnByValue": True
+            })
+            self._metrics = result["result"]["value"]
+            self._metrics_time = time.monotonic()
+        return self._metrics
+
+    async def _screen_to_page(self, x: float, y: float) -> Tuple[float, float]:
+        metrics = await self._window_metrics()
+        return ((x - metrics["left"]) / metrics["zoom"], (y - metrics["top"]) / metrics["zoom"])
+
+    async def _click(self, x: float, y: float, screen: bool = False):
+        if screen:
+            x, y = await self._screen_to_page(x, y)
+        base = {"x": x, "y": y, "button": "left", "clickCount": 1}
+        await self.connection.send("Input.dispatchMouseEvent", {"type": "mouseMoved", "x": x, "y": y})
+        await self.connection.send("Input.dispatchMouseEvent", {"type": "mousePressed", **base})
+        await self.connection.send("Input.dispatchMouseEvent", {"type": "mouseReleased", **base})
+
+    async def _type_text(self, text: str):
+        await self.connection.send("Input.insertText", {"text": text})
+
+    async def _press_key(self, key: str):
+        parts = [part for part in re.split(r"[+\s]+", key.strip()) if part]
+        modifiers = sum(MODIFIERS.get(part, 0) for part in parts[:-1])
+        key = parts[-1] if parts else "Return"
+        code, key_code, text = KEYS.get(key, (key, 0, None))
+        if len(key) == 1:
+            code, key_code, text = f"Key{key.upper()}", ord(key.upper()), key.lower()
+        event = {"key": "Enter" if key == "Return" else (key.lower() if len(key) == 1 else key),
+                 "code": code, "modifiers": modifiers,
+                 "windowsVirtualKeyCode": key_code, "nativeVirtualKeyCode": key_code}
+        down = {"type": "keyDown", **event}
+        if modifiers and key.lower() in EDIT_COMMANDS:
+            down["commands"] = [EDIT_COMMANDS[key.lower()]]
+        elif text and not modifiers:
+            down["text"] = text
+        await self.connection.send("Input.dispatchKeyEvent", down)
+        await self.connection.send("Input.dispatchKeyEvent", {"type": "keyUp", **event})
+
+    async def _navigate(self, url: str):
+        await self.connection.send("Page.navigate", {"url": url})
+
+    async def _scroll(self, direction: str = "down", amount: int = 600):
+        metrics = await self._window_metrics()
+        delta = amount if direction == "down" else -amount
+        await self.connection.send("Input.dispatchMouseEvent", {
+            "type": "mouseWheel", "x": metrics["width"] / 2, "y": metrics["height"] / 2,
+            "deltaX": 0, "deltaY": delta
+        })
+
+    async def _screenshot(self, clip: Box = None, image_format: str = "png", quality: int = 80):
+        from PIL import Image
+
+        metrics = await self._window_metrics()
+        left, top, width, height = clip or (0, 0, metrics["width"], metrics["height"])
+        params = {
+            "format": image_format,
+            # scale = 1/dpr: пиксель снимка = CSS пиксель страницы
+            "clip": {"x": left, "y": top, "width": width, "height": height, "scale": 1 / metrics["dpr"]}
+        }
+        if image_format == "jpeg":
+            params["quality"] = quality
+        result = await self.connection.send("Page.captureScreenshot", params, timeout=10)
+        image = Image.open(BytesIO(base64.b64decode(result["data"])))
+        image.load()
+        return image.convert("RGB")
+
+    # --- асинхронный интерфейс (из любого event loop) ---
+
+    async def click(self, x: float, y: float, screen: bool = False):
+        """Клик по точке страницы (screen=True - точка экрана)"""
+        await self.connection.run(self._click(x, y, screen))
+
+    async def type_text(self, text: str):
+        await self.connection.run(self._type_text(text))
+
+    async def press_key(self, key: str):
+        """Клавиша из KEYS, символ или сочетание (например, Command+A)"""
+        await self.connection.run(self._press_key(key))
+
+    async def navigate(self, url: str):
+        await self.connection.run(self._navigate(url))
+
+    async def scroll(self, direction: str = "down", amount: int = 600):
+        await self.connection.run(self._scroll(direction, amount))
+
+    async def screenshot(self, clip: Box = None, image_format: str = "png"):
+        """Снимок страницы (или области clip в CSS пикселях) -> PIL изображение"""
+        return await self.connection.run(self._screenshot(clip, image_format))
+
+    # --- синхронный интерфейс ---
+
+    def click_sync(self, x: float, y: float, screen: bool = False):
+        self.connection.run_sync(self._click(x, y, screen))
+
+    def screenshot_sync(self, clip: Box = None, image_format: str = "png"):
+        return self.connection.run_sync(self._screenshot(clip, image_format))
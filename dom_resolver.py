@@ -0,0 +1,182 @@
+"""
+Поиск элементов страницы через DOM (CDP) вместо скриншотов, OCR и vision
+
+Элемент ищется по CSS селектору, роли (явной role или неявной по тегу) и
+тексту (видимый текст, aria-label, value, title, placeholder). Из найденных
+видимых элементов берется самый маленький (самый "внутренний" кликабельный).
+Прямоугольник элемента переводится в координаты экрана по положению окна:
+
+    zoom   = devicePixelRatio / screen_scale   (масштаб страницы)
+    border = (outerWidth - innerWidth * zoom) / 2
+    top    = outerHeight - innerHeight * zoom - border   (вкладки, адресная строка)
+    x      = screenX + border + rect.x * zoom
+
+Координаты - в точках экрана (как у pyautogui / osascript). Поиск занимает
+миллисекунды и не стоит токенов; если DOM недоступен, вызывающий код
+переходит к OCR и vision.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from cdp_client import CdpConnection
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+# Функция страницы: поиск элемента и его прямоугольник на экране
+FIND_ELEMENT_JS = r"""
+(function (q) {
+  const implicitRole = (el) => {
+    const tag = el.tagName;
+    if (tag === 'BUTTON') return 'button';
+    if (tag === 'A') return el.hasAttribute('href') ? 'link' : '';
+    if (tag === 'TEXTAREA') return 'textbox';
+    if (tag === 'SELECT') return 'combobox';
+    if (tag === 'INPUT') {
+      const type = (el.type || 'text').toLowerCase();
+      if (['button', 'submit', 'reset', 'image'].includes(type)) return 'button';
+      if (type === 'checkbox' || type === 'radio') return type;
+      return 'textbox';
+    }
+    return '';
+  };
+  const roleOf = (el) => el.getAttribute('role') || implicitRole(el);
+  const nameOf = (el) => (el.getAttribute('aria-label') || el.innerText || el.value ||
+                          el.getAttribute('title') || el.getAttribute('placeholder') || '').trim();
+  const visible = (el) => {
+    const r = el.getBoundingClientRect();
+    if (r.width < 1 || r.height < 1) return false;
+    if (r.bottom <= 0 || r.right <= 0 || r.top >= innerHeight || r.left >= innerWidth) return false;
+    const s = getComputedStyle(el);
+    return s.visibility !== 'hidden' && s.display !== 'none' && parseFloat(s.opacity) > 0;
+  };
+
+  const pool = q.selector ? q.selector
+    : (q.role ? '*' : 'button,a,input,textarea,select,[role],[onclick],[tabindex]');
+  let els = Array.from(document.querySelectorAll(pool));
+  if (q.role) els = els.filter((el) => roleOf(el) === q.role);
+  const texts = (q.texts || []).map((t) => t.toLowerCase());
+  if (texts.length) {
+    els = els.filter((el) => {
+      const name = nameOf(el).toLowerCase();
+      return texts.some((t) => (q.exact ? name === t : name.includes(t)));
+    });
+  }
+  els = els.filter(visible);
+  if (!els.length) return null;
+
+  const area = (el) => { const r = el.getBoundingClientRect(); return r.width * r.height; };
+  els.sort((a, b) => area(a) - area(b));
+  const el = els[0];
+  const r = el.getBoundingClientRect();
+
+  const zoom = window.devicePixelRatio / q.screenScale;
+  const border = Math.max(0, (window.outerWidth - window.innerWidth * zoom) / 2);
+  const top = Math.max(0, window.outerHeight - window.innerHeight * zoom - border);
+  return {
+    left: window.screenX + border + r.left * zoom,
+    top: window.screenY + top + r.top * zoom,
+    width: r.width * zoom,
+    height: r.height * zoom,
+    page: [r.left, r.top, r.width, r.height],
+    text: nameOf(el).slice(0, 80),
+    tag: el.tagName.toLowerCase(),
+    role: roleOf(el),
+    matches: els.length
+  };
+})
+"""
+
+
+@dataclass
+class DomElement:
+    """Найденный элемент (координаты экрана в точках)"""
+    box: Box
+    text: str
+    tag: str
+    role: str
+    matches: int  # сколько видимых элементов подошло под запрос
+    page_box: Box = None  # в CSS пикселях области просмотра (для ввода через DevTools)
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        left, top, width, height = self.box
+        return (left + width // 2, top + height // 2)
+
+    @property
+    def page_center(self) -> Tuple[int, int]:
+        left, top, width, height = self.page_box
+        return (left + width // 2, top + height // 2)
+
+
+class DomResolver:
+    """Поиск элементов по селектору, роли и тексту через DevTools"""
+
+    def __init__(self, connection: CdpConnection, screen_scale: float = 1.0,
+                 offset: Tuple[int, int] = (0, 0), log: Callable[[str, str], None] = None):
+        """
+        Args:
+            connection: Соединение с вкладкой
+            screen_scale: Масштаб экрана ОС (devicePixelRatio при 100% масштабе страницы; 2.0 для Retina)
+            offset: Поправка координат (x, y), если расчет положения окна неточен
+            log: Функция логирования вида log(message, level)
+        """
+        self.connection = connection
+        self.screen_scale = screen_scale
+        self.offset = offset
+        self.log = log or (lambda message, level="INFO": None)
+        self.stats = {"found": 0, "missed": 0, "errors": 0}
+
+    def _expression(self, selector: str, role: str, texts: Sequence[str], exact: bool) -> str:
+        query = {"selector": selector, "role": role, "texts": list(texts or []),
+                 "exact": exact, "screenScale": self.screen_scale}
+        return f"{FIND_ELEMENT_JS}({json.dumps(query)})"
+
+    def _element(self, result: Dict, query: str) -> Optional[DomElement]:
+        value = result.get("result", {}).get("value")
+        if result.get("exceptionDetails"):
+            self.stats["errors"] += 1
+            self.log(f"DOM: ошибка скрипта для {query}", "DEBUG")
+            return None
+        if not value:
+            self.stats["missed"] += 1
+            return None
+
+        self.stats["found"] += 1
+        box = (int(value["left"]) + self.offset[0], int(value["top"]) + self.offset[1],
+               int(value["width"]), int(value["height"]))
+        element = DomElement(box, value["text"], value["tag"], value["role"], value["matches"],
+                             tuple(int(v) for v in value["page"]))
+        self.log(f"DOM: {query} -> <{element.tag}> '{element.text}' {element.center}", "DEBUG")
+        return element
+
+    def find(self, selector: str = None, role: str = None, texts: Sequence[str] = (),
+             exact: bool = False) -> Optional[DomElement]:
+        """Синхронный поиск элемента; None - не найден или DevTools недоступен"""
+        query = selector or f"{role or '*'} {list(texts)}"
+        try:
+            result = self.connection.call_sync("Runtime.evaluate", {
+                "expression": self._expression(selector, role, texts, exact),
+                "returnByValue": True
+            })
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.log(f"DOM недоступен: {e}", "DEBUG")
+            return None
+        return self._element(result, query)
+
+    async def find_async(self, selector: str = None, role: str = None, texts: Sequence[str] = (),
+                         exact: bool = False) -> Optional[DomElement]:
+        """Асинхронный поиск элемента"""
+        query = selector or f"{role or '*'} {list(texts)}"
+        try:
+            result = await self.connection.call("Runtime.evaluate", {
+                "expression": self._expression(selector, role, texts, exact),
+                "returnByValue": True
+            })
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.log(f"DOM недоступен: {e}", "DEBUG")
+            return None
+        return self._element(result, query)
@@ -0,0 +1,210 @@
+"""
+Общий кадр экрана для всех резолверов шага
+
+Вместо того чтобы каждый поиск (ожидание изменения страницы, OCR по каждой
+фразе, AI vision, OCR + AI) делал свой скриншот неизменного экрана, все они
+берут кадр у FrameProvider. Кадр живет ttl секунд и сбрасывается явно после
+любого ввода (клик, клавиатура). К кадру лениво считаются и кэшируются
+производные: уменьшенная копия, серая копия, хэш и OCR индекс.
+
+Счетчики захватов ведутся по шагам (begin_step / end_step).
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from screen_capture import grab_image
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+
+class SharedFrame:
+    """Кадр экрана с кэшем производных артефактов"""
+
+    def __init__(self, image, timestamp: float = None, seq: int = 0):
+        self.image = image  # PIL изображение RGB
+        self.timestamp = timestamp if timestamp is not None else time.monotonic()
+        self.seq = seq
+        self._derived: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.image.size
+
+    def age(self) -> float:
+        return time.monotonic() - self.timestamp
+
+    def derived(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Артефакт кадра: считается один раз, параллельные вызовы ждут результата"""
+        with self._lock:
+            if key in self._derived:
+                return self._derived[key]
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key not in self._derived:
+                self._derived[key] = compute()
+            return self._derived[key]
+
+    def downscaled(self, max_side: int = 1024):
+        """Уменьшенная копия (по большей стороне)"""
+        def compute():
+            image = self.image.copy()
+            image.thumbnail((max_side, max_side))
+            return image
+        return self.derived(f"downscaled:{max_side}", compute)
+
+    def gray(self, size: Tuple[int, int] = (96, 60)):
+        """Маленькая серая копия для быстрых сравнений кадров"""
+        return self.derived(f"gray:{size[0]}x{size[1]}",
+                            lambda: self.image.convert("L").resize(size))
+
+    def dhash(self, size: int = 8) -> int:
+        """Разностный хэш (dHash) кадра: size*size бит (по умолчанию 64)"""
+        def compute():
+            small = list(self.image.convert("L").resize((size + 1, size)).getdata())
+            value = 0
+            for row in range(size):
+                for col in range(size):
+                    left = small[row * (size + 1) + col]
+                    right = small[row * (size + 1) + col + 1]
+                    value = (value << 1) | (1 if left > right else 0)
+            return value
+        return self.derived(f"dhash:{size}", compute)
+
+    def ocr(self) -> Dict:
+        """Сырые данные pytesseract.image_to_data для всего кадра"""
+        def compute():
+            import pytesseract
+            return pytesseract.image_to_data(self.image, output_type=pytesseract.Output.DICT)
+        return self.derived("ocr", compute)
+
+    def ocr_words(self) -> List[Tuple[str, int, Box]]:
+        """OCR индекс: непустые слова (текст, уверенность, бокс)"""
+        def compute():
+            data = self.ocr()
+            words = []
+            for i, text in enumerate(data['text']):
+                if text.strip():
+                    box = (data['left'][i], data['top'][i], data['width'][i], data['height'][i])
+                    words.append((text, int(float(data['conf'][i])), box))
+            return words
+        return self.derived("ocr_words", compute)
+
+
+def hamming(hash_a: int, hash_b: int) -> int:
+    """Расстояние Хэмминга между двумя хэшами"""
+    return bin(hash_a ^ hash_b).count("1")
+
+
+def frame_diff(frame_a: SharedFrame, frame_b: SharedFrame) -> float:
+    """Средняя разница маленьких серых копий двух кадров (0-255)"""
+    from PIL import ImageChops, ImageStat
+    return ImageStat.Stat(ImageChops.difference(frame_a.gray(), frame_b.gray())).mean[0]
+
+
+class FrameProvider:
+    """Кэш кадра экрана с TTL, сбросом после ввода и счетчиками захватов"""
+
+    def __init__(self, ttl: float = 1.0, grab: Callable[[], Any] = None,
+                 log: Callable[[str, str], None] = None,
+                 on_capture: Callable[[SharedFrame], None] = None):
+        """
+        Args:
+            ttl: Сколько секунд кадр считается свежим
+            grab: Функция захвата экрана (по умолчанию screen_capture.grab_image)
+            log: Функция логирования вида log(message, level)
+            on_capture: Вызывается с каждым новым кадром (например, самописец лога)
+        """
+        self.ttl = ttl
+        self.grab = grab or grab_image
+        self.log = log or (lambda message, level="INFO": None)
+        self.on_capture = on_capture
+        self.current: Optional[SharedFrame] = None
+        self.seq = 0
+        self.lock = threading.Lock()
+
+        self.step_name: Optional[str] = None
+        self.step_metrics = self._empty_metrics()
+        self.history: List[Dict] = []
+
+    @staticmethod
+    def _empty_metrics() -> Dict:
+        return {"captures": 0, "hits": 0, "invalidations": 0, "injected": 0}
+
+    def _capture(self) -> SharedFrame:
+        image = self.grab()
+        self.seq += 1
+        self.step_metrics["captures"] += 1
+        if isinstance(image, SharedFrame):
+            # Захват уже вернул кадр (например, кольца кадров) - метка времени захвата сохраняется
+            frame, frame.seq = image, self.seq
+        else:
+            frame = SharedFrame(image, time.monotonic(), self.seq)
+        if self.on_capture:
+            self.on_capture(frame)
+        return frame
+
+    def get(self, max_age: float = None) -> SharedFrame:
+        """Кадр не старше max_age (по умолчанию ttl); иначе новый захват"""
+        max_age = self.ttl if max_age is None else max_age
+        with self.lock:
+            if self.current is not None and self.current.age() <= max_age:
+                self.step_metrics["hits"] += 1
+                return self.current
+            self.current = self._capture()
+            return self.current
+
+    def fresh(self) -> SharedFrame:
+        """Всегда новый захват; он же становится общим кадром"""
+        with self.lock:
+            self.current = self._capture()
+            return self.current
+
+    def peek(self, max_age: float = None) -> Optional[SharedFrame]:
+        """Текущий кадр, если он свежий, без захвата"""
+        max_age = self.ttl if max_age is None else max_age
+        with self.lock:
+            if self.current is not None and self.current.age() <= max_age:
+                return self.current
+            return None
+
+    def put(self, frame: SharedFrame):
+        """Подстановка уже снятого кадра (например, предзагруженного)"""
+        with self.lock:
+            self.current = frame
+            self.step_metrics["injected"] += 1
+
+    def invalidate(self, reason: str = "input"):
+        """Сброс кадра - вызывать после любого ввода"""
+        with self.lock:
+            if self.current is not None:
+                self.current = None
+                self.step_metrics["invalidations"] += 1
+                self.log(f"Кадр сброшен ({reason})", "DEBUG")
+
+    def begin_step(self, name: str):
+        """Начало шага: обнуляем счетчики"""
+        with self.lock:
+            self.step_name = name
+            self.step_metrics = self._empty_metrics()
+
+    def end_step(self) -> Dict:
+        """Конец шага: счетчики шага попадают в историю"""
+        with self.lock:
+            metrics = {"step": self.step_name, **self.step_metrics}
+            self.history.append(metrics)
+            self.step_name = None
+            self.step_metrics = self._empty_metrics()
+        return metrics
+
+    def summary(self) -> Dict:
+        """Итог по всем шагам"""
+        totals = self._empty_metrics()
+        for metrics in self.history:
+            for key in totals:
+                totals[key] += metrics[key]
+        return {"steps": len(self.history), **totals}
@@ -0,0 +1,426 @@
+"""
+Кольцевой буфер кадров в разделяемой памяти: процесс захвата и процессы резолверов
+
+Тяжелые резолверы (OCR, поиск шаблона) лучше выполнять в пуле процессов, но
+передача PIL скриншота в процесс - это pickle десятков мегабайт на кадр. Здесь
+кадры живут в multiprocessing.shared_memory:
+
+    - процесс захвата пишет кадры в кольцо слотов (по запросу и/или с периодом
+      interval), у каждого слота - номер кадра (seq), метка time.monotonic()
+      захвата и размер;
+    - процессы пула подключаются к тому же блоку памяти и читают кадр как
+      NumPy view без копий; в задачу передаются только номер слота и seq;
+    - на время задачи слот закреплен счетчиком ссылок: процесс захвата
+      пропускает закрепленные слоты и пишет в самый старый свободный (если
+      свободных нет, кадр пропускается). Слот, перезаписанный до закрепления,
+      обнаруживается по seq - тогда резолвер считается локально.
+
+Метаданные слотов меняются под общим multiprocessing.Lock (наследуется
+процессами при запуске), сами пиксели копируются без блокировки: в слот,
+который пишется, никто не может закрепиться (seq слота = -1).
+
+Основной процесс получает кадр как RingSharedFrame: это SharedFrame (PIL копия
+для кода, работающего в процессе - копия в памяти, без сериализации), у которого
+OCR и поиск шаблона уходят в пул.
+
+Использование:
+    service = FrameRingService(slots=8, workers=4)
+    frame = service.shared_frame()     # кадр, снятый после вызова
+    words = frame.ocr()                # pytesseract в процессе пула
+    box = frame.match_template("btn.png", [0.8, 0.6])
+    service.close()
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from frame_provider import SharedFrame
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+# Заголовок: общий счетчик запросов/ответов захвата и метаданные слотов
+HEADER_DTYPE = np.dtype([("latest_seq", "<i8"), ("latest_slot", "<i4"), ("dropped", "<i4"),
+                         ("requested", "<i8"), ("served", "<i8")])
+SLOT_DTYPE = np.dtype([("seq", "<i8"), ("timestamp", "<f8"), ("width", "<i4"), ("height", "<i4"),
+                       ("refs", "<i4"), ("reserved", "<i4")])
+CHANNELS = 3
+
+
+@dataclass
+class RingHandle:
+    """Все, что нужно процессу для подключения к кольцу (передается при запуске процесса)"""
+    name: str
+    slots: int
+    max_width: int
+    max_height: int
+    lock: Any  # multiprocessing.Lock
+
+
+class FrameRing:
+    """Кольцо слотов кадров RGB в одном блоке разделяемой памяти"""
+
+    def __init__(self, handle: RingHandle, create: bool = False):
+        self.handle = handle
+        self.lock = handle.lock
+        self.slot_bytes = handle.max_width * handle.max_height * CHANNELS
+        self.header_bytes = HEADER_DTYPE.itemsize + SLOT_DTYPE.itemsize * handle.slots
+        size = self.header_bytes + self.slot_bytes * handle.slots
+        self.memory = shared_memory.SharedMemory(name=handle.name, create=create, size=size if create else 0)
+        buffer = self.memory.buf
+        self.header = np.ndarray((1,), HEADER_DTYPE, buffer, 0)
+        self.meta = np.ndarray((handle.slots,), SLOT_DTYPE, buffer, HEADER_DTYPE.itemsize)
+        self.pixels = np.ndarray((handle.slots, self.slot_bytes), np.uint8, buffer, self.header_bytes)
+        if create:
+            self.header[:] = 0
+            self.meta[:] = 0
+            self.header["latest_slot"] = -1
+
+    @classmethod
+    def create(cls, slots: int = 8, max_size: Tuple[int, int] = (3840, 2400),
+               context=None) -> "FrameRing":
+        """Новое кольцо (владелец - вызывающий процесс, он же вызывает unlink)"""
+        context = context or multiprocessing.get_context("spawn")
+        name = f"frame_ring_{os.getpid()}_{time.monotonic_ns() % 10 ** 9}"
+        return cls(RingHandle(name, slots, max_size[0], max_size[1], context.Lock()), create=True)
+
+    # --- запись (процесс захвата) ---
+
+    def write(self, array: np.ndarray, timestamp: float = None) -> Optional[int]:
+        """
+        Кадр HxWx3 uint8 (RGB) в самый старый незакрепленный слот
+
+        Returns:
+            seq записанного кадра или None (кадр больше слота или все слоты закреплены)
+        """
+        height, width = array.shape[:2]
+        if width > self.handle.max_width or height > self.handle.max_height:
+            return None
+        with self.lock:
+            free = [index for index in range(self.handle.slots)
+                    if self.meta[index]["refs"] == 0 and index != self.header[0]["latest_slot"]]
+            if not free:
+                self.header["dropped"] += 1
+                return None
+            slot = min(free, key=lambda index: self.meta[index]["seq"])
+            self.meta[slot]["seq"] = -1  # пишется: закрепить нельзя
+            seq = int(self.header[0]["latest_seq"]) + 1
+
+        count = width * height * CHANNELS
+        self.pixels[slot, :count].reshape(height, width, CHANNELS)[:] = array[..., :CHANNELS]
+
+        with self.lock:
+            self.meta[slot]["timestamp"] = time.monotonic() if timestamp is None else timestamp
+            self.meta[slot]["width"] = width
+            self.meta[slot]["height"] = height
+            self.meta[slot]["seq"] = seq
+            self.header["latest_seq"] = seq
+            self.header["latest_slot"] = slot
+        return seq
+
+    # --- чтение ---
+
+    def pin(self, seq: int = None, newer_than: float = None) -> Optional["RingFrame"]:
+        """
+        Закрепление кадра: seq - конкретный кадр, иначе последний (не старше newer_than)
+
+        Returns:
+            RingFrame (освободить через release) или None, если кадра нет или он уже перезаписан
+        """
+        with self.lock:
+            if seq is None:
+                slot = int(self.header[0]["latest_slot"])
+                if slot < 0:
+                    return None
+            else:
+                matches = np.nonzero(self.meta["seq"] == seq)[0]
+                if not len(matches):
+                    return None
+                slot = int(matches[0])
+            meta = self.meta[slot]
+            if meta["seq"] <= 0 or (newer_than is not None and meta["timestamp"] < newer_than):
+                return None
+            meta["refs"] += 1
+            return RingFrame(self, slot, int(meta["seq"]), float(meta["timestamp"]),
+                             int(meta["width"]), int(meta["height"]))
+
+    def release(self, slot: int):
+        with self.lock:
+            if self.meta[slot]["refs"] > 0:
+                self.meta[slot]["refs"] -= 1
+
+    def array(self, slot: int, seq: int) -> np.ndarray:
+        """NumPy view кадра без копии (только пока слот закреплен); ValueError - слот перезаписан"""
+        meta = self.meta[slot]
+        if int(meta["seq"]) != seq:
+            raise ValueError(f"кадр {seq} в слоте {slot} уже перезаписан")
+        width, height = int(meta["width"]), int(meta["height"])
+        view = self.pixels[slot, :width * height * CHANNELS].reshape(height, width, CHANNELS)
+        view.flags.writeable = False
+        return view
+
+    # --- захват по запросу ---
+
+    def request(self) -> int:
+        """Запрос нового кадра у процесса захвата; возвращает номер запроса"""
+        with self.lock:
+            self.header["requested"] += 1
+            return int(self.header[0]["requested"])
+
+    def pending_request(self) -> int:
+        """Номер последнего необслуженного запроса (0 - запросов нет)"""
+        with self.lock:
+            requested = int(self.header[0]["requested"])
+            return requested if requested > self.header[0]["served"] else 0
+
+    def mark_served(self, request: int):
+        """Запросы до request включительно обслужены (кадр снят после них)"""
+        with self.lock:
+            self.header["served"] = max(int(self.header[0]["served"]), request)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {"latest_seq": int(self.header[0]["latest_seq"]), "dropped": int(self.header[0]["dropped"]),
+                    "pinned": int((self.meta["refs"] > 0).sum())}
+
+    def close(self):
+        # Views на буфер должны умереть до закрытия памяти
+        self.header = self.meta = self.pixels = None
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+@dataclass
+class RingFrame:
+    """Закрепленный кадр кольца"""
+    ring: FrameRing
+    slot: int
+    seq: int
+    timestamp: float
+    width: int
+    height: int
+    released: bool = False
+
+    @property
+    def array(self) -> np.ndarray:
+        return self.ring.array(self.slot, self.seq)
+
+    def to_pil(self):
+        """PIL копия кадра (для кода, работающего в этом процессе)"""
+        from PIL import Image
+        return Image.fromarray(np.array(self.array))
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.ring.release(self.slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# --- процесс захвата ---
+
+def _capture_main(handle: RingHandle, interval: Optional[float], stop, backend, poll: float = 0.002):
+    """Захват по запросу (request) и/или раз в interval секунд"""
+    from screen_capture import create_backend
+
+    ring = FrameRing(handle)
+    capture = backend() if callable(backend) else create_backend(backend)
+    last = 0.0
+    try:
+        while not stop.is_set():
+            requested = ring.pending_request()
+            if requested or (interval and time.monotonic() - last >= interval):
+                frame = capture.grab()
+                ring.write(frame.rgb(), frame.timestamp)
+                last = frame.timestamp
+                if requested:
+                    ring.mark_served(requested)
+            else:
+                time.sleep(poll)
+    finally:
+        capture.close()
+        ring.close()
+
+
+# --- процессы пула ---
+
+_worker_ring: Optional[FrameRing] = None
+
+
+def _attach(handle: RingHandle):
+    global _worker_ring
+    _worker_ring = FrameRing(handle)
+
+
+def _frame_array(slot: int, seq: int) -> np.ndarray:
+    return _worker_ring.array(slot, seq)
+
+
+def ocr_task(slot: int, seq: int) -> Dict:
+    """pytesseract.image_to_data по кадру кольца"""
+    import pytesseract
+    from PIL import Image
+
+    image = Image.fromarray(_frame_array(slot, seq))
+    try:
+        return pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        # Исключения pytesseract не переживают pickle и ломают весь пул
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+def template_task(slot: int, seq: int, template_path: str, confidence_levels: Sequence[float]) -> Optional[Box]:
+    return match_template_array(_frame_array(slot, seq), template_path, confidence_levels)
+
+
+def match_template_array(array: np.ndarray, template_path: str, confidence_levels: Sequence[float]) -> Optional[Box]:
+    """Поиск шаблона (нормированная корреляция OpenCV, как pyautogui.locate с confidence)"""
+    import cv2
+
+    haystack = cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+    needle = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
+    if needle is None or needle.shape[0] > haystack.shape[0] or needle.shape[1] > haystack.shape[1]:
+        return None
+    scores = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+    _, best, _, (left, top) = cv2.minMaxLoc(scores)
+    if best >= min(confidence_levels):
+        return (int(left), int(top), int(needle.shape[1]), int(needle.shape[0]))
+    return None
+
+
+class FrameRingService:
+    """Кольцо кадров + процесс захвата + пул процессов резолверов"""
+
+    def __init__(self, slots: int = 8, max_size: Tuple[int, int] = None, workers: int = None,
+                 interval: float = None, backend: Union[str, Callable] = "auto", log: Callable[[str, str], None] = None):
+        """
+        Args:
+            slots: Слотов в кольце (кадр живет, пока не будет снято столько новых кадров)
+            max_size: Максимальный размер кадра (по умолчанию - размер экрана)
+            workers: Процессов пула (None - по числу ядер)
+            interval: Фоновый захват раз в interval секунд (None - только по запросу)
+            backend: Бэкенд screen_capture процесса захвата - имя или фабрика (функция модуля,
+                вызывается в процессе захвата; например, functools.partial(SimScreen, "yupp_chat"))
+            log: Функция логирования вида log(message, level)
+        """
+        self.log = log or (lambda message, level="INFO": None)
+        context = multiprocessing.get_context("spawn")
+        if max_size is None:
+            from screen_capture import get_capture
+            max_size = get_capture().screen_size()
+        self.ring = FrameRing.create(slots, max_size, context)
+        self._stop = context.Event()
+        self.process = context.Process(target=_capture_main, name="frame-capture", daemon=True,
+                                       args=(self.ring.handle, interval, self._stop, backend))
+        self.process.start()
+        self._context = context
+        self._workers = workers
+        self.pool = self._new_pool()
+        self.stats = {"frames": 0, "tasks": 0, "local": 0, "timeouts": 0}
+        self.log(f"Кольцо кадров {self.ring.handle.name}: {slots} слотов до {max_size[0]}x{max_size[1]}, "
+                 f"пул {self.pool._max_workers} процессов", "DEBUG")
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self._workers, mp_context=self._context, initializer=_attach,
+                                   initargs=(self.ring.handle,))
+
+    def restart_pool(self):
+        """Новый пул вместо сломанного (процесс пула упал)"""
+        self.log("Пул резолверов кольца кадров сломан, перезапуск", "WARNING")
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = self._new_pool()
+
+    def latest(self, newer_than: float = None, timeout: float = 2.0) -> Optional[RingFrame]:
+        """Закрепленный кадр, снятый не раньше newer_than (по умолчанию - момента вызова)"""
+        newer_than = time.monotonic() if newer_than is None else newer_than
+        self.ring.request()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            frame = self.ring.pin(newer_than=newer_than)
+            if frame:
+                self.stats["frames"] += 1
+                return frame
+            time.sleep(0.002)
+        self.stats["timeouts"] += 1
+        return None
+
+    def shared_frame(self, newer_than: float = None, timeout: float = 2.0) -> Optional["RingSharedFrame"]:
+        """Новый кадр для FrameProvider (PIL копия + ссылка на слот для задач пула)"""
+        frame = self.latest(newer_than, timeout)
+        if frame is None:
+            return None
+        with frame:
+            return RingSharedFrame(frame.to_pil(), self, frame)
+
+    def submit(self, task: Callable, frame: RingFrame, *args) -> Optional[Future]:
+        """Задача пула над кадром: слот закреплен до ее завершения (None - кадр уже перезаписан)"""
+        pinned = self.ring.pin(seq=frame.seq)
+        if pinned is None:
+            return None
+        try:
+            future = self.pool.submit(task, pinned.slot, pinned.seq, *args)
+        except BrokenProcessPool:
+            self.restart_pool()
+            future = self.pool.submit(task, pinned.slot, pinned.seq, *args)
+        future.add_done_callback(lambda _: pinned.release())
+        self.stats["tasks"] += 1
+        return future
+
+    def close(self):
+        self._stop.set()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.close()
+        try:
+            self.ring.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class RingSharedFrame(SharedFrame):
+    """SharedFrame кадра кольца: OCR и поиск шаблона считаются в пуле процессов"""
+
+    def __init__(self, image, service: FrameRingService, frame: RingFrame):
+        super().__init__(image, frame.timestamp, frame.seq)
+        self.service = service
+        self.ring_frame = frame
+
+    def _remote(self, task: Callable, *args, local: Callable[[], Any] = None) -> Any:
+        future = self.service.submit(task, self.ring_frame, *args)
+        if future is not None:
+            try:
+                return future.result()
+            except ValueError:
+                pass  # слот перезаписан до начала задачи
+            except BrokenProcessPool:
+                self.service.restart_pool()
+        self.service.stats["local"] += 1
+        return local() if local else None
+
+    def ocr(self) -> Dict:
+        def local():
+            import pytesseract
+            return pytesseract.image_to_data(self.image, output_type=pytesseract.Output.DICT)
+        return self.derived("ocr", lambda: self._remote(ocr_task, local=local))
+
+    def match_template(self, template_path: str, confidence_levels: Sequence[float]) -> Optional[Box]:
+        """Бокс шаблона на кадре (лучшее совпадение не ниже минимального confidence)"""
+        return self.derived(f"template:{template_path}:{min(confidence_levels)}", lambda: self._remote(
+            template_task, template_path, list(confidence_levels),
+            local=lambda: match_template_array(np.asarray(self.image), template_path, confidence_levels)))
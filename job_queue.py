@@ -0,0 +1,556 @@
+"""
+Очередь заданий в SQLite и пул исполнителей для многих аккаунтов и скриптов
+
+Задание - скрипт (ypp_work, ypp_stg или свой обработчик) для аккаунта (профиля
+браузера) с параметрами. Очередь переживает перезапуски: все состояние в одном
+файле SQLite (режим WAL), захват задания - одна транзакция.
+
+Правила выдачи заданий:
+    - приоритет (больше - раньше), затем время готовности и порядок постановки;
+    - окно времени "HH:MM-HH:MM" (местное время, через полночь - тоже);
+    - на аккаунт одновременно не больше одного задания (один профиль браузера);
+    - пауза аккаунта (cooldown) после завершения его задания;
+    - дневная квота заданий на аккаунт (считаются задания, начатые сегодня);
+    - повторы при ошибке: до max_attempts с экспоненциальной паузой backoff * 2^(n-1).
+
+Исполнитель берет задание в аренду (lease) и продлевает ее heartbeat'ом, пока
+обработчик работает. Если процесс упал, аренда истекает и задание снова
+попадает в очередь (продолжение скрипта - по журналу run_journal). Если аренда
+потеряна при живом обработчике (задание могло уйти другому исполнителю), у
+задания ставится флаг отмены: обработчик прекращает ввод, а его результат не
+записывается.
+
+Мышь и клавиатура в процессе одни: ypp_stg и ypp_work с вводом через ОС
+(input_backend не "cdp") выполняются по одному - ypp_stg только при --workers 1,
+ypp_work с вводом через ОС ждут общей блокировки ввода.
+
+Метрики: задания по состояниям, пропускная способность, ожидание в очереди и
+время выполнения (p50/p95) по типам заданий.
+
+Использование:
+python job_queue.py account acc1 --cooldown 3600 --quota 5
+python job_queue.py submit ypp_work --account acc1 --payload '{"commands": ["Открой yupp.ai"]}' --window 09:00-23:00
+python job_queue.py run --workers 4 --kinds ypp_work --batch-window 0.05
+python job_queue.py run --workers 1 --kinds ypp_stg
+python job_queue.py metrics --hours 24
+"""
+
+import argparse
+import functools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from vision_ledger import percentile
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    account TEXT,
+    payload TEXT NOT NULL DEFAULT '{}',
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'queued',  -- queued, leased, done, dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    backoff REAL NOT NULL DEFAULT 60,
+    run_after REAL NOT NULL,
+    window TEXT,
+    created REAL NOT NULL,
+    first_leased REAL,
+    leased REAL,
+    lease_until REAL,
+    worker TEXT,
+    finished REAL,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, priority DESC, run_after, id);
+CREATE INDEX IF NOT EXISTS jobs_account ON jobs (account, state);
+CREATE TABLE IF NOT EXISTS accounts (
+    account TEXT PRIMARY KEY,
+    cooldown REAL NOT NULL DEFAULT 0,
+    daily_quota INTEGER,
+    last_finished REAL
+);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    account: Optional[str]
+    payload: Dict
+    priority: int
+    attempts: int
+    max_attempts: int
+    worker: str
+    # Ставится при потере аренды: обработчик должен прекратить работу
+    cancel: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+
+
+def in_window(window: Optional[str], now: datetime) -> bool:
+    """Попадает ли время в окно "HH:MM-HH:MM" (окно через полночь - 22:00-06:00)"""
+    if not window:
+        return True
+    start, end = window.split("-")
+    current = now.strftime("%H:%M")
+    start, end = start.strip().zfill(5), end.strip().zfill(5)
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def day_start(now: float) -> float:
+    return datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+class JobQueue:
+    """Очередь заданий в SQLite (безопасна для потоков и нескольких процессов)"""
+
+    def __init__(self, path: str = "jobs.db", lease_seconds: float = 120.0,
+                 log: Callable[[str, str], None] = None):
+        """
+        Args:
+            path: Файл базы
+            lease_seconds: Срок аренды задания без heartbeat, с
+            log: Функция логирования вида log(message, level)
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.log = log or (lambda message, level="INFO": None)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def _transaction(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Запись под BEGIN IMMEDIATE: захват задания атомарен и между процессами"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    # --- постановка и настройки ---
+
+    def submit(self, kind: str, account: str = None, payload: Dict = None, priority: int = 0,
+               max_attempts: int = 3, backoff: float = 60.0, run_after: float = None,
+               window: str = None) -> int:
+        """
+        Новое задание
+
+        Args:
+            kind: Тип задания (ключ обработчика)
+            account: Аккаунт/профиль (None - без ограничений аккаунта)
+            payload: Параметры обработчика
+            priority: Больше - раньше
+            max_attempts: Попыток всего (включая первую)
+            backoff: Пауза перед первым повтором, с (дальше удваивается)
+            run_after: Не раньше этого времени (unix time)
+            window: Окно времени "HH:MM-HH:MM"
+        """
+        now = time.time()
+        return self._transaction(lambda db: db.execute(
+            "INSERT INTO jobs (kind, account, payload, priority, max_attempts, backoff, run_after, window, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, account, json.dumps(payload or {}, ensure_ascii=False), priority, max_attempts, backoff,
+             run_after or now, window, now)).lastrowid)
+
+    def set_account(self, account: str, cooldown: float = 0.0, daily_quota: int = None):
+        """Пауза после задания аккаунта, с, и дневная квота (None - без квоты)"""
+        self._transaction(lambda db: db.execute(
+            "INSERT INTO accounts (account, cooldown, daily_quota) VALUES (?, ?, ?) "
+            "ON CONFLICT(account) DO UPDATE SET cooldown = excluded.cooldown, daily_quota = excluded.daily_quota",
+            (account, cooldown, daily_quota)))
+
+    def cancel(self, job_id: int) -> bool:
+        return self._transaction(lambda db: db.execute(
+            "UPDATE jobs SET state = 'dead', error = 'cancelled', finished = ? WHERE id = ? AND state = 'queued'",
+            (time.time(), job_id)).rowcount > 0)
+
+    # --- аренда ---
+
+    def _requeue_expired(self, db: sqlite3.Connection, now: float):
+        expired = db.execute("SELECT id, worker, attempts, max_attempts FROM jobs "
+                             "WHERE state = 'leased' AND lease_until < ?", (now,)).fetchall()
+        for row in expired:
+            state = "queued" if row["attempts"] < row["max_attempts"] else "dead"
+            db.execute("UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL, "
+                       "error = 'lease expired', finished = CASE WHEN ? = 'dead' THEN ? END WHERE id = ?",
+                       (state, state, now, row["id"]))
+            self.log(f"Аренда задания {row['id']} ({row['worker']}) истекла -> {state}", "WARNING")
+
+    def lease(self, worker: str, kinds: Sequence[str] = None) -> Optional[Job]:
+        """Следующее готовое задание с учетом окон, занятости, пауз и квот аккаунтов (или None)"""
+        def work(db: sqlite3.Connection) -> Optional[Job]:
+            now = time.time()
+            self._requeue_expired(db, now)
+            busy = {row[0] for row in db.execute(
+                "SELECT DISTINCT account FROM jobs WHERE state = 'leased' AND account IS NOT NULL")}
+            policies = {row["account"]: row for row in db.execute("SELECT * FROM accounts")}
+            today = day_start(now)
+            started_today: Dict[str, int] = dict(db.execute(
+                "SELECT account, COUNT(*) FROM jobs WHERE first_leased >= ? GROUP BY account", (today,)).fetchall())
+            local = datetime.fromtimestamp(now)
+
+            query = "SELECT * FROM jobs WHERE state = 'queued' AND run_after <= ?"
+            params: List[Any] = [now]
+            if kinds:
+                query += f" AND kind IN ({','.join('?' * len(kinds))})"
+                params += list(kinds)
+            query += " ORDER BY priority DESC, run_after, id"
+            for row in db.execute(query, params):
+                account = row["account"]
+                if not in_window(row["window"], local):
+                    continue
+                if account is not None:
+                    if account in busy:
+                        continue
+                    policy = policies.get(account)
+                    if policy is not None:
+                        if policy["last_finished"] and now < policy["last_finished"] + policy["cooldown"]:
+                            continue
+                        if policy["daily_quota"] is not None and row["first_leased"] is None \
+                                and started_today.get(account, 0) >= policy["daily_quota"]:
+                            continue
+                db.execute("UPDATE jobs SET state = 'leased', attempts = attempts + 1, worker = ?, leased = ?, "
+                           "lease_until = ?, first_leased = COALESCE(first_leased, ?) WHERE id = ?",
+                           (worker, now, now + self.lease_seconds, now, row["id"]))
+                return Job(row["id"], row["kind"], account, json.loads(row["payload"]), row["priority"],
+                           row["attempts"] + 1, row["max_attempts"], worker)
+            return None
+        return self._transaction(work)
+
+    def heartbeat(self, job: Job) -> bool:
+        """Продление аренды; False - аренда потеряна (истекла и задание ушло другому)"""
+        return self._transaction(lambda db: db.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+            (time.time() + self.lease_seconds, job.id, job.worker)).rowcount > 0)
+
+    def _finish_account(self, db: sqlite3.Connection, account: Optional[str], now: float):
+        if account is not None:
+            db.execute("INSERT INTO accounts (account, last_finished) VALUES (?, ?) "
+                       "ON CONFLICT(account) DO UPDATE SET last_finished = excluded.last_finished", (account, now))
+
+    def complete(self, job: Job, result: Any = None) -> bool:
+        def work(db: sqlite3.Connection) -> bool:
+            now = time.time()
+            updated = db.execute(
+                "UPDATE jobs SET state = 'done', finished = ?, lease_until = NULL, result = ?, error = NULL "
+                "WHERE id = ? AND state = 'leased' AND worker = ?",
+                (now, json.dumps(result, ensure_ascii=False, default=str), job.id, job.worker)).rowcount > 0
+            if updated:
+                self._finish_account(db, job.account, now)
+            return updated
+        return self._transaction(work)
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> str:
+        """Ошибка задания: повтор с паузой или dead; возвращает новое состояние"""
+        def work(db: sqlite3.Connection) -> str:
+            now = time.time()
+            row = db.execute("SELECT backoff FROM jobs WHERE id = ? AND state = 'leased' AND worker = ?",
+                             (job.id, job.worker)).fetchone()
+            if row is None:
+                return "lost"
+            if retry and job.attempts < job.max_attempts:
+                delay = row["backoff"] * 2 ** (job.attempts - 1)
+                db.execute("UPDATE jobs SET state = 'queued', run_after = ?, worker = NULL, lease_until = NULL, "
+                           "error = ? WHERE id = ?", (now + delay, error[:500], job.id))
+                state = "queued"
+            else:
+                db.execute("UPDATE jobs SET state = 'dead', finished = ?, lease_until = NULL, error = ? WHERE id = ?",
+                           (now, error[:500], job.id))
+                state = "dead"
+            self._finish_account(db, job.account, now)
+            return state
+        return self._transaction(work)
+
+    # --- просмотр и метрики ---
+
+    def jobs(self, state: str = None, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            query = "SELECT * FROM jobs" + (" WHERE state = ?" if state else "") + " ORDER BY id DESC LIMIT ?"
+            return [dict(row) for row in self._db.execute(query, ((state,) if state else ()) + (limit,))]
+
+    def metrics(self, hours: float = 24.0) -> Dict:
+        """Состояния очереди, пропускная способность и задержки за последние hours часов"""
+        now = time.time()
+        since = now - hours * 3600
+        with self._lock:
+            states = dict(self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            ready = self._db.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND run_after <= ?",
+                                     (now,)).fetchone()[0]
+            rows = self._db.execute(
+                "SELECT kind, state, created, run_after, first_leased, leased, finished FROM jobs "
+                "WHERE finished >= ? OR (first_leased >= ?)", (since, since)).fetchall()
+
+        by_kind: Dict[str, Dict[str, List[float]]] = {}
+        for row in rows:
+            stats = by_kind.setdefault(row["kind"], {"done": [], "dead": [], "wait": [], "run": []})
+            if row["first_leased"]:
+                stats["wait"].append(row["first_leased"] - row["created"])
+            if row["state"] in ("done", "dead") and row["finished"] and row["finished"] >= since:
+                stats[row["state"]].append(row["finished"])
+                if row["leased"]:
+                    stats["run"].append(row["finished"] - row["leased"])
+
+        kinds = {}
+        for kind, stats in sorted(by_kind.items()):
+            kinds[kind] = {
+                "done": len(stats["done"]),
+                "dead": len(stats["dead"]),
+                "per_hour": round(len(stats["done"]) / hours, 2),
+                "wait_p50": percentile(stats["wait"], 0.5),
+                "wait_p95": percentile(stats["wait"], 0.95),
+                "run_p50": percentile(stats["run"], 0.5),
+                "run_p95": percentile(stats["run"], 0.95),
+            }
+        return {"states": states, "ready": ready, "hours": hours, "kinds": kinds}
+
+
+class WorkerPool:
+    """Потоки-исполнители: аренда, heartbeat, обработчик, завершение или повтор"""
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[Job], Any]], size: int = 1,
+                 poll_interval: float = 2.0, heartbeat_interval: float = None,
+                 log: Callable[[str, str], None] = None):
+        """
+        Args:
+            queue: Очередь заданий
+            handlers: Тип задания -> обработчик (исключение или False - ошибка, иначе результат);
+                при потере аренды обработчик должен остановиться по job.cancel
+            size: Число исполнителей
+            poll_interval: Пауза, если готовых заданий нет, с
+            heartbeat_interval: Период продления аренды (по умолчанию треть срока аренды)
+            log: Функция логирования вида log(message, level)
+        """
+        self.queue = queue
+        self.handlers = handlers
+        self.size = size
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval or queue.lease_seconds / 3
+        self.log = log or (lambda message, level="INFO": None)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    def _heartbeat(self, job: Job, done: threading.Event):
+        while not done.wait(self.heartbeat_interval):
+            if not self.queue.heartbeat(job):
+                self.log(f"Задание {job.id}: аренда потеряна, обработчик останавливается", "WARNING")
+                job.cancel.set()
+                return
+
+    def run_one(self, worker: str) -> bool:
+        """Одно задание; False - готовых заданий нет"""
+        job = self.queue.lease(worker, list(self.handlers))
+        if job is None:
+            return False
+        self.log(f"[{worker}] задание {job.id} {job.kind} ({job.account or '-'}), попытка {job.attempts}")
+        done = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job, done), daemon=True, name=f"{worker}-heartbeat")
+        beat.start()
+        try:
+            result = self.handlers[job.kind](job)
+        except Exception as e:
+            result, error = False, f"{type(e).__name__}: {e}"
+        else:
+            error = "handler returned False"
+        finally:
+            done.set()
+            beat.join()
+
+        if job.cancel.is_set():
+            # Задание уже вернулось в очередь (или ушло другому исполнителю) - итог не записываем
+            self.log(f"[{worker}] задание {job.id} прервано: аренда потеряна", "WARNING")
+        elif result is False:
+            state = self.queue.fail(job, error)
+            self.log(f"[{worker}] задание {job.id} не выполнено ({error}) -> {state}", "WARNING")
+        elif self.queue.complete(job, result if result is not True else None):
+            self.log(f"[{worker}] задание {job.id} выполнено", "SUCCESS")
+        else:
+            self.log(f"[{worker}] задание {job.id} выполнено, но аренда уже потеряна", "WARNING")
+        return True
+
+    def _loop(self, worker: str):
+        while not self._stop.is_set():
+            try:
+                if not self.run_one(worker):
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                self.log(f"[{worker}] ошибка исполнителя: {e}", "ERROR")
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        for index in range(self.size):
+            thread = threading.Thread(target=self._loop, args=(f"{self.prefix}-{index}",), daemon=True,
+                                      name=f"worker-{index}")
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        """Остановка после текущих заданий"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+
+# --- обработчики скриптов репозитория ---
+
+# Ввод через ОС (pyautogui, osascript) - один на процесс
+OS_INPUT = threading.Lock()
+
+
+def run_work_job(job: Job, batcher=None) -> Dict:
+    """
+    ypp_work: payload {"commands": [...], опционально параметры YuppAutomation};
+    batcher - общий для исполнителей процесса vision_batch.VisionBatcher.
+    Задания с вводом через ОС выполняются по одному (OS_INPUT), с вводом через DevTools - параллельно
+    """
+    import asyncio
+    from ypp_work import YuppAutomation
+
+    options = dict(job.payload)
+    commands = options.pop("commands")
+
+    async def run():
+        automation = YuppAutomation(profile=job.account or "default", batcher=batcher, **options)
+        automation.cancel = job.cancel
+        try:
+            return await automation.run_script(commands), automation.ledger.totals()
+        finally:
+            await automation.vision_client.close()
+            if automation.dom:
+                automation.dom.connection.close()
+
+    if options.get("input_backend", "os") == "cdp":
+        success, totals = asyncio.run(run())
+    else:
+        with OS_INPUT:
+            success, totals = asyncio.run(run())
+    if not success:
+        raise RuntimeError("не все команды выполнены")
+    return {"calls": totals.get("calls", 0), "cost": totals.get("cost", 0.0)}
+
+
+def run_stg_job(job: Job) -> bool:
+    """
+    ypp_stg: payload - конфигурация BrowserAutomation (steps и т.д., "flow" - сценарий по состояниям);
+    профиль - аккаунт задания. Ввод всегда через ОС, поэтому такие задания - в процессе
+    с одним исполнителем: run --workers 1 --kinds ypp_stg
+    """
+    from ypp_stg import BrowserAutomation
+
+    config = dict(job.payload)
+    flow = config.pop("flow", None)
+    config["memory"] = {**config.get("memory", {}), "profile": job.account or "default"}
+    automation = BrowserAutomation(config)
+    automation.run_cancel = job.cancel
+    return automation.run_flow(flow) if flow else automation.run_automation()
+
+
+HANDLERS = {"ypp_work": run_work_job, "ypp_stg": run_stg_job}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Очередь заданий и исполнители")
+    parser.add_argument("--db", default="jobs.db", help="Файл очереди")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Поставить задание")
+    submit.add_argument("kind", choices=sorted(HANDLERS))
+    submit.add_argument("--account")
+    submit.add_argument("--payload", default="{}", help="JSON параметров (или @файл)")
+    submit.add_argument("--priority", type=int, default=0)
+    submit.add_argument("--attempts", type=int, default=3)
+    submit.add_argument("--backoff", type=float, default=60)
+    submit.add_argument("--window", help="Окно времени HH:MM-HH:MM")
+    submit.add_argument("--delay", type=float, default=0, help="Не раньше чем через столько секунд")
+
+    account = commands.add_parser("account", help="Пауза и квота аккаунта")
+    account.add_argument("account")
+    account.add_argument("--cooldown", type=float, default=0, help="Пауза после задания, с")
+    account.add_argument("--quota", type=int, help="Заданий в день")
+
+    run = commands.add_parser("run", help="Запустить исполнителей")
+    run.add_argument("--workers", type=int, default=1)
+    run.add_argument("--lease", type=float, default=120, help="Срок аренды без heartbeat, с")
+    run.add_argument("--kinds", nargs="+", choices=sorted(HANDLERS), help="Только эти типы заданий")
+    run.add_argument("--batch-window", type=float, default=0,
+                     help="Окно сборки одновременных vision запросов ypp_work в один вызов, с (0 - без пакетов)")
+
+    listing = commands.add_parser("list", help="Задания")
+    listing.add_argument("--state")
+    listing.add_argument("--limit", type=int, default=30)
+
+    metrics = commands.add_parser("metrics", help="Метрики очереди")
+    metrics.add_argument("--hours", type=float, default=24)
+
+    cancel = commands.add_parser("cancel", help="Снять задание из очереди")
+    cancel.add_argument("id", type=int)
+
+    args = parser.parse_args()
+
+    def log(message, level="INFO"):
+        if level != "DEBUG":
+            print(f"{datetime.now():%H:%M:%S} {level:7} {message}")
+
+    queue = JobQueue(args.db, lease_seconds=getattr(args, "lease", 120), log=log)
+
+    if args.command == "submit":
+        payload = args.payload
+        if payload.startswith("@"):
+            with open(payload[1:], encoding="utf-8") as f:
+                payload = f.read()
+        job_id = queue.submit(args.kind, args.account, json.loads(payload), args.priority, args.attempts,
+                              args.backoff, time.time() + args.delay, args.window)
+        print(f"Задание {job_id} поставлено")
+    elif args.command == "account":
+        queue.set_account(args.account, args.cooldown, args.quota)
+        print(f"Аккаунт {args.account}: пауза {args.cooldown:g}с, квота {args.quota or '-'}")
+    elif args.command == "run":
+        handlers = {kind: HANDLERS[kind] for kind in args.kinds or HANDLERS}
+        if args.workers > 1 and "ypp_stg" in handlers:
+            parser.error("ypp_stg кликает через ОС: нужен --workers 1 (или --kinds без ypp_stg)")
+        batcher = None
+        if args.batch_window > 0 and "ypp_work" in handlers:
+            from vision_batch import VisionBatcher
+            batcher = VisionBatcher(window=args.batch_window, log=log)
+            handlers["ypp_work"] = functools.partial(run_work_job, batcher=batcher)
+        pool = WorkerPool(queue, handlers, size=args.workers, log=log)
+        pool.start()
+        try:
+            while True:
+                time.sleep(60)
+                log(f"Очередь: {json.dumps(queue.metrics(1), ensure_ascii=False)}")
+                if batcher:
+                    log(f"Пакеты vision: {batcher.stats}")
+        except KeyboardInterrupt:
+            log("Остановка после текущих заданий...")
+            pool.stop()
+    elif args.command == "list":
+        for job in queue.jobs(args.state, args.limit):
+            print(f"{job['id']:>5} {job['state']:7} {job['kind']:10} {job['account'] or '-':12} "
+                  f"p{job['priority']} попыток {job['attempts']}/{job['max_attempts']} {job['error'] or ''}")
+    elif args.command == "metrics":
+        print(json.dumps(queue.metrics(args.hours), ensure_ascii=False, indent=1))
+    elif args.command == "cancel":
+        print("снято" if queue.cancel(args.id) else "задание не в очереди")
+
+
+if __name__ == "__main__":
+    main()
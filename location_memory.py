@@ -0,0 +1,149 @@
+"""
+Память расположения элементов интерфейса
+
+Запоминает, где цель (кнопка Google, аккаунт, Continue, поле Rabby, кнопки prefer)
+была найдена в прошлый раз для пары (разрешение экрана, профиль). Поиск сначала
+проверяет маленькое окно вокруг запомненного места и только при промахе
+расширяется до полного экрана. Устаревшие записи постепенно "забываются".
+
+Хранилище - обычный JSON файл рядом со скриптами.
+"""
+
+import json
+import os
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+
+class LocationMemory:
+    """Персистентная память координат по ключу (цель, разрешение, профиль)"""
+
+    def __init__(self, path: str = "location_memory.json", profile: str = "default",
+                 half_life_days: float = 7.0, min_score: float = 0.25,
+                 roi_padding: int = 80, log: Callable[[str, str], None] = None):
+        """
+        Args:
+            path: Путь к JSON файлу памяти
+            profile: Имя профиля браузера/аккаунта
+            half_life_days: За сколько дней доверие к записи падает вдвое
+            min_score: Ниже этого доверия запись не используется
+            roi_padding: Отступ окна поиска вокруг запомненного бокса (px)
+            log: Функция логирования вида log(message, level)
+        """
+        self.path = path
+        self.profile = profile
+        self.half_life = half_life_days * 24 * 3600
+        self.min_score = min_score
+        self.roi_padding = roi_padding
+        self.log = log or (lambda message, level="INFO": None)
+        self.entries: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        """Загрузка памяти с диска"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception as e:
+            self.log(f"Не удалось прочитать память координат {self.path}: {e}", "WARNING")
+            return {}
+
+    def save(self):
+        """Атомарное сохранение памяти на диск"""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.log(f"Не удалось сохранить память координат: {e}", "WARNING")
+
+    def _key(self, target: str, resolution: Tuple[int, int]) -> str:
+        return f"{self.profile}|{resolution[0]}x{resolution[1]}|{target}"
+
+    def _decayed_score(self, entry: Dict, now: float = None) -> float:
+        """Доверие к записи с учетом экспоненциального затухания"""
+        age = (now or time.time()) - entry.get("last_seen", 0)
+        if self.half_life <= 0:
+            return entry.get("score", 0.0)
+        return entry.get("score", 0.0) * 0.5 ** (max(age, 0) / self.half_life)
+
+    def lookup(self, target: str, resolution: Tuple[int, int]) -> Optional[Box]:
+        """Запомненный бокс цели или None, если записи нет или она устарела"""
+        entry = self.entries.get(self._key(target, resolution))
+        if not entry:
+            return None
+        if self._decayed_score(entry) < self.min_score:
+            return None
+        return tuple(entry["box"])
+
+    def search_region(self, target: str, resolution: Tuple[int, int]) -> Optional[Box]:
+        """Окно поиска вокруг запомненного бокса, обрезанное по краям экрана"""
+        box = self.lookup(target, resolution)
+        if not box:
+            return None
+
+        left, top, width, height = box
+        pad = self.roi_padding
+        screen_width, screen_height = resolution
+
+        x1 = max(0, left - pad)
+        y1 = max(0, top - pad)
+        x2 = min(screen_width, left + width + pad)
+        y2 = min(screen_height, top + height + pad)
+
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return (x1, y1, x2 - x1, y2 - y1)
+
+    def record_hit(self, target: str, resolution: Tuple[int, int], box: Box):
+        """Запоминаем успешное нахождение цели"""
+        key = self._key(target, resolution)
+        entry = self.entries.get(key, {"hits": 0, "misses": 0})
+        entry.update({
+            "box": [int(v) for v in box],
+            "hits": entry.get("hits", 0) + 1,
+            "score": 1.0,
+            "last_seen": time.time()
+        })
+        self.entries[key] = entry
+        self.save()
+        self.log(f"Память: '{target}' -> {entry['box']}", "DEBUG")
+
+    def record_point(self, target: str, resolution: Tuple[int, int], point: Tuple[int, int],
+                     size: Tuple[int, int] = (120, 40)):
+        """Запоминаем цель, известную только по точке центра"""
+        width, height = size
+        box = (int(point[0]) - width // 2, int(point[1]) - height // 2, width, height)
+        self.record_hit(target, resolution, box)
+
+    def record_miss(self, target: str, resolution: Tuple[int, int]):
+        """Промах в запомненном окне: снижаем доверие, слабую запись удаляем"""
+        key = self._key(target, resolution)
+        entry = self.entries.get(key)
+        if not entry:
+            return
+
+        entry["misses"] = entry.get("misses", 0) + 1
+        entry["score"] = self._decayed_score(entry) * 0.5
+        entry["last_seen"] = time.time()
+
+        if entry["score"] < self.min_score:
+            del self.entries[key]
+            self.log(f"Память: запись '{target}' устарела и удалена", "DEBUG")
+        self.save()
+
+    def forget(self, target: str, resolution: Tuple[int, int]):
+        """Удаление записи"""
+        if self.entries.pop(self._key(target, resolution), None) is not None:
+            self.save()
+
+
+def box_center(box: Box) -> Tuple[int, int]:
+    """Центр бокса (left, top, width, height)"""
+    left, top, width, height = box
+    return (int(left + width // 2), int(top + height // 2))
@@ -0,0 +1,213 @@
+"""
+Выбор провайдера и модели по типу запроса с эскалацией к более сильной модели
+
+Тип запроса (plan - план действий, locate - поиск элемента на скриншоте,
+pick_text - выбор строки из OCR-списка, verify - проверка результата и т.п.)
+задает лестницу уровней: сначала дешевые и быстрые модели, выше - сильные.
+Запрос уходит на первый уровень (внутри уровня провайдеры хеджируются, лучший
+по статистике - первым). Следующий уровень пробуется только если ответа нет,
+он невалиден или неуверен (confident(parsed) == False). Определенный
+отрицательный ответ (NOT_FOUND - цели на экране нет) - успех уровня, без
+эскалации.
+
+По каждой паре (тип запроса, провайдер) копятся скользящие измерения: успех
+(валидный и уверенный ответ), задержка и стоимость. Порядок провайдеров внутри
+уровня - по успешности, затем по задержке и стоимости. Уровень, который стабильно
+не справляется (успешность ниже min_success на min_samples запросах), пропускается
+сразу (каждый probe_every-й запрос все же идет к нему, чтобы статистика
+обновлялась). Статистика сохраняется в JSON между запусками.
+
+Правила (rules):
+{
+    "locate": {"tiers": [["deepseek"], ["openai"]]},
+    "plan": {"tiers": [["openai-mini"], ["openai"]], "max_tokens": 150},
+}
+Имена - VisionProvider.name; провайдеры без ключа пропускаются. Тип без правил
+или без доступных провайдеров - один уровень из всех провайдеров клиента.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from vision_client import NOT_FOUND, HedgedVisionClient, VisionProvider, VisionResult
+from vision_ledger import percentile, usage_tokens
+
+
+class ModelRouter:
+    """Маршрутизация запросов по уровням моделей со статистикой и эскалацией"""
+
+    def __init__(self, client: HedgedVisionClient, rules: Dict[str, Dict] = None,
+                 stats_path: Optional[str] = "model_stats.json", window: int = 100,
+                 min_samples: int = 10, min_success: float = 0.5,
+                 probe_every: int = 20, latency_weight: float = 0.05, cost_weight: float = 20.0,
+                 log: Callable[[str, str], None] = None):
+        """
+        Args:
+            client: Клиент с пулом провайдеров (хеджирование внутри уровня)
+            rules: Тип запроса -> {"tiers": [[имя провайдера, ...], ...], "max_tokens": N}
+            stats_path: Файл статистики (None - только в памяти)
+            window: Сколько последних запросов учитывать на пару (тип, провайдер)
+            min_samples: Запросов до того, как уровень можно пропустить по статистике
+            min_success: Успешность, ниже которой уровень пропускается
+            probe_every: Каждый такой запрос пробует и пропускаемый уровень (0 - никогда)
+            latency_weight: Штраф порядка за секунду медианной задержки
+            cost_weight: Штраф порядка за доллар средней стоимости запроса
+            log: Функция логирования вида log(message, level)
+        """
+        self.client = client
+        self.rules = rules or {}
+        self.stats_path = stats_path
+        self.window = window
+        self.min_samples = min_samples
+        self.min_success = min_success
+        self.probe_every = probe_every
+        self.latency_weight = latency_weight
+        self.cost_weight = cost_weight
+        self.log = log or (lambda message, level="INFO": None)
+        self._lock = threading.Lock()
+        # (тип, провайдер) -> последние [успех, задержка, стоимость]
+        self.stats: Dict[str, deque] = self._load()
+        self.escalations: Dict[str, int] = {}
+        self.requests: Dict[str, int] = {}
+
+    # --- статистика ---
+
+    def _load(self) -> Dict[str, deque]:
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return {}
+        try:
+            with open(self.stats_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            self.log(f"Статистика моделей не прочитана: {e}", "WARNING")
+            return {}
+        return {key: deque(samples, maxlen=self.window) for key, samples in data.items()}
+
+    def save(self):
+        if not self.stats_path:
+            return
+        with self._lock:
+            data = {key: list(samples) for key, samples in self.stats.items()}
+        temp = f"{self.stats_path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp, self.stats_path)
+
+    def _record(self, task: str, provider: str, success: bool, latency: float, cost: float = 0.0):
+        with self._lock:
+            samples = self.stats.setdefault(f"{task}/{provider}", deque(maxlen=self.window))
+            samples.append([int(success), round(latency, 3), round(cost, 6)])
+
+    def measurements(self, task: str, provider: str) -> Dict:
+        """Успешность (сглаженная), p50 задержки и средняя стоимость пары (тип, провайдер)"""
+        with self._lock:
+            samples = list(self.stats.get(f"{task}/{provider}", ()))
+        successes = sum(sample[0] for sample in samples)
+        return {
+            "samples": len(samples),
+            "success": (successes + 1) / (len(samples) + 2),  # априори 50%, пока данных нет
+            "latency_p50": percentile([sample[1] for sample in samples], 0.5),
+            "cost": sum(sample[2] for sample in samples) / len(samples) if samples else 0.0,
+        }
+
+    def _score(self, task: str, provider: VisionProvider) -> float:
+        stats = self.measurements(task, provider.name)
+        return (stats["success"] - self.latency_weight * (stats["latency_p50"] or 0.0)
+                - self.cost_weight * stats["cost"])
+
+    def _cost(self, result: VisionResult) -> float:
+        ledger = self.client.ledger
+        if ledger is None or not result.usage:
+            return 0.0
+        return ledger.price(result.model, *usage_tokens(result.usage))
+
+    # --- маршрутизация ---
+
+    def tiers(self, task: str) -> List[List[VisionProvider]]:
+        """Доступные уровни типа запроса; провайдеры уровня - лучшие по статистике первыми"""
+        by_name = {provider.name: provider for provider in self.client.providers}
+        tiers = []
+        for names in self.rules.get(task, {}).get("tiers", []):
+            tier = [by_name[name] for name in names if name in by_name]
+            if tier:
+                tiers.append(sorted(tier, key=lambda provider: -self._score(task, provider)))
+        return tiers or [list(self.client.providers)]
+
+    def _weak(self, task: str, tier: List[VisionProvider]) -> bool:
+        """Уровень стабильно не справляется с этим типом запроса"""
+        measured = [self.measurements(task, provider.name) for provider in tier]
+        return all(stats["samples"] >= self.min_samples and stats["success"] < self.min_success
+                   for stats in measured)
+
+    async def request(self, task: str, messages: List[Dict], validator: Callable[[str], Any] = None,
+                      confident: Callable[[Any], bool] = None, max_tokens: int = 300,
+                      temperature: float = 0.1, extra: Dict = None,
+                      purpose: str = "") -> Optional[VisionResult]:
+        """
+        Запрос по лестнице уровней типа task
+
+        Args:
+            task: Тип запроса (ключ правил)
+            messages, validator, max_tokens, temperature, extra: как в HedgedVisionClient.request
+            confident: parsed -> уверен ли ответ (False - эскалация на следующий уровень;
+                NOT_FOUND не проверяется - это уверенный отрицательный ответ)
+            purpose: Назначение для журнала стоимости (по умолчанию - тип запроса)
+
+        Returns:
+            Первый уверенный ответ; если уверенного нет - последний валидный (или None)
+        """
+        max_tokens = self.rules.get(task, {}).get("max_tokens", max_tokens)
+        tiers = self.tiers(task)
+        self.requests[task] = self.requests.get(task, 0) + 1
+        probe = bool(self.probe_every) and self.requests[task] % self.probe_every == 0
+        fallback = None
+        for level, tier in enumerate(tiers):
+            if level < len(tiers) - 1 and not probe and self._weak(task, tier):
+                self.log(f"{task}: уровень {[p.name for p in tier]} пропущен по статистике", "DEBUG")
+                continue
+
+            started = time.monotonic()
+            result = await self.client.request(messages, validator=validator, max_tokens=max_tokens,
+                                               temperature=temperature, extra=extra,
+                                               purpose=purpose or task, providers=tier)
+            sure = result is not None and (confident is None or result.parsed is NOT_FOUND
+                                           or confident(result.parsed))
+            if result is None:
+                # None - все провайдеры уровня запущены и ответили ошибкой или мусором
+                # (отрицательный ответ NOT_FOUND приходит результатом, а не None)
+                for provider in tier:
+                    self._record(task, provider.name, False, time.monotonic() - started)
+            else:
+                for provider in tier:
+                    if provider.name == result.provider:
+                        self._record(task, provider.name, sure, result.latency, self._cost(result))
+                    elif result.outcomes.get(provider.name) in ("error", "invalid"):
+                        self._record(task, provider.name, False, result.latencies.get(provider.name, 0.0))
+
+            if sure:
+                return result
+            fallback = result or fallback
+            if level < len(tiers) - 1:
+                self.escalations[task] = self.escalations.get(task, 0) + 1
+                reason = "неуверенный ответ" if result else "нет валидного ответа"
+                self.log(f"{task}: {reason} от {[p.name for p in tier]}, эскалация", "DEBUG")
+        return fallback
+
+    def request_sync(self, task: str, messages: List[Dict], cancel: threading.Event = None,
+                     **kwargs) -> Optional[VisionResult]:
+        """Синхронная обертка (запрос идет в фоновом loop клиента; cancel - как в run_sync)"""
+        return self.client.run_sync(self.request(task, messages, **kwargs), cancel)
+
+    def summary(self) -> Dict[str, Dict]:
+        """Измерения по парам тип/провайдер и число эскалаций по типам"""
+        with self._lock:
+            keys = sorted(self.stats)
+        result = {}
+        for key in keys:
+            task, provider = key.split("/", 1)
+            result[key] = self.measurements(task, provider)
+        return {"routes": result, "escalations": dict(self.escalations)}
@@ -0,0 +1,188 @@
+"""
+Компактное представление OCR разметки экрана для промптов
+
+Слова pytesseract склеиваются в строки (с разрывом по большим горизонтальным
+промежуткам, чтобы соседние кнопки не слипались), затем:
+    - отбрасываются строки из области браузерного хрома (вкладки, адресная строка)
+      и малоинформативные токены (одиночные символы, пунктуация, числа);
+    - строки ранжируются по близости к ожидаемой области цели и "похожести на
+      кнопку" (короткий текст, совпадение с ключевыми словами);
+    - лучшие строки нумеруются и укладываются в бюджет токенов.
+
+Модель отвечает только номером строки, координаты берутся из локального бокса.
+"""
+
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from vision_client import NOT_FOUND
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+
+@dataclass
+class LayoutItem:
+    """Строка (или фрагмент строки) OCR разметки"""
+    text: str
+    box: Box
+    conf: float  # средняя уверенность OCR слов
+    block: int = 0  # номер блока tesseract
+    score: float = 0.0
+    id: int = 0
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        left, top, width, height = self.box
+        return (left + width // 2, top + height // 2)
+
+
+def _merge_boxes(boxes: Sequence[Box]) -> Box:
+    left = min(b[0] for b in boxes)
+    top = min(b[1] for b in boxes)
+    right = max(b[0] + b[2] for b in boxes)
+    bottom = max(b[1] + b[3] for b in boxes)
+    return (left, top, right - left, bottom - top)
+
+
+def build_lines(ocr_data: Dict, min_conf: float = 50, gap_ratio: float = 1.5) -> List[LayoutItem]:
+    """
+    Склейка слов в строки по (block, par, line) tesseract
+
+    Args:
+        ocr_data: Результат pytesseract.image_to_data(..., output_type=DICT)
+        min_conf: Минимальная уверенность слова
+        gap_ratio: Разрыв строки, если промежуток между словами больше gap_ratio * высота
+    """
+    groups: Dict[Tuple[int, int, int], List[Tuple[str, Box, float]]] = {}
+    for i, text in enumerate(ocr_data['text']):
+        text = text.strip()
+        conf = float(ocr_data['conf'][i])
+        if not text or conf < min_conf:
+            continue
+        key = (ocr_data['block_num'][i], ocr_data['par_num'][i], ocr_data['line_num'][i])
+        box = (ocr_data['left'][i], ocr_data['top'][i], ocr_data['width'][i], ocr_data['height'][i])
+        groups.setdefault(key, []).append((text, box, conf))
+
+    items = []
+    for (block, _, _), words in groups.items():
+        words.sort(key=lambda w: w[1][0])
+        fragment = [words[0]]
+        for word in words[1:]:
+            previous_box = fragment[-1][1]
+            gap = word[1][0] - (previous_box[0] + previous_box[2])
+            if gap > gap_ratio * max(previous_box[3], word[1][3]):
+                items.append(_fragment_item(fragment, block))
+                fragment = []
+            fragment.append(word)
+        items.append(_fragment_item(fragment, block))
+    return items
+
+
+def _fragment_item(words: List[Tuple[str, Box, float]], block: int) -> LayoutItem:
+    return LayoutItem(
+        text=" ".join(w[0] for w in words),
+        box=_merge_boxes([w[1] for w in words]),
+        conf=sum(w[2] for w in words) / len(words),
+        block=block
+    )
+
+
+def is_low_information(text: str) -> bool:
+    """Одиночные символы, пунктуация и числа не помогают выбрать кнопку"""
+    stripped = re.sub(r"[\W_]+", "", text, flags=re.UNICODE)
+    return len(stripped) < 2 or stripped.isdigit()
+
+
+def is_chrome(item: LayoutItem, frame_size: Tuple[int, int], chrome_top: float = 0.09) -> bool:
+    """Строка в полосе вкладок/адресной строки браузера"""
+    return item.center[1] < frame_size[1] * chrome_top
+
+
+def score_item(item: LayoutItem, frame_size: Tuple[int, int],
+               prior: Tuple[float, float] = None, keywords: Sequence[str] = ()) -> float:
+    """
+    Оценка строки как кандидата (больше - лучше)
+
+    Args:
+        item: Строка разметки
+        frame_size: Размер кадра (ширина, высота)
+        prior: Ожидаемый центр цели в долях экрана (x, y)
+        keywords: Тексты, которые ожидаются на цели
+    """
+    width, height = frame_size
+    text = item.text.lower()
+    score = 0.0
+
+    # Совпадение с ключевыми словами - главный признак
+    if any(keyword.lower() in text for keyword in keywords):
+        score += 3.0
+
+    # Похожесть на кнопку: 1-4 слова, короткий текст
+    words = len(item.text.split())
+    if words <= 4 and len(item.text) <= 30:
+        score += 1.0
+    elif words > 10:
+        score -= 1.0
+
+    # Близость к ожидаемой области цели
+    if prior:
+        cx, cy = item.center
+        distance = math.hypot(cx / width - prior[0], cy / height - prior[1])
+        score += max(0.0, 1.5 - 2.5 * distance)
+
+    return score + item.conf / 200
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов строки"""
+    return max(1, math.ceil(len(text) / 3.5))
+
+
+def compress_layout(ocr_data: Dict, frame_size: Tuple[int, int],
+                    prior: Tuple[float, float] = None, keywords: Sequence[str] = (),
+                    token_budget: int = 250, min_conf: float = 50,
+                    max_text: int = 40) -> Tuple[str, Dict[int, LayoutItem]]:
+    """
+    Компактная нумерованная разметка экрана
+
+    Returns:
+        (текст для промпта, словарь id -> LayoutItem)
+        Формат строки: "<id>|<текст>|<x%>,<y%>" (центр в процентах экрана)
+    """
+    width, height = frame_size
+    items = [
+        item for item in build_lines(ocr_data, min_conf)
+        if not is_low_information(item.text) and not is_chrome(item, frame_size)
+    ]
+    for item in items:
+        item.score = score_item(item, frame_size, prior, keywords)
+    items.sort(key=lambda item: item.score, reverse=True)
+
+    lines = []
+    selected: Dict[int, LayoutItem] = {}
+    used = 0
+    for item in items:
+        item.id = len(selected) + 1
+        cx, cy = item.center
+        line = f"{item.id}|{item.text[:max_text]}|{round(cx * 100 / width)},{round(cy * 100 / height)}"
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            break
+        used += cost
+        lines.append(line)
+        selected[item.id] = item
+
+    return "\n".join(lines), selected
+
+
+def parse_item_id(content: str, items: Dict[int, LayoutItem]) -> Optional[LayoutItem]:
+    """Валидатор ответа модели: номер строки из разметки; 0 / NOT_FOUND -> NOT_FOUND, мусор -> None"""
+    if "NOT_FOUND" in content:
+        return NOT_FOUND
+    match = re.search(r"\d+", content)
+    if not match:
+        return None
+    number = int(match.group())
+    return NOT_FOUND if number == 0 else items.get(number)
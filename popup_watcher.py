@@ -0,0 +1,328 @@
+"""
+Фоновый наблюдатель за всплывающими окнами (кошелек Rabby, диалоги)
+
+Вместо отдельного цикла опроса на каждое окно один поток раз в interval
+секунд снимает один кадр экрана и проверяет на нем все зарегистрированные
+признаки (Cue):
+    - шаблон изображения: opencv matchTemplate по серому уменьшенному кадру
+      (без opencv - точное совпадение через pyautogui.locate);
+    - текст: OCR области (дороже, поэтому проверяется раз в every тиков).
+
+При появлении признака (не было -> есть) вызываются обработчики и
+срабатывают ожидания: синхронное wait_for и асинхронное wait_for_async.
+
+Использование:
+    with PopupWatcher() as watcher:
+        watcher.register(Cue("password_field", template="field.png"))
+        detection = watcher.wait_for("password_field", timeout=40)
+"""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from screen_capture import get_capture
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+
+@dataclass
+class Cue:
+    """Признак окна"""
+    name: str
+    template: Optional[str] = None  # путь к изображению
+    text: Optional[str] = None  # слово или его часть (без учета регистра)
+    confidence: float = 0.8
+    region: Optional[Box] = None  # область экрана; None - весь экран
+    every: int = 1  # проверять раз в every тиков
+
+
+@dataclass
+class Detection:
+    """Найденный признак"""
+    name: str
+    box: Box  # в координатах экрана
+    score: float
+    timestamp: float  # time.monotonic() кадра
+    seq: int
+
+    @property
+    def point(self) -> Tuple[int, int]:
+        left, top, width, height = self.box
+        return (left + width // 2, top + height // 2)
+
+
+class PopupWatcher:
+    """Один поток, один кадр на тик, много признаков"""
+
+    def __init__(self, interval: float = 0.05, scale: float = 0.5, capture=None,
+                 log: Callable[[str, str], None] = None):
+        """
+        Args:
+            interval: Период тика, с
+            scale: Масштаб кадра для поиска шаблонов (меньше - быстрее)
+            capture: Бэкенд захвата (по умолчанию screen_capture.get_capture())
+            log: Функция логирования вида log(message, level)
+        """
+        self.interval = interval
+        self.scale = scale
+        self.capture = capture or get_capture()
+        self.log = log or (lambda message, level="INFO": None)
+
+        self.cues: Dict[str, Cue] = {}
+        self.callbacks: Dict[str, List[Callable[[Detection], None]]] = {}
+        self.detections: Dict[str, Detection] = {}
+        self._templates: Dict[str, object] = {}
+        self._async_waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ticks = 0
+        self.stats = {"ticks": 0, "tick_ms": 0.0, "appeared": 0, "errors": 0}
+
+    # --- регистрация ---
+
+    def register(self, cue: Cue, callback: Callable[[Detection], None] = None) -> Cue:
+        """Добавление признака (и обработчика его появления)"""
+        with self._condition:
+            self.cues[cue.name] = cue
+            self._templates.pop(cue.name, None)
+        if callback:
+            self.on(cue.name, callback)
+        return cue
+
+    def unregister(self, name: str):
+        with self._condition:
+            self.cues.pop(name, None)
+            self.detections.pop(name, None)
+            self.callbacks.pop(name, None)
+
+    def on(self, name: str, callback: Callable[[Detection], None]):
+        """Обработчик появления признака (вызывается в потоке наблюдателя)"""
+        self.callbacks.setdefault(name, []).append(callback)
+
+    # --- жизненный цикл ---
+
+    def start(self) -> "PopupWatcher":
+        if self._thread and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="popup-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def __enter__(self) -> "PopupWatcher":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.tick()
+            except Exception as e:
+                self.stats["errors"] += 1
+                if self.stats["errors"] <= 3:
+                    self.log(f"Ошибка наблюдателя: {e}", "WARNING")
+            elapsed = time.monotonic() - started
+            self._stop.wait(max(0.0, self.interval - elapsed))
+
+    # --- ожидания ---
+
+    def present(self, name: str) -> Optional[Detection]:
+        """Последнее обнаружение признака, если он сейчас на экране"""
+        with self._condition:
+            return self.detections.get(name)
+
+    def wait_for(self, name: str, timeout: float = None) -> Optional[Detection]:
+        """Ожидание появления признака (сразу, если он уже на экране)"""
+        with self._condition:
+            self._condition.wait_for(lambda: name in self.detections, timeout)
+            return self.detections.get(name)
+
+    def wait_gone(self, name: str, timeout: float = None) -> bool:
+        """Ожидание исчезновения признака"""
+        with self._condition:
+            return self._condition.wait_for(lambda: name not in self.detections, timeout)
+
+    async def wait_for_async(self, name: str, timeout: float = None) -> Optional[Detection]:
+        """Асинхронное ожидание появления признака"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._condition:
+            if name in self.detections:
+                return self.detections[name]
+            self._async_waiters.setdefault(name, []).append((loop, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    # --- тик ---
+
+    def tick(self):
+        """Один кадр - проверка всех признаков, которым пора"""
+        started = time.perf_counter()
+        self._ticks += 1
+        with self._condition:
+            cues = [cue for cue in self.cues.values() if self._ticks % max(1, cue.every) == 0]
+        if not cues:
+            return
+
+        frame = self.capture.grab()
+        cache: Dict[str, object] = {}
+        for cue in cues:
+            try:
+                detection = self._match(cue, frame, cache)
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.log(f"Ошибка проверки '{cue.name}': {e}", "DEBUG")
+                continue
+            self._update(cue.name, detection)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats["ticks"] += 1
+        self.stats["tick_ms"] += (elapsed_ms - self.stats["tick_ms"]) / self.stats["ticks"]
+
+    def _match(self, cue: Cue, frame, cache: Dict) -> Optional[Detection]:
+        if cue.template:
+            box, score = self._match_template(cue, frame, cache)
+        elif cue.text:
+            box, score = self._match_text(cue, frame, cache)
+        else:
+            return None
+        if box is None:
+            return None
+        return Detection(cue.name, box, score, frame.timestamp, frame.seq)
+
+    def _gray(self, frame, cache: Dict):
+        """Серый уменьшенный кадр (один раз на тик)"""
+        if "gray" not in cache:
+            import cv2
+            code = cv2.COLOR_BGRA2GRAY if frame.channels == "BGRA" else cv2.COLOR_RGB2GRAY
+            gray = cv2.cvtColor(frame.array, code)
+            if self.scale != 1.0:
+                gray = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            cache["gray"] = gray
+        return cache["gray"]
+
+    def _pil(self, frame, cache: Dict):
+        if "pil" not in cache:
+            cache["pil"] = frame.to_pil()
+        return cache["pil"]
+
+    def _template(self, cue: Cue):
+        """Серый шаблон в масштабе кадра (загружается один раз)"""
+        if cue.name not in self._templates:
+            import cv2
+            needle = cv2.imread(cue.template, cv2.IMREAD_GRAYSCALE)
+            if needle is None:
+                raise FileNotFoundError(cue.template)
+            if self.scale != 1.0:
+                needle = cv2.resize(needle, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            self._templates[cue.name] = needle
+        return self._templates[cue.name]
+
+    def _local_region(self, cue: Cue, frame) -> Box:
+        """Область признака в координатах кадра"""
+        frame_left, frame_top, width, height = frame.region
+        if not cue.region:
+            return (0, 0, width, height)
+        left = max(0, cue.region[0] - frame_left)
+        top = max(0, cue.region[1] - frame_top)
+        return (left, top, min(cue.region[2], width - left), min(cue.region[3], height - top))
+
+    def _match_template(self, cue: Cue, frame, cache: Dict) -> Tuple[Optional[Box], float]:
+        try:
+            import cv2
+        except ImportError:
+            return self._match_template_exact(cue, frame, cache)
+
+        gray = self._gray(frame, cache)
+        needle = self._template(cue)
+        left, top, width, height = (int(v * self.scale) for v in self._local_region(cue, frame))
+        haystack = gray[top:top + height, left:left + width]
+        if haystack.shape[0] < needle.shape[0] or haystack.shape[1] < needle.shape[1]:
+            return None, 0.0
+
+        result = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (x, y) = cv2.minMaxLoc(result)
+        if score < cue.confidence:
+            return None, score
+
+        box = (frame.region[0] + int((left + x) / self.scale), frame.region[1] + int((top + y) / self.scale),
+               int(needle.shape[1] / self.scale), int(needle.shape[0] / self.scale))
+        return box, float(score)
+
+    def _match_template_exact(self, cue: Cue, frame, cache: Dict) -> Tuple[Optional[Box], float]:
+        """Без opencv: точное совпадение шаблона через pyautogui"""
+        import pyautogui
+
+        image = self._pil(frame, cache)
+        left, top, width, height = self._local_region(cue, frame)
+        try:
+            location = pyautogui.locate(cue.template, image.crop((left, top, left + width, top + height)))
+        except pyautogui.ImageNotFoundException:
+            return None, 0.0
+        if not location:
+            return None, 0.0
+        box = (frame.region[0] + left + int(location[0]), frame.region[1] + top + int(location[1]),
+               int(location[2]), int(location[3]))
+        return box, 1.0
+
+    def _match_text(self, cue: Cue, frame, cache: Dict) -> Tuple[Optional[Box], float]:
+        import pytesseract
+
+        left, top, width, height = self._local_region(cue, frame)
+        crop = self._pil(frame, cache).crop((left, top, left + width, top + height))
+        data = pytesseract.image_to_data(crop, output_type=pytesseract.Output.DICT)
+        needle = cue.text.lower()
+        for i, word in enumerate(data['text']):
+            conf = float(data['conf'][i])
+            if needle in word.lower() and conf >= cue.confidence * 100:
+                box = (frame.region[0] + left + data['left'][i], frame.region[1] + top + data['top'][i],
+                       data['width'][i], data['height'][i])
+                return box, conf / 100
+        return None, 0.0
+
+    def _update(self, name: str, detection: Optional[Detection]):
+        """Обновление состояния признака и уведомление о появлении"""
+        with self._condition:
+            appeared = detection is not None and name not in self.detections
+            if detection is not None:
+                self.detections[name] = detection
+            elif name in self.detections:
+                del self.detections[name]
+            else:
+                return
+            waiters = self._async_waiters.pop(name, []) if appeared else []
+            self._condition.notify_all()
+
+        if not appeared:
+            return
+        self.stats["appeared"] += 1
+        self.log(f"Появился '{name}' в {detection.point} (score {detection.score:.2f})", "DEBUG")
+
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future, detection)
+        for callback in self.callbacks.get(name, []):
+            try:
+                callback(detection)
+            except Exception as e:
+                self.log(f"Ошибка обработчика '{name}': {e}", "WARNING")
+
+
+def _resolve(future: asyncio.Future, detection: Detection):
+    if not future.done():
+        future.set_result(detection)
@@ -1,40 +1,98 @@
 import pyautogui
 import time
 
-print("Ожидаю появление поля Rabby Wallet...")
-
-# Пытаемся найти изображение поля — до 40 секунд
-for i in range(40):
-    try:
-        # Поиск поля по скриншоту
-        location = pyautogui.locateCenterOnScreen('src/adspower_automation/strategies/rabby_password_field.png', confidence=0.8)
-        if location:
-            print(f"Поле найдено на координатах {location}")
-            pyautogui.click(location)
-            time.sleep(0.3)
-            pyautogui.write('rabbywallet', interval=0.1)
-            pyautogui.press('enter')
-            print("Пароль введён и отправлен.")
-            break
-    except Exception as e:
-        # Можно добавить логирование ошибок для отладки
-        # print(f"Попытка {i+1}: {e}")
-        pass
-    time.sleep(1)
-else:
-    print("❌ Поле пароля не найдено за 40 секунд.")
-    exit()
-
-# Ожидаем появления кнопки Sign
-print("Ожидаю появление кнопки Sign...")
-time.sleep(2)  # Даём время на загрузку следующего экрана
-
-# Два клика по точным координатам кнопки SIGN с интервалом 1 секунда
-print("Первый клик по кнопке Sign на координатах (1143, 775)")
-pyautogui.click(1143, 775)
-time.sleep(1)
-print("Второй клик по кнопке Sign")
-pyautogui.click(1143, 775)
-print("✅ Кнопка Sign нажата два раза!")
-
-print("Скрипт завершён.")
\ No newline at end of file
+from location_memory import LocationMemory
+from popup_watcher import Cue, PopupWatcher
+from screen_capture import grab_image
+
+PASSWORD_FIELD_IMAGE = 'src/adspower_automation/strategies/rabby_password_field.png'
+SIGN_BUTTON_COORDS = (1143, 775)
+DETECTOR_MODEL = 'models/ui_detector.onnx'
+# Неожиданные окна Rabby (неверный пароль, ошибка подписи): слова и область окна расширения над кнопкой Sign
+DIALOG_TEXTS = ["Incorrect", "Error", "failed"]
+DIALOG_REGION = (SIGN_BUTTON_COORDS[0] - 250, SIGN_BUTTON_COORDS[1] - 600, 500, 680)
+
+memory = LocationMemory(profile="rabby")
+resolution = tuple(pyautogui.size())
+
+# Кнопку Sign ищем по тексту рядом с местом, где она была раньше (или рядом с известными координатами)
+sign_region = memory.search_region("rabby_sign_button", resolution)
+if not sign_region:
+    sign_region = (SIGN_BUTTON_COORDS[0] - 200, SIGN_BUTTON_COORDS[1] - 80, 400, 160)
+
+
+def log(message, level="INFO"):
+    if level != "DEBUG":
+        icon = {"WARNING": "⚠️ ", "ERROR": "❌ "}.get(level, "")
+        print(f"{icon}{message}")
+
+
+watcher = PopupWatcher(log=log)
+watcher.register(Cue("password_field", template=PASSWORD_FIELD_IMAGE, confidence=0.8),
+                 lambda d: print(f"🔍 Окно Rabby обнаружено через {time.monotonic() - d.timestamp:.3f}с после кадра"))
+# OCR дороже шаблона: только маленькая область и раз в 4 тика
+watcher.register(Cue("sign_button", text="Sign", region=sign_region, every=4))
+dialog_cues = [watcher.register(Cue(f"dialog_{text.lower()}", text=text, region=DIALOG_REGION, every=10),
+                                lambda d: log(f"Неожиданное окно Rabby ('{d.name}') в {d.point}", "WARNING")).name
+               for text in DIALOG_TEXTS]
+
+
+def unexpected_dialog():
+    """Неожиданное окно на экране (или None)"""
+    return next((d for d in map(watcher.present, dialog_cues) if d), None)
+
+
+with watcher:
+    print("Ожидаю появление поля Rabby Wallet...")
+    field = watcher.wait_for("password_field", timeout=40)
+    if not field:
+        print("❌ Поле пароля не найдено за 40 секунд.")
+        exit()
+
+    memory.record_hit("rabby_password_field", resolution, field.box)
+    print(f"Поле найдено на координатах {field.point}")
+    pyautogui.click(field.point)
+    time.sleep(0.3)
+    pyautogui.write('rabbywallet', interval=0.1)
+    pyautogui.press('enter')
+    print("Пароль введён и отправлен.")
+
+    # Ожидаем появления кнопки Sign (вместо фиксированной паузы)
+    print("Ожидаю появление кнопки Sign...")
+    sign = watcher.wait_for("sign_button", timeout=10)
+    if sign:
+        memory.record_hit("rabby_sign_button", resolution, sign.box)
+        sign_x, sign_y = sign.point
+    else:
+        # Текст не распознан - локальный UI детектор (если есть модель), затем известные координаты
+        from ui_detector import load_detector
+        detector = load_detector({"model": DETECTOR_MODEL}, log=log)
+        detection = detector.find("sign", grab_image()) if detector else None
+        if detection:
+            print(f"Кнопка Sign найдена UI детектором ({detection.confidence:.2f})")
+            memory.record_hit("rabby_sign_button", resolution, detection.box)
+            sign_x, sign_y = detection.center
+        else:
+            print("⚠️ Кнопка Sign не распознана, используем известные координаты")
+            sign_x, sign_y = SIGN_BUTTON_COORDS
+
+    dialog = unexpected_dialog()
+    if dialog:
+        print(f"❌ На экране неожиданное окно ('{dialog.name}'), Sign не нажимаем.")
+        exit()
+
+    print(f"Клик по кнопке Sign на координатах ({sign_x}, {sign_y})")
+    pyautogui.click(sign_x, sign_y)
+
+    # Повторный клик - только если окно подписи не закрылось
+    if sign and not watcher.wait_gone("sign_button", timeout=2):
+        print("Кнопка Sign всё ещё на экране, второй клик")
+        pyautogui.click(sign_x, sign_y)
+    elif not sign:
+        time.sleep(1)
+        print("Второй клик по кнопке Sign")
+        pyautogui.click(sign_x, sign_y)
+    print("✅ Кнопка Sign нажата!")
+
+print(f"Наблюдатель: {watcher.stats}")
+print("Скрипт завершён.")
@@ -0,0 +1,440 @@
+"""
+Оценка резолверов на размеченном корпусе скриншотов: точность, задержка, стоимость
+
+Каждый резолвер (шаблон click_by_screenshot, OCR find_text_box, эвристика зон,
+локальный UI детектор, vision модель, OCR + AI, план GPT-4o из ypp_work) запускается отдельно на каждом
+скриншоте корпуса. Сводка по резолверу и по паре резолвер/тип экрана:
+доля найденных и попавших в размеченный бокс, ошибка от центра бокса (p50/p95),
+задержка (p50/p95), вызовы моделей и стоимость (по журналу vision_ledger).
+
+Корпус - каталог с изображениями и labels.jsonl, одна строка на скриншот:
+    {"image": "perm_01.png", "screen": "permissions", "step": "smart_continue_click",
+     "boxes": [[1050, 700, 140, 44]], "command": "Нажми Continue",
+     "template": "screenshots/ypp/btn1.png"}
+    boxes    - допустимые цели в пикселях скриншота (попадание - в любой);
+    step     - тип smart_* шага ypp_stg (резолверы шага; без него - не запускаются);
+    command  - команда ypp_work (резолвер work_plan);
+    template - шаблон для резолвера template.
+
+Скриншоты подменяют экран (виртуальный дисплей screen_sim): резолверы видят
+изображение корпуса, размер экрана равен размеру изображения, мышь не двигается.
+Память расположения не участвует - она зависит от истории запусков.
+
+Пороги регрессии (--thresholds) - JSON с ключами "резолвер" или "резолвер/экран":
+    {"ocr_text": {"min_hit_rate": 0.9, "max_error_p95": 20, "max_latency_p95": 1.5,
+                  "max_cost_per_sample": 0.0}}
+С --baseline прошлый отчет (--report) сравнивается с текущим: падение доли
+попаданий больше --max-hit-drop или рост p95 задержки больше --max-latency-growth
+раз - нарушение. При нарушениях код выхода 1.
+
+Использование:
+python resolver_eval.py --generate corpus_sim --count 60
+python resolver_eval.py corpus_sim --resolvers template,ocr_text,heuristic --report eval.json
+python resolver_eval.py corpus --thresholds eval_thresholds.json --baseline eval.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from screen_capture import CaptureBackend, Frame, Region, set_capture
+from vision_ledger import percentile
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+Point = Tuple[int, int]
+
+STG_RESOLVERS = ("template", "ocr_text", "detector", "ai_vision", "ocr_ai", "heuristic")
+RESOLVERS = STG_RESOLVERS + ("work_plan",)
+
+# Конфигурация BrowserAutomation для оценки: без DevTools, дерева доступности, памяти и пауз
+EVAL_CONFIG = {
+    "screen": {"pace": 0},
+    "logging": {"level": "WARNING", "frames": 0},
+    "cdp": {"enabled": False},
+    "accessibility": {"enabled": False},
+    "memory": {"enabled": False},
+    "ledger": {"path": None},
+    "routing": {"stats_path": None},
+}
+
+
+@dataclass
+class Sample:
+    """Размеченный скриншот"""
+    image: str
+    boxes: List[Box]
+    screen: str = ""
+    step: Optional[str] = None
+    command: Optional[str] = None
+    template: Optional[str] = None
+
+
+@dataclass
+class Outcome:
+    """Результат одного резолвера на одном скриншоте"""
+    resolver: str
+    screen: str
+    image: str
+    point: Optional[Point]
+    hit: bool
+    error: Optional[float]  # расстояние до центра ближайшего бокса, px
+    latency: float
+    calls: int = 0  # вызовов моделей
+    cost: float = 0.0
+    failed: str = ""  # текст исключения резолвера
+
+
+def load_corpus(directory: str) -> List[Sample]:
+    samples = []
+    with open(os.path.join(directory, "labels.jsonl"), encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            data["image"] = os.path.join(directory, data["image"])
+            data["boxes"] = [tuple(box) for box in data.get("boxes") or [data.pop("box")]]
+            samples.append(Sample(**{key: value for key, value in data.items() if key in Sample.__annotations__}))
+    return samples
+
+
+def score(point: Optional[Point], boxes: Sequence[Box]) -> Tuple[bool, Optional[float]]:
+    """(попадание в любой бокс, расстояние до центра ближайшего бокса)"""
+    if point is None:
+        return False, None
+    x, y = point
+    hit = any(left <= x < left + width and top <= y < top + height for left, top, width, height in boxes)
+    error = min(math.dist(point, (left + width / 2, top + height / 2)) for left, top, width, height in boxes)
+    return hit, error
+
+
+class StaticScreen(CaptureBackend):
+    """Экран, показывающий текущий скриншот корпуса"""
+
+    name = "static"
+
+    def __init__(self):
+        super().__init__()
+        self.image = None
+        self.array = None
+
+    def show(self, image):
+        self.image = image.convert("RGB")
+        self.array = np.asarray(self.image)
+
+    def screen_size(self) -> Tuple[int, int]:
+        return self.image.size
+
+    def grab(self, region: Region = None) -> Frame:
+        region = self._full_region(region)
+        left, top, width, height = region
+        return Frame(self.array[top:top + height, left:left + width], time.monotonic(), next(self._seq), region)
+
+    def click(self, x: float, y: float):
+        pass  # резолверы не кликают; на случай эвристик с кликом - экран неизменен
+
+    def type_text(self, text: str):
+        pass
+
+    def press_key(self, key: str):
+        pass
+
+
+class Evaluator:
+    """Запуск резолверов по корпусу с замером задержки и стоимости"""
+
+    def __init__(self, resolvers: Sequence[str] = RESOLVERS, config: Dict = None, api_key: str = None,
+                 use_marks: bool = True, log: Callable[[str, str], None] = None):
+        """
+        Args:
+            resolvers: Какие резолверы запускать (RESOLVERS)
+            config: Конфигурация BrowserAutomation поверх EVAL_CONFIG (например, провайдеры vision)
+            api_key: OpenAI ключ для work_plan (по умолчанию OPENAI_API_KEY)
+            use_marks: Режим set-of-marks для work_plan
+            log: Функция логирования вида log(message, level)
+        """
+        self.resolvers = list(resolvers)
+        self.log = log or (lambda message, level="INFO": print(message) if level != "DEBUG" else None)
+        self.screen = StaticScreen()
+        set_capture(self.screen)
+
+        self.stg = None
+        if any(name in STG_RESOLVERS for name in self.resolvers):
+            # Виртуальный дисплей до импорта ypp_stg: размер экрана и скриншоты - из корпуса
+            from screen_sim import SimPyAutoGui
+            SimPyAutoGui(self.screen).install()
+            from ypp_stg import BrowserAutomation
+            self.stg = BrowserAutomation(_merge(EVAL_CONFIG, config or {}))
+
+        self.work = None
+        self.loop = None
+        if "work_plan" in self.resolvers:
+            from ypp_work import YuppAutomation
+            try:
+                self.work = YuppAutomation(api_key=api_key, cdp_port=None, use_marks=use_marks,
+                                           verify_actions=False, ledger_path=None, route_stats_path=None,
+                                           log_level="WARNING", pace=0)
+                self.loop = asyncio.new_event_loop()
+            except ValueError as e:
+                self.log(f"work_plan пропущен: {e}", "WARNING")
+
+    def _stg_resolver(self, name: str, sample: Sample) -> Optional[Callable[[object], Optional[Point]]]:
+        if self.stg is None or not sample.step or sample.step not in self.stg.SMART_TARGETS:
+            return None
+        if name == "template":
+            if not sample.template:
+                return None
+
+            def template(frame):
+                box = self.stg.locate_template(sample.template, self.stg.config["search"]["confidence_levels"],
+                                               image=frame.image)
+                return (box[0] + box[2] // 2, box[1] + box[3] // 2) if box else None
+            return template
+
+        strategies = dict(self.stg.smart_target_strategies(sample.step))
+        strategy = strategies.get(name)
+        if strategy is None:
+            return None
+        cancel = threading.Event()
+
+        def run(frame):
+            candidate = strategy(frame, cancel)
+            return tuple(candidate.point) if candidate else None
+        return run
+
+    def _work_plan(self, sample: Sample) -> Optional[Point]:
+        actions = self.loop.run_until_complete(self.work.analyze_screen(sample.command, sample.image))
+        for action in actions:
+            if action.action_type == "click" and action.coordinates:
+                # display_scale=1: координаты клика = пиксели скриншота
+                return tuple(action.coordinates)
+        return None
+
+    def _measure(self, name: str, sample: Sample, ledger, resolve: Callable[[], Optional[Point]]) -> Outcome:
+        before = len(ledger.records) if ledger else 0
+        failed = ""
+        started = time.perf_counter()
+        try:
+            point = resolve()
+        except Exception as e:
+            point, failed = None, str(e)
+        latency = time.perf_counter() - started
+        records = ledger.records[before:] if ledger else []
+        hit, error = score(point, sample.boxes)
+        return Outcome(name, sample.screen or "-", os.path.basename(sample.image), point, hit,
+                       None if error is None else round(error, 1), round(latency, 4),
+                       sum(1 for record in records if record.provider), sum(record.cost for record in records),
+                       failed)
+
+    def run(self, samples: Sequence[Sample]) -> List[Outcome]:
+        from PIL import Image
+
+        outcomes = []
+        for index, sample in enumerate(samples):
+            with Image.open(sample.image) as image:
+                self.screen.show(image)
+            if self.stg:
+                self.stg.frames.invalidate("sample")
+            for name in self.resolvers:
+                if name == "work_plan":
+                    if self.work is None or not sample.command:
+                        continue
+                    outcomes.append(self._measure(name, sample, self.work.ledger, lambda: self._work_plan(sample)))
+                    continue
+                resolver = self._stg_resolver(name, sample)
+                if resolver is None:
+                    continue
+                # Свежая обертка кадра: кэш OCR не должен переходить от резолвера к резолверу
+                frame = self.stg.as_shared_frame(self.screen.image)
+                outcomes.append(self._measure(name, sample, self.stg.ledger, lambda: resolver(frame)))
+            self.log(f"[{index + 1}/{len(samples)}] {os.path.basename(sample.image)}", "DEBUG")
+        return outcomes
+
+    def close(self):
+        if self.loop:
+            self.loop.run_until_complete(self.work.vision_client.close())
+            self.loop.close()
+
+
+def _merge(base: Dict, custom: Dict) -> Dict:
+    result = dict(base)
+    for key, value in custom.items():
+        result[key] = _merge(result[key], value) if isinstance(result.get(key), dict) and isinstance(value, dict) \
+            else value
+    return result
+
+
+def summarize(outcomes: Sequence[Outcome]) -> Dict[str, Dict]:
+    """Сводка по резолверу и по паре резолвер/экран"""
+    groups: Dict[str, List[Outcome]] = defaultdict(list)
+    for outcome in outcomes:
+        groups[outcome.resolver].append(outcome)
+        groups[f"{outcome.resolver}/{outcome.screen}"].append(outcome)
+
+    result = {}
+    for key, items in sorted(groups.items()):
+        errors = [item.error for item in items if item.error is not None]
+        latencies = [item.latency for item in items]
+        cost = sum(item.cost for item in items)
+        result[key] = {
+            "samples": len(items),
+            "found": sum(1 for item in items if item.point is not None),
+            "hits": sum(1 for item in items if item.hit),
+            "hit_rate": round(sum(1 for item in items if item.hit) / len(items), 3),
+            "failed": sum(1 for item in items if item.failed),
+            "error_p50": percentile(errors, 0.5),
+            "error_p95": percentile(errors, 0.95),
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p95": percentile(latencies, 0.95),
+            "calls": sum(item.calls for item in items),
+            "cost": round(cost, 5),
+            "cost_per_sample": round(cost / len(items), 6),
+        }
+    return result
+
+
+def check_thresholds(summary: Dict[str, Dict], thresholds: Dict[str, Dict] = None, baseline: Dict[str, Dict] = None,
+                     max_hit_drop: float = 0.05, max_latency_growth: float = 1.5) -> List[str]:
+    """Нарушения порогов и регрессии относительно прошлого отчета"""
+    violations = []
+    limits = {"min_hit_rate": ("hit_rate", lambda value, limit: value >= limit),
+              "max_error_p95": ("error_p95", lambda value, limit: value is None or value <= limit),
+              "max_latency_p95": ("latency_p95", lambda value, limit: value <= limit),
+              "max_cost_per_sample": ("cost_per_sample", lambda value, limit: value <= limit)}
+    for key, rules in (thresholds or {}).items():
+        stats = summary.get(key)
+        if stats is None:
+            violations.append(f"{key}: нет результатов")
+            continue
+        for rule, limit in rules.items():
+            metric, passes = limits[rule]
+            if not passes(stats[metric], limit):
+                violations.append(f"{key}: {metric} {stats[metric]} нарушает {rule} {limit}")
+
+    for key, previous in (baseline or {}).items():
+        stats = summary.get(key)
+        if stats is None:
+            continue
+        if stats["hit_rate"] < previous["hit_rate"] - max_hit_drop:
+            violations.append(f"{key}: доля попаданий {previous['hit_rate']} -> {stats['hit_rate']}")
+        if previous["latency_p95"] and stats["latency_p95"] > previous["latency_p95"] * max_latency_growth \
+                and stats["latency_p95"] - previous["latency_p95"] > 0.05:
+            violations.append(f"{key}: p95 задержки {previous['latency_p95']:.3f}с -> {stats['latency_p95']:.3f}с")
+    return violations
+
+
+def generate_corpus(directory: str, count: int, seed: int = None) -> List[Sample]:
+    """Синтетический корпус из screen_sim (боксы - точные границы элементов)"""
+    from screen_sim import RESOLUTIONS, THEMES, SimScreen
+
+    scenes = [
+        ("google_signin", "signin_page", "smart_google_click", ["google_button"], None),
+        ("google_chooser", "account_chooser", "smart_email_click", ["email_account"], None),
+        ("google_permissions", "permissions", "smart_continue_click", ["continue_button"], None),
+        ("yupp_chat", "in_app", None, ["prefer_a", "prefer_b"], "Нажми кнопку I prefer this"),
+    ]
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    samples = []
+    with open(os.path.join(directory, "labels.jsonl"), "w", encoding="utf-8") as f:
+        for index in range(count):
+            scene, screen_type, step, targets, command = scenes[index % len(scenes)]
+            screen = SimScreen(scene, size=rng.choice(RESOLUTIONS), theme=rng.choice(list(THEMES)),
+                               seed=rng.randrange(1 << 30))
+            if scene == "yupp_chat":
+                screen.messages.append(("user", "What is the tallest mountain?"))
+                screen.version += 1
+            name = f"{index:04d}_{scene}.png"
+            screen.image().save(os.path.join(directory, name))
+            boxes = [screen.targets[target] for target in targets]
+            sample = Sample(name, boxes, screen_type, step, command)
+            f.write(json.dumps({key: value for key, value in asdict(sample).items() if value is not None},
+                               ensure_ascii=False) + "\n")
+            samples.append(sample)
+    return samples
+
+
+def print_summary(summary: Dict[str, Dict]):
+    print(f"{'резолвер/экран':<34} {'n':>4} {'найд.':>5} {'попад.':>7} {'ош.p50':>7} {'ош.p95':>7} "
+          f"{'p50,с':>7} {'p95,с':>7} {'выз.':>5} {'$':>8}")
+    print("-" * 104)
+
+    def number(value, digits=1):
+        return f"{value:.{digits}f}" if value is not None else "-"
+
+    for key, stats in summary.items():
+        print(f"{key:<34} {stats['samples']:>4} {stats['found']:>5} {stats['hit_rate']:>7.1%} "
+              f"{number(stats['error_p50']):>7} {number(stats['error_p95']):>7} "
+              f"{number(stats['latency_p50'], 3):>7} {number(stats['latency_p95'], 3):>7} "
+              f"{stats['calls']:>5} {stats['cost']:>8.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Оценка резолверов на размеченных скриншотах")
+    parser.add_argument("corpus", nargs="?", help="Каталог корпуса с labels.jsonl")
+    parser.add_argument("--resolvers", default=",".join(RESOLVERS), help="Резолверы через запятую")
+    parser.add_argument("--config", help="JSON конфигурация BrowserAutomation (провайдеры vision и т.п.)")
+    parser.add_argument("--coords", action="store_true", help="work_plan без set-of-marks")
+    parser.add_argument("--report", help="Сохранить сводку и результаты в JSON")
+    parser.add_argument("--thresholds", help="JSON с порогами по резолверам")
+    parser.add_argument("--baseline", help="Прошлый отчет (--report) для проверки регрессий")
+    parser.add_argument("--max-hit-drop", type=float, default=0.05)
+    parser.add_argument("--max-latency-growth", type=float, default=1.5)
+    parser.add_argument("--generate", help="Создать синтетический корпус в каталоге и выйти")
+    parser.add_argument("--count", type=int, default=40, help="Скриншотов синтетического корпуса")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.generate:
+        samples = generate_corpus(args.generate, args.count, args.seed)
+        print(f"Корпус {args.generate}: {len(samples)} скриншотов")
+        return
+    if not args.corpus:
+        parser.error("нужен каталог корпуса или --generate")
+
+    config = None
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            config = json.load(f)
+    samples = load_corpus(args.corpus)
+    evaluator = Evaluator(args.resolvers.split(","), config=config, use_marks=not args.coords)
+    try:
+        outcomes = evaluator.run(samples)
+    finally:
+        evaluator.close()
+
+    summary = summarize(outcomes)
+    print_summary(summary)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"corpus": args.corpus, "summary": summary,
+                       "outcomes": [asdict(outcome) for outcome in outcomes]}, f, ensure_ascii=False, indent=1)
+
+    thresholds = baseline = None
+    if args.thresholds:
+        with open(args.thresholds, encoding="utf-8") as f:
+            thresholds = json.load(f)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["summary"]
+    violations = check_thresholds(summary, thresholds, baseline, args.max_hit_drop, args.max_latency_growth)
+    for violation in violations:
+        print(f"❌ {violation}")
+    if violations:
+        sys.exit(1)
+    if thresholds or baseline:
+        print("✅ Пороги соблюдены")
+
+
+if __name__ == "__main__":
+    main()
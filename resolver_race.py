@@ -0,0 +1,165 @@
+"""
+Параллельный запуск стратегий поиска элемента ("гонка резолверов")
+
+Независимые стратегии (OCR, AI vision, OCR + AI, эвристики по зонам) запускаются
+одновременно на одном и том же кадре. Принимается первый результат с уверенностью
+не ниже порога, либо лучший результат к дедлайну. Проигравшие отменяются: еще не
+начатые задачи снимаются с пула, уже запущенные получают флаг отмены (стратегии
+проверяют его перед платными запросами и передают в клиент моделей, который
+снимает запросы в полете), а их результат игнорируется.
+
+Каждая стратегия гонки получает свой поток: если стратегий и еще не завершившихся
+стратегий прошлых гонок больше, чем потоков пула, создается новый пул, а старый
+дорабатывает отставших и закрывается.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+
+@dataclass
+class Candidate:
+    """Найденная точка клика"""
+    point: Tuple[int, int]
+    confidence: float  # 0-1
+    strategy: str = ""
+    box: Tuple[int, int, int, int] = None  # left, top, width, height, если известен
+
+
+# Стратегия: (кадр, флаг отмены) -> Candidate или None
+Strategy = Callable[[Any, threading.Event], Optional[Candidate]]
+
+
+class ResolverRace:
+    """Комбинатор стратегий поиска со статистикой побед и задержек"""
+
+    def __init__(self, max_workers: int = 6, log: Callable[[str, str], None] = None):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resolver")
+        self.log = log or (lambda message, level="INFO": None)
+        self.stats: Dict[str, Dict] = {}
+        # Отмененные, но еще работающие стратегии прошлых гонок (занимают потоки пула)
+        self._stragglers: Set[Future] = set()
+
+    def _reserve(self, count: int):
+        """Свободные потоки для count стратегий: ни одна не ждет в очереди пула"""
+        self._stragglers = {future for future in self._stragglers if not future.done()}
+        if count + len(self._stragglers) <= self.max_workers:
+            return
+        self.log(f"Пул стратегий: {len(self._stragglers)} отставших, новый пул на "
+                 f"{max(self.max_workers, count)} потоков", "DEBUG")
+        self.executor.shutdown(wait=False)
+        self.max_workers = max(self.max_workers, count)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="resolver")
+        self._stragglers = set()
+
+    def _stats_for(self, name: str) -> Dict:
+        return self.stats.setdefault(name, {
+            "runs": 0, "hits": 0, "wins": 0, "errors": 0, "cancelled": 0,
+            "latencies": deque(maxlen=200)
+        })
+
+    def _run(self, name: str, strategy: Strategy, frame: Any,
+             cancel: threading.Event) -> Tuple[Optional[Candidate], float]:
+        """Запуск одной стратегии с замером времени"""
+        start = time.monotonic()
+        try:
+            candidate = strategy(frame, cancel)
+        except Exception as e:
+            self._stats_for(name)["errors"] += 1
+            self.log(f"Стратегия '{name}' упала: {e}", "DEBUG")
+            candidate = None
+        if candidate:
+            candidate.strategy = name
+        return candidate, time.monotonic() - start
+
+    def race(self, strategies: List[Tuple[str, Strategy]], frame: Any,
+             threshold: float = 0.8, deadline: float = 25.0,
+             abort: threading.Event = None) -> Optional[Candidate]:
+        """
+        Гонка стратегий на одном кадре
+
+        Args:
+            strategies: Пары (имя, стратегия)
+            frame: Общий кадр экрана для всех стратегий
+            threshold: Уверенность, при которой результат принимается сразу
+            deadline: Максимальное время гонки, с
+            abort: Внешняя отмена (например, шага): гонка завершается, стратегии отменяются
+
+        Returns:
+            Победивший кандидат или None
+        """
+        cancel = threading.Event()
+        futures: Dict[Future, str] = {}
+        self._reserve(len(strategies))
+        for name, strategy in strategies:
+            self._stats_for(name)["runs"] += 1
+            # Контекст шага (лог, атрибуция вызовов моделей) переходит в поток стратегии
+            context = contextvars.copy_context()
+            futures[self.executor.submit(context.run, self._run, name, strategy, frame, cancel)] = name
+
+        best: Optional[Candidate] = None
+        pending = set(futures)
+        end_time = time.monotonic() + deadline
+
+        while pending:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0 or (abort is not None and abort.is_set()):
+                break
+
+            timeout = remaining if abort is None else min(remaining, 0.1)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                candidate, latency = future.result()
+                stats = self._stats_for(futures[future])
+                stats["latencies"].append(latency)
+                if not candidate:
+                    continue
+
+                stats["hits"] += 1
+                if not best or candidate.confidence > best.confidence:
+                    best = candidate
+
+            if best and best.confidence >= threshold:
+                break
+
+        # Отменяем проигравших
+        cancel.set()
+        for future in pending:
+            if not future.cancel():
+                self._stragglers.add(future)
+            self._stats_for(futures[future])["cancelled"] += 1
+
+        if best:
+            self._stats_for(best.strategy)["wins"] += 1
+            self.log(f"Гонку выиграла стратегия '{best.strategy}' "
+                     f"(уверенность {best.confidence:.2f}): {best.point}", "DEBUG")
+        elif pending:
+            self.log(f"Дедлайн {deadline}с истек, результата нет", "WARNING")
+
+        return best
+
+    def summary(self) -> Dict[str, Dict]:
+        """Статистика стратегий: запуски, находки, победы, p50/p95 задержки"""
+        result = {}
+        for name, stats in self.stats.items():
+            latencies = sorted(stats["latencies"])
+            result[name] = {
+                "runs": stats["runs"],
+                "hits": stats["hits"],
+                "wins": stats["wins"],
+                "errors": stats["errors"],
+                "cancelled": stats["cancelled"],
+                "p50": latencies[len(latencies) // 2] if latencies else None,
+                "p95": latencies[max(0, int(len(latencies) * 0.95) - 1)] if latencies else None
+            }
+        return result
+
+    def shutdown(self):
+        """Остановка пула без ожидания зависших стратегий"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
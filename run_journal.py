@@ -0,0 +1,130 @@
+"""
+Журнал выполнения скрипта с продолжением после сбоя
+
+Каждая выполненная команда (ypp_work.run_script) или шаг (ypp_stg.run_automation)
+сразу дописывается в JSONL журнал: номер, имя и выполненные действия. Перед
+следующей командой к записи добавляется хэш экрана, на котором она начинается.
+Если запуск оборвался (ошибка API, падение, перезагрузка), следующий запуск
+того же скрипта в том же профиле продолжает с первой невыполненной команды -
+уже сделанные переходы, ожидания и платные вызовы моделей не повторяются.
+
+Перед продолжением текущий экран сверяется с журналом (dHash, расстояние
+Хэмминга): продолжаем после последней выполненной команды, чей экран совпадает
+с текущим. Если экран не совпал ни с одной - скрипт начинается заново.
+
+Один файл на скрипт и профиль (каталог run_journal/, имя - профиль и хэш списка
+команд): параллельные профили не пишут в общий файл, измененный скрипт не
+подхватывает чужой журнал. После успешного завершения файл удаляется.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from frame_provider import SharedFrame, hamming
+
+
+def screen_hash(image, size: int = 16) -> Optional[int]:
+    """dHash изображения экрана (None - изображения нет)"""
+    if image is None:
+        return None
+    frame = image if isinstance(image, SharedFrame) else SharedFrame(image)
+    return frame.dhash(size)
+
+
+class RunJournal:
+    """Журнал выполненных команд одного скрипта в одном профиле"""
+
+    def __init__(self, items: Sequence, script: str = "script", profile: str = "default",
+                 directory: str = "run_journal", hash_threshold: int = 12,
+                 log: Callable[[str, str], None] = None):
+        """
+        Args:
+            items: Команды или шаги скрипта (по ним считается ключ журнала)
+            script, profile: Имя скрипта и профиль (в имени файла)
+            directory: Каталог журналов
+            hash_threshold: Максимальное расстояние Хэмминга, при котором экран считается тем же
+            log: Функция логирования вида log(message, level)
+        """
+        self.items = list(items)
+        self.hash_threshold = hash_threshold
+        self.log = log or (lambda message, level="INFO": None)
+        digest = hashlib.sha1(json.dumps(self.items, ensure_ascii=False, sort_keys=True,
+                                         default=str).encode()).hexdigest()[:12]
+        slug = re.sub(r"[^\w.-]+", "_", f"{script}_{profile}")
+        self.path = os.path.join(directory, f"{slug}_{digest}.jsonl")
+        self.completed: Dict[int, Dict] = self._load()
+
+    def _load(self) -> Dict[int, Dict]:
+        completed = {}
+        if not os.path.exists(self.path):
+            return completed
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # строка, оборванная при сбое
+                if entry.get("status") == "done":
+                    completed[entry["index"]] = entry
+        return completed
+
+    def resume_index(self, current_hash: Optional[int] = None) -> int:
+        """
+        С какой команды продолжать (0 - с начала)
+
+        Args:
+            current_hash: Хэш текущего экрана (None - без сверки)
+        """
+        done = 0
+        while done in self.completed:
+            done += 1
+        if not done:
+            return 0
+        if current_hash is None:
+            return done
+
+        # Последняя выполненная команда, после которой экран был таким же, как сейчас
+        for index in range(done - 1, -1, -1):
+            saved = self.completed[index].get("screen_hash")
+            if saved is None or hamming(int(saved), current_hash) <= self.hash_threshold:
+                if index + 1 < done:
+                    self.log(f"Экран совпал с состоянием после команды {index + 1} из {done} выполненных", "WARNING")
+                return index + 1
+        self.log("Экран не совпал с журналом, скрипт выполняется заново", "WARNING")
+        return 0
+
+    def complete(self, index: int, name: str, actions: List[Dict] = None, current_hash: Optional[int] = None,
+                 **fields):
+        """Команда выполнена: запись в журнал (сразу на диск)"""
+        self._write({"ts": round(time.time(), 3), "index": index, "name": name, "status": "done",
+                     "actions": actions or [], "screen_hash": current_hash, **fields})
+
+    def mark_screen(self, index: int, current_hash: Optional[int]):
+        """
+        Хэш экрана после выполненной команды index - снимается перед следующей командой,
+        когда экран уже перешел в новое состояние (при чтении последняя запись индекса главнее)
+        """
+        entry = self.completed.get(index)
+        if entry is None or current_hash is None or entry.get("screen_hash") == current_hash:
+            return
+        self._write({**entry, "screen_hash": current_hash})
+
+    def _write(self, entry: Dict):
+        self.completed[entry["index"]] = entry
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def finish(self):
+        """Скрипт выполнен целиком: журнал больше не нужен"""
+        self.completed.clear()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,179 @@
+"""
+Структурированный лог с ленивым форматированием и бортовым самописцем
+
+RunLogger совместим с прежним log(message, level): его можно передавать во все
+модули как функцию логирования. Дополнительно:
+    - ленивое форматирование: log("Экран %sx%s", "DEBUG", width, height) -
+      строка собирается только если запись выводится или попадает в дамп;
+    - фильтр по уровню для консоли и отдельный для JSONL файла;
+    - вывод в консоль иконками (как раньше) или JSON строками;
+    - контекст (шаг, команда) добавляется к каждой записи: with log.scope(step=...);
+      контекст хранится в contextvars - у каждого потока и asyncio задачи свой,
+      поэтому записи фоновых потоков (гонка, наблюдатель, проверка) не получают
+      чужой шаг. Пулы, которые выполняют работу шага, передают контекст сами
+      (copy_context().run), как ResolverRace и HedgedVisionClient.run_sync;
+    - бортовой самописец: кольцевой буфер последних записей всех уровней (в том
+      числе отфильтрованных DEBUG) и последних кадров экрана. На диск он пишется
+      только при сбое (dump): events.jsonl с записями и кадрами по времени и
+      уменьшенные кадры frame_<номер>.png (seq кадра - в events.jsonl).
+
+Запись в буфер - одна вставка кортежа в deque, кадры хранятся ссылками и
+уменьшаются только при дампе.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "AI": 20, "ACTION": 20, "SUCCESS": 25, "WARNING": 30, "ERROR": 40}
+ICONS = {
+    "DEBUG": "🔍", "INFO": "ℹ️", "AI": "🤖", "ACTION": "⚡",
+    "SUCCESS": "✅", "WARNING": "⚠️", "ERROR": "❌"
+}
+
+# Поля контекста записей (шаг, команда) текущего потока или asyncio задачи
+_CONTEXT: ContextVar[Optional[Dict[str, Any]]] = ContextVar("run_log_context", default=None)
+
+
+def _format(message: Any, args: tuple) -> str:
+    if callable(message):
+        return str(message())
+    if args:
+        try:
+            return message % args
+        except (TypeError, ValueError):
+            return " ".join([str(message), *map(str, args)])
+    return str(message)
+
+
+class RunLogger:
+    """Функция логирования вида log(message, level, *args) с кольцевым буфером для дампа при сбое"""
+
+    def __init__(self, name: str = "run", level: str = "INFO", json_console: bool = False,
+                 file: Optional[str] = None, file_level: str = "DEBUG", ring_size: int = 2000,
+                 frames: int = 4, frame_side: int = 800, dump_dir: str = "flight_records", stream=None):
+        """
+        Args:
+            name: Имя запуска (в JSON записях и именах дампов)
+            level: Минимальный уровень для консоли
+            json_console: Печатать JSON строки вместо иконок
+            file: JSONL файл для всех записей от file_level (None - без файла)
+            ring_size: Сколько последних записей держать для дампа
+            frames: Сколько последних кадров держать для дампа (0 - без кадров)
+            frame_side: Большая сторона кадра в дампе, px
+            dump_dir: Каталог дампов
+        """
+        self.name = name
+        self.threshold = LEVELS.get(level, 20)
+        self.json_console = json_console
+        self.file_threshold = LEVELS.get(file_level, 10)
+        self.frame_side = frame_side
+        self.dump_dir = dump_dir
+        self.stream = stream or sys.stdout
+
+        self.records: deque = deque(maxlen=ring_size)
+        self.frames: deque = deque(maxlen=frames) if frames else None
+        self._file = open(file, "a", encoding="utf-8", buffering=1) if file else None
+        self._lock = threading.Lock()
+        self.stats = {"records": 0, "emitted": 0, "dumps": 0}
+
+    @property
+    def context(self) -> Dict[str, Any]:
+        """Контекст записей текущего потока или задачи"""
+        return _CONTEXT.get() or {}
+
+    # --- запись ---
+
+    def __call__(self, message: Any, level: str = "INFO", *args, **fields):
+        """
+        Args:
+            message: Строка, шаблон с %-подстановками (args) или функция, возвращающая строку
+            level: DEBUG, INFO, AI, ACTION, SUCCESS, WARNING, ERROR
+            fields: Структурированные поля записи
+        """
+        context = self.context
+        record = (time.time(), level, message, args, {**context, **fields} if fields else context)
+        self.records.append(record)
+        self.stats["records"] += 1
+
+        severity = LEVELS.get(level, 20)
+        to_console = severity >= self.threshold
+        to_file = self._file is not None and severity >= self.file_threshold
+        if not (to_console or to_file):
+            return
+        self.stats["emitted"] += 1
+        text = _format(message, args)
+        if to_file:
+            self._file.write(self._json(record, text) + "\n")
+        if to_console:
+            line = self._json(record, text) if self.json_console else f"{ICONS.get(level, 'ℹ️')} {text}"
+            print(line, file=self.stream)
+
+    def enabled(self, level: str) -> bool:
+        """Выводится ли уровень (для дорогих вычислений перед вызовом)"""
+        severity = LEVELS.get(level, 20)
+        return severity >= self.threshold or (self._file is not None and severity >= self.file_threshold)
+
+    def _json(self, record: tuple, text: str) -> str:
+        timestamp, level, _, _, fields = record
+        return json.dumps({"ts": round(timestamp, 3), "run": self.name, "level": level, "msg": text, **fields},
+                          ensure_ascii=False, default=str)
+
+    @contextmanager
+    def scope(self, **fields):
+        """Контекст записей: with log.scope(step="google_click"): ..."""
+        token = _CONTEXT.set({**self.context, **fields})
+        try:
+            yield self
+        finally:
+            _CONTEXT.reset(token)
+
+    def frame(self, frame, tag: str = ""):
+        """Кадр экрана в буфер самописца (SharedFrame или PIL изображение; хранится ссылка)"""
+        if self.frames is not None and frame is not None:
+            self.frames.append((time.time(), getattr(frame, "seq", None), tag, frame))
+
+    # --- дамп ---
+
+    def dump(self, reason: str) -> Optional[str]:
+        """Запись буфера и кадров на диск; возвращает каталог дампа"""
+        with self._lock:
+            records = list(self.records)
+            frames = list(self.frames or [])
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            slug = re.sub(r"[^\w.-]+", "_", reason)[:60]
+            path = os.path.join(self.dump_dir, f"{stamp}_{self.name}_{slug}")
+            try:
+                os.makedirs(path, exist_ok=True)
+                lines = [(record[0], self._json(record, _format(record[2], record[3]))) for record in records]
+                for index, (timestamp, seq, tag, frame) in enumerate(frames):
+                    file_name = f"frame_{index:02d}.png"
+                    image = getattr(frame, "image", frame).copy()
+                    image.thumbnail((self.frame_side, self.frame_side))
+                    image.save(os.path.join(path, file_name), optimize=True)
+                    lines.append((timestamp, json.dumps({"ts": round(timestamp, 3), "run": self.name,
+                                                         "frame": file_name, "seq": seq, "tag": tag},
+                                                        ensure_ascii=False)))
+                lines.sort(key=lambda line: line[0])
+                with open(os.path.join(path, "events.jsonl"), "w", encoding="utf-8") as f:
+                    f.write(json.dumps({"run": self.name, "reason": reason, "context": self.context},
+                                       ensure_ascii=False, default=str) + "\n")
+                    f.writelines(line + "\n" for _, line in lines)
+            except Exception as e:
+                print(f"{ICONS['WARNING']} Не удалось сохранить дамп {path}: {e}", file=self.stream)
+                return None
+            self.stats["dumps"] += 1
+        self("Дамп самописца: %s (%d записей, %d кадров)", "WARNING", path, len(records), len(frames))
+        return path
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,379 @@
+"""
+Слой захвата экрана с подключаемыми бэкендами
+
+    xshm       - Linux/X11 через расширение MIT-SHM: сервер пишет кадр прямо
+                 в разделяемую память, оттуда одна копия в массив кадра;
+                 поддерживается захват только области
+    imagegrab  - PIL.ImageGrab (macOS, Windows, X11 без SHM)
+    pyautogui  - pyautogui.screenshot() (на Linux вызывает внешнюю утилиту)
+
+Кадр получает монотонную метку времени и порядковый номер. Массив кадра
+принадлежит кадру: буфер xshm копируется под блокировкой бэкенда, поэтому
+захваты из разных потоков (стратегии поиска, проверка кликов, наблюдатель
+всплывающих окон) не портят кадры друг друга, а сегменты можно отсоединять.
+
+Использование:
+    from screen_capture import get_capture
+    frame = get_capture().grab(region=(left, top, width, height))
+"""
+
+import ctypes
+import ctypes.util
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+Region = Tuple[int, int, int, int]  # left, top, width, height
+
+
+@dataclass
+class Frame:
+    """Кадр экрана"""
+    array: np.ndarray  # HxWxC
+    timestamp: float  # time.monotonic() момента захвата
+    seq: int  # порядковый номер кадра в бэкенде
+    region: Region  # область экрана, которую покрывает кадр
+    channels: str = "RGB"  # порядок каналов массива: RGB или BGRA
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return (self.region[2], self.region[3])
+
+    def copy(self) -> "Frame":
+        """Копия кадра, не зависящая от буфера бэкенда"""
+        return Frame(self.array.copy(), self.timestamp, self.seq, self.region, self.channels)
+
+    def rgb(self) -> np.ndarray:
+        """Массив HxWx3 в порядке RGB (для BGRA - копия)"""
+        if self.channels == "RGB":
+            return self.array
+        return np.ascontiguousarray(self.array[..., 2::-1])
+
+    def to_pil(self):
+        """PIL изображение RGB (одна копия данных)"""
+        from PIL import Image
+
+        if self.channels == "RGB":
+            return Image.fromarray(self.array)
+        data = np.ascontiguousarray(self.array)
+        return Image.frombuffer("RGB", self.size, data, "raw", "BGRX", 0, 1)
+
+
+class CaptureBackend:
+    """Базовый бэкенд захвата"""
+
+    name = "base"
+
+    def __init__(self):
+        self._seq = itertools.count(1)
+
+    def screen_size(self) -> Tuple[int, int]:
+        raise NotImplementedError
+
+    def grab(self, region: Region = None) -> Frame:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _full_region(self, region: Optional[Region]) -> Region:
+        if region:
+            return tuple(int(v) for v in region)
+        width, height = self.screen_size()
+        return (0, 0, width, height)
+
+
+class PyAutoGuiBackend(CaptureBackend):
+    """Захват через pyautogui.screenshot() (текущий путь ypp_stg.py)"""
+
+    name = "pyautogui"
+
+    def screen_size(self) -> Tuple[int, int]:
+        import pyautogui
+        return tuple(pyautogui.size())
+
+    def grab(self, region: Region = None) -> Frame:
+        import pyautogui
+
+        image = pyautogui.screenshot(region=region) if region else pyautogui.screenshot()
+        timestamp = time.monotonic()
+        array = np.asarray(image.convert("RGB"))
+        return Frame(array, timestamp, next(self._seq),
+                     tuple(region) if region else (0, 0, image.width, image.height))
+
+
+class ImageGrabBackend(CaptureBackend):
+    """Захват через PIL.ImageGrab (текущий путь ypp_work.py)"""
+
+    name = "imagegrab"
+
+    def screen_size(self) -> Tuple[int, int]:
+        from PIL import ImageGrab
+        return ImageGrab.grab().size
+
+    def grab(self, region: Region = None) -> Frame:
+        from PIL import ImageGrab
+
+        bbox = None
+        if region:
+            left, top, width, height = region
+            bbox = (left, top, left + width, top + height)
+        image = ImageGrab.grab(bbox=bbox)
+        timestamp = time.monotonic()
+        array = np.asarray(image.convert("RGB"))
+        return Frame(array, timestamp, next(self._seq),
+                     tuple(region) if region else (0, 0, image.width, image.height))
+
+
+class _XImage(ctypes.Structure):
+    """Начало структуры XImage (поля до bits_per_pixel и масок)"""
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+    ]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class XShmBackend(CaptureBackend):
+    """
+    Захват X11 через MIT-SHM
+
+    Для каждого размера области создается свой сегмент разделяемой памяти
+    (кэш последних max_segments размеров), XShmGetImage заполняет его напрямую.
+    """
+
+    name = "xshm"
+
+    ZPIXMAP = 2
+    IPC_PRIVATE = 0
+    IPC_CREAT = 0o1000
+    IPC_RMID = 0
+    ALL_PLANES = ctypes.c_ulong(-1).value
+
+    def __init__(self, display: str = None, max_segments: int = 4):
+        super().__init__()
+        self.xlib = self._load("X11")
+        self.xext = self._load("Xext")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._declare()
+
+        self.display = self.xlib.XOpenDisplay(display.encode() if display else None)
+        if not self.display:
+            raise RuntimeError("Не удалось открыть X дисплей")
+        if not self.xext.XShmQueryExtension(self.display):
+            self.xlib.XCloseDisplay(self.display)
+            raise RuntimeError("X сервер не поддерживает MIT-SHM")
+
+        screen = self.xlib.XDefaultScreen(self.display)
+        self.root = self.xlib.XDefaultRootWindow(self.display)
+        self.visual = self.xlib.XDefaultVisual(self.display, screen)
+        self.depth = self.xlib.XDefaultDepth(self.display, screen)
+        self.width = self.xlib.XDisplayWidth(self.display, screen)
+        self.height = self.xlib.XDisplayHeight(self.display, screen)
+
+        self.max_segments = max_segments
+        self.segments: "OrderedDict[Tuple[int, int], Tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _load(name: str) -> ctypes.CDLL:
+        path = ctypes.util.find_library(name)
+        if not path:
+            raise RuntimeError(f"Библиотека lib{name} не найдена")
+        return ctypes.CDLL(path)
+
+    def _declare(self):
+        """Сигнатуры функций Xlib/XShm/libc"""
+        xlib, xext, libc = self.xlib, self.xext, self.libc
+        p = ctypes.c_void_p
+
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XOpenDisplay.restype = p
+        xlib.XCloseDisplay.argtypes = [p]
+        xlib.XDefaultScreen.argtypes = [p]
+        xlib.XDefaultRootWindow.argtypes = [p]
+        xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        xlib.XDefaultVisual.argtypes = [p, ctypes.c_int]
+        xlib.XDefaultVisual.restype = p
+        xlib.XDefaultDepth.argtypes = [p, ctypes.c_int]
+        xlib.XDisplayWidth.argtypes = [p, ctypes.c_int]
+        xlib.XDisplayHeight.argtypes = [p, ctypes.c_int]
+        xlib.XDestroyImage.argtypes = [p]
+        xlib.XSync.argtypes = [p, ctypes.c_int]
+
+        xext.XShmQueryExtension.argtypes = [p]
+        xext.XShmCreateImage.argtypes = [p, p, ctypes.c_uint, ctypes.c_int, p,
+                                         ctypes.POINTER(_XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint]
+        xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        xext.XShmAttach.argtypes = [p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [p, ctypes.c_ulong, ctypes.POINTER(_XImage),
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.argtypes = [ctypes.c_int, p, ctypes.c_int]
+        libc.shmat.restype = p
+        libc.shmdt.argtypes = [p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, p]
+
+    def screen_size(self) -> Tuple[int, int]:
+        return (self.width, self.height)
+
+    def _segment(self, width: int, height: int) -> Tuple:
+        """Сегмент разделяемой памяти и XImage для размера области"""
+        key = (width, height)
+        if key in self.segments:
+            self.segments.move_to_end(key)
+            return self.segments[key]
+
+        info = _XShmSegmentInfo()
+        image = self.xext.XShmCreateImage(self.display, self.visual, self.depth, self.ZPIXMAP,
+                                          None, ctypes.byref(info), width, height)
+        if not image:
+            raise RuntimeError("XShmCreateImage не удался")
+
+        size = image.contents.bytes_per_line * image.contents.height
+        info.shmid = self.libc.shmget(self.IPC_PRIVATE, size, self.IPC_CREAT | 0o600)
+        if info.shmid < 0:
+            self.xlib.XDestroyImage(image)
+            raise OSError(ctypes.get_errno(), "shmget не удался")
+
+        address = self.libc.shmat(info.shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            self.libc.shmctl(info.shmid, self.IPC_RMID, None)
+            self.xlib.XDestroyImage(image)
+            raise OSError(ctypes.get_errno(), "shmat не удался")
+
+        info.shmaddr = address
+        info.readOnly = 0
+        image.contents.data = address
+        self.xext.XShmAttach(self.display, ctypes.byref(info))
+        self.xlib.XSync(self.display, 0)
+        # Сегмент удалится системой, когда от него отсоединятся все процессы
+        self.libc.shmctl(info.shmid, self.IPC_RMID, None)
+
+        ximage = image.contents
+        if ximage.bits_per_pixel != 32:
+            self._release((info, image, None))
+            raise RuntimeError(f"Неподдерживаемый формат пикселей: {ximage.bits_per_pixel} bpp")
+        buffer = (ctypes.c_ubyte * size).from_address(address)
+        array = np.ctypeslib.as_array(buffer).reshape(
+            height, ximage.bytes_per_line // 4, 4)[:, :width, :]
+
+        segment = (info, image, array)
+        self.segments[key] = segment
+        if len(self.segments) > self.max_segments:
+            _, old = self.segments.popitem(last=False)
+            self._release(old)
+        return segment
+
+    def _release(self, segment: Tuple):
+        info, image, _ = segment
+        self.xext.XShmDetach(self.display, ctypes.byref(info))
+        image.contents.data = None
+        self.xlib.XDestroyImage(image)
+        self.libc.shmdt(info.shmaddr)
+
+    def grab(self, region: Region = None) -> Frame:
+        # Область за краем экрана X сервер отклонит (BadMatch) - обрезаем
+        left, top, width, height = self._full_region(region)
+        left, top = max(0, min(left, self.width - 1)), max(0, min(top, self.height - 1))
+        width = max(1, min(width, self.width - left))
+        height = max(1, min(height, self.height - top))
+        with self.lock:
+            info, image, array = self._segment(width, height)
+            if not self.xext.XShmGetImage(self.display, self.root, image, left, top, self.ALL_PLANES):
+                raise RuntimeError(f"XShmGetImage не удался для области {(left, top, width, height)}")
+            timestamp = time.monotonic()
+            # Копия до снятия блокировки: буфер сегмента перезапишет следующий захват этого размера,
+            # а вытесненный сегмент отсоединяется (shmdt) - ссылок на него у кадров быть не должно
+            return Frame(array.copy(), timestamp, next(self._seq), (left, top, width, height), "BGRA")
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments.values():
+                self._release(segment)
+            self.segments.clear()
+            if self.display:
+                self.xlib.XCloseDisplay(self.display)
+                self.display = None
+
+
+BACKENDS = {
+    "xshm": XShmBackend,
+    "imagegrab": ImageGrabBackend,
+    "pyautogui": PyAutoGuiBackend,
+}
+
+
+def create_backend(name: str = "auto") -> CaptureBackend:
+    """
+    Создание бэкенда по имени; "auto" - самый быстрый доступный
+
+    Имя по умолчанию можно задать переменной окружения SCREEN_CAPTURE_BACKEND.
+    """
+    name = os.getenv("SCREEN_CAPTURE_BACKEND", name) if name == "auto" else name
+    if name != "auto":
+        return BACKENDS[name]()
+
+    if sys.platform.startswith("linux") and os.getenv("DISPLAY"):
+        try:
+            return XShmBackend()
+        except Exception:
+            pass
+    if sys.platform in ("darwin", "win32"):
+        return ImageGrabBackend()
+    return PyAutoGuiBackend()
+
+
+_capture: Optional[CaptureBackend] = None
+_capture_lock = threading.Lock()
+
+
+def get_capture() -> CaptureBackend:
+    """Общий бэкенд захвата процесса"""
+    global _capture
+    with _capture_lock:
+        if _capture is None:
+            _capture = create_backend()
+        return _capture
+
+
+def set_capture(backend: CaptureBackend):
+    """Замена общего бэкенда (например, на симулятор или другой бэкенд)"""
+    global _capture
+    with _capture_lock:
+        _capture = backend
+
+
+def grab_image(region: Region = None):
+    """Скриншот (или область) как PIL изображение через общий бэкенд"""
+    return get_capture().grab(region).to_pil()
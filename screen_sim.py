@@ -0,0 +1,635 @@
+"""
+Симулятор экрана: синтетические сцены для прогонов без рабочего стола и браузера
+
+SimScreen рисует параметризованные экраны (PIL) и меняет их по вводу:
+    yupp_chat          - чат yupp.ai: поле ввода, ответы и кнопки "I prefer this";
+    google_signin      - кнопка "Continue with Google";
+    google_chooser     - выбор аккаунта;
+    google_permissions - доступ к аккаунту (Cancel / Continue);
+    rabby_unlock       - окно Rabby: поле пароля и Unlock;
+    rabby_sign         - запрос подписи (Cancel / Sign);
+    done               - конец сценария.
+
+Разрешение, тема (light/dark) и сдвиг раскладки (jitter) задаются параметрами;
+у каждого элемента есть точный бокс (targets) - по нему проверяется, куда попал
+клик. Переходы могут занимать load_delay секунд (экран "Loading...").
+
+Подключение к модулям (см. sim_run.py):
+    - SimScreen - бэкенд захвата (screen_capture.set_capture) и бэкенд дерева
+      доступности (accessibility.AccessibilityResolver);
+    - SimInput - ввод и снимки с интерфейсом CdpInput (YuppAutomation.use_input);
+    - SimDom - поиск элементов с интерфейсом DomResolver;
+    - SimPyAutoGui - виртуальный дисплей вместо pyautogui (BrowserAutomation);
+    - SimScreen.vision_provider() - локальный планировщик вместо vision модели,
+      отвечает в грамматике action_grammar по точным боксам.
+"""
+
+import json
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from accessibility import AccessibilityBackend, AxElement
+from dom_resolver import DomElement
+from screen_capture import CaptureBackend, Frame, Region
+from vision_client import VisionProvider
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+SCENES = ("yupp_chat", "google_signin", "google_chooser", "google_permissions",
+          "rabby_unlock", "rabby_sign", "done")
+RESOLUTIONS = [(1280, 800), (1440, 900), (1512, 982), (1680, 1050), (1920, 1080), (2560, 1440)]
+
+THEMES = {
+    "light": {"background": (255, 255, 255), "panel": (242, 244, 247), "text": (32, 33, 36),
+              "muted": (95, 99, 104), "primary": (26, 115, 232), "primary_text": (255, 255, 255),
+              "border": (218, 220, 224), "bubble": (241, 243, 244), "input": (255, 255, 255),
+              "focus": (225, 235, 252)},
+    "dark": {"background": (32, 33, 36), "panel": (41, 42, 45), "text": (232, 234, 237),
+             "muted": (154, 160, 166), "primary": (138, 180, 248), "primary_text": (32, 33, 36),
+             "border": (95, 99, 104), "bubble": (48, 49, 52), "input": (41, 42, 45),
+             "focus": (60, 64, 84)},
+}
+
+# Роли симулятора -> роли DOM (dom_resolver) и дерева доступности
+DOM_TAGS = {"button": "button", "link": "a", "textbox": "input", "text": "div"}
+
+
+@dataclass
+class Widget:
+    """Элемент сцены с точным боксом (ground truth)"""
+    name: str
+    role: str  # button, link, textbox, text, panel
+    text: str
+    box: Box
+    on_click: Optional[str] = None  # переход по клику
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        left, top, width, height = self.box
+        return (left + width // 2, top + height // 2)
+
+    def contains(self, x: float, y: float) -> bool:
+        left, top, width, height = self.box
+        return left <= x < left + width and top <= y < top + height
+
+
+_fonts: Dict[int, object] = {}
+
+
+def _font(size: int):
+    if size not in _fonts:
+        from PIL import ImageFont
+        font = None
+        for name in ("DejaVuSans.ttf", "Arial.ttf", "Helvetica.ttc"):
+            try:
+                font = ImageFont.truetype(name, size)
+                break
+            except OSError:
+                continue
+        if font is None:
+            try:
+                font = ImageFont.load_default(size)
+            except TypeError:  # Pillow < 10.1
+                font = ImageFont.load_default()
+        _fonts[size] = font
+    return _fonts[size]
+
+
+class SimScreen(CaptureBackend, AccessibilityBackend):
+    """Сцена с состоянием, отрисовкой и вводом"""
+
+    name = "sim"
+
+    def __init__(self, scene: str = "google_signin", size: Tuple[int, int] = (1440, 900),
+                 theme: str = "light", jitter: float = 0.02, seed: int = None, load_delay: float = 0.0,
+                 effect_delay: float = 0.0,
+                 password: str = "rabbywallet", account: Tuple[str, str] = ("boban marjan", "marjanboban01@gmail.com")):
+        """
+        Args:
+            scene: Начальная сцена (SCENES)
+            size: Разрешение экрана, px (оно же точки клика)
+            theme: light или dark
+            jitter: Случайный сдвиг раскладки при входе в сцену, доля экрана
+            seed: Зерно случайности (раскладка воспроизводима)
+            load_delay: Длительность перехода между сценами, с
+            effect_delay: Через сколько секунд срабатывает клик по кнопке (поздний эффект), с
+            password: Пароль Rabby
+            account: Имя и email аккаунта Google
+        """
+        CaptureBackend.__init__(self)
+        self.width, self.height = size
+        self.theme = THEMES[theme]
+        self.theme_name = theme
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.load_delay = load_delay
+        self.effect_delay = effect_delay
+        self.password = password
+        self.account = account
+
+        self.lock = threading.RLock()
+        self.scene = ""
+        self.version = 0
+        self.values: Dict[str, str] = {}
+        self.focused: Optional[str] = None
+        self.selected = False
+        self.messages: List[Tuple[str, str]] = []  # (role, text) чата yupp
+        self.preferences: List[str] = []
+        self.error = ""
+        self._pending: Optional[Tuple[str, float]] = None
+        self._delayed: List[Tuple[str, float]] = []  # отложенные действия кнопок (effect_delay)
+        self._layout: Tuple[float, float, bool] = (0.0, 0.0, False)
+        self._image = None
+        self._image_version = -1
+
+        self.history: List[Dict] = []  # ввод и попадания (для разбора прогона)
+        self.stats = {"clicks": 0, "hits": 0, "misses": 0, "keys": 0, "transitions": 0, "renders": 0}
+        self._enter(scene)
+
+    # --- состояние ---
+
+    def _enter(self, scene: str):
+        self.scene = scene
+        self.focused = None
+        self.selected = False
+        self.error = ""
+        # Сдвиг раскладки и вариант порядка кнопок - новые при каждом входе в сцену
+        self._layout = (self.rng.uniform(-self.jitter, self.jitter), self.rng.uniform(-self.jitter, self.jitter),
+                        self.rng.random() < 0.5)
+        self.version += 1
+        self.stats["transitions"] += 1
+
+    def go(self, scene: str):
+        """Переход в сцену (с задержкой загрузки, если она задана)"""
+        with self.lock:
+            if self.load_delay > 0:
+                self._pending = (scene, time.monotonic() + self.load_delay)
+                self.scene = "loading"
+                self.version += 1
+            else:
+                self._enter(scene)
+
+    def _tick(self):
+        now = time.monotonic()
+        due = [action for action, at in self._delayed if at <= now]
+        if due:
+            self._delayed = [(action, at) for action, at in self._delayed if at > now]
+            for action in due:
+                self._activate(action)
+        if self._pending and time.monotonic() >= self._pending[1]:
+            scene, _ = self._pending
+            self._pending = None
+            self._enter(scene)
+
+    # --- раскладка ---
+
+    def _box(self, cx: float, cy: float, width: float, height: float) -> Box:
+        """Бокс по центру в долях экрана (со сдвигом сцены) и размеру в px при высоте 900"""
+        dx, dy, _ = self._layout
+        scale = self.height / 900
+        w, h = int(width * scale), int(height * scale)
+        return (int((cx + dx) * self.width - w / 2), int((cy + dy) * self.height - h / 2), w, h)
+
+    def widgets(self) -> List[Widget]:
+        """Элементы текущей сцены (боксы - ground truth)"""
+        with self.lock:
+            self._tick()
+            return getattr(self, f"_layout_{self.scene}")()
+
+    def _layout_loading(self) -> List[Widget]:
+        return [Widget("loading", "text", "Loading...", self._box(0.5, 0.5, 200, 30))]
+
+    def _layout_google_signin(self) -> List[Widget]:
+        return [
+            Widget("hero", "image", "", self._box(0.5, 0.2, 360, 140)),
+            Widget("title", "text", "Sign in to Yupp", self._box(0.5, 0.38, 300, 40)),
+            Widget("google_button", "button", "Continue with Google", self._box(0.5, 0.55, 320, 48),
+                   "google_chooser")
+        ]
+
+    def _layout_google_chooser(self) -> List[Widget]:
+        row = self._box(0.5, 0.45, 480, 64)
+        left, top, width, height = row
+        return [
+            Widget("card", "panel", "", self._box(0.5, 0.42, 560, 600)),
+            Widget("avatar", "image", "", (left + width - height, top + 8, height - 16, height - 16)),
+            Widget("title", "text", "Choose an account", self._box(0.5, 0.25, 320, 40)),
+            Widget("subtitle", "text", "to continue to yupp.ai", self._box(0.5, 0.31, 260, 26)),
+            Widget("email_account", "link", self.account[0], row, "google_permissions"),
+            Widget("email_address", "text", self.account[1],
+                   (left + width // 4, top + height // 2, width // 2, height // 2 - 4)),
+            Widget("another_account", "link", "Use another account", self._box(0.5, 0.55, 480, 56))
+        ]
+
+    def _layout_google_permissions(self) -> List[Widget]:
+        _, _, swap = self._layout
+        cancel, proceed = (0.62, 0.78) if not swap else (0.78, 0.62)
+        return [
+            Widget("card", "panel", "", self._box(0.5, 0.5, 760, 640)),
+            Widget("avatar", "image", "", self._box(0.5, 0.18, 72, 72)),
+            Widget("title", "text", "Yupp wants to access your Google Account", self._box(0.5, 0.3, 600, 40)),
+            Widget("scope_profile", "text", "See your personal info, including any info you've made public",
+                   self._box(0.5, 0.45, 640, 30)),
+            Widget("scope_email", "text", "See your primary Google Account email address",
+                   self._box(0.5, 0.52, 640, 30)),
+            Widget("cancel_button", "button", "Cancel", self._box(cancel, 0.8, 120, 44), "google_signin"),
+            Widget("continue_button", "button", "Continue", self._box(proceed, 0.8, 140, 44), "done")
+        ]
+
+    def _layout_done(self) -> List[Widget]:
+        return [Widget("title", "text", f"Signed in as {self.account[0]}", self._box(0.5, 0.4, 420, 40))]
+
+    def _rabby_panel(self) -> Widget:
+        return Widget("rabby_panel", "panel", "", self._box(0.85, 0.5, 360, 600))
+
+    def _layout_rabby_unlock(self) -> List[Widget]:
+        widgets = [
+            self._rabby_panel(),
+            Widget("rabby_title", "text", "Welcome back", self._box(0.85, 0.3, 240, 36)),
+            Widget("password_field", "textbox", "Enter the password to unlock", self._box(0.85, 0.5, 300, 48)),
+            Widget("unlock_button", "button", "Unlock", self._box(0.85, 0.68, 300, 48), "unlock")
+        ]
+        if self.error:
+            widgets.append(Widget("rabby_error", "text", self.error, self._box(0.85, 0.58, 300, 26)))
+        return widgets
+
+    def _layout_rabby_sign(self) -> List[Widget]:
+        return [
+            self._rabby_panel(),
+            Widget("rabby_title", "text", "Signature request", self._box(0.85, 0.3, 260, 36)),
+            Widget("origin", "text", "yupp.ai", self._box(0.85, 0.38, 200, 26)),
+            Widget("cancel_button", "button", "Cancel", self._box(0.8, 0.72, 140, 48), "done"),
+            Widget("sign_button", "button", "Sign", self._box(0.9, 0.72, 140, 48), "done")
+        ]
+
+    def _layout_yupp_chat(self) -> List[Widget]:
+        widgets = [Widget("header", "text", "Yupp", self._box(0.08, 0.05, 100, 36))]
+        # Последний раунд: вопрос и два ответа с кнопками prefer
+        if self.messages:
+            question = self.messages[-1][1]
+            widgets.append(Widget("question", "text", question[:60], self._box(0.7, 0.16, 400, 40)))
+            for index, column in enumerate((0.27, 0.73)):
+                name = "ab"[index]
+                widgets.append(Widget(f"answer_{name}", "text", f"Response {name.upper()} to: {question[:30]}",
+                                      self._box(column, 0.38, 560, 260)))
+                if len(self.preferences) < len(self.messages):
+                    widgets.append(Widget(f"prefer_{name}", "button", "I prefer this",
+                                          self._box(column, 0.61, 180, 40), f"prefer_{name}"))
+            if len(self.preferences) == len(self.messages):
+                widgets.append(Widget("thanks", "text", "Thanks! Your preference was recorded",
+                                      self._box(0.5, 0.68, 420, 30)))
+        widgets.append(Widget("chat_input", "textbox", "Ask anything...",
+                              (int(self.width * 0.15), int(self.height * 0.8),
+                               int(self.width * 0.62), int(self.height * 0.07))))
+        widgets.append(Widget("send_button", "button", "Send",
+                              (int(self.width * 0.79), int(self.height * 0.8),
+                               int(self.width * 0.06), int(self.height * 0.07)), "send"))
+        return widgets
+
+    @property
+    def targets(self) -> Dict[str, Box]:
+        """Точные боксы элементов текущей сцены"""
+        return {widget.name: widget.box for widget in self.widgets()}
+
+    # --- отрисовка и захват ---
+
+    def image(self):
+        """Кадр текущей сцены (перерисовывается только после изменений)"""
+        from PIL import Image, ImageDraw
+
+        with self.lock:
+            widgets = self.widgets()
+            if self._image is not None and self._image_version == self.version:
+                return self._image
+            colors = self.theme
+            image = Image.new("RGB", (self.width, self.height), colors["background"])
+            draw = ImageDraw.Draw(image)
+            scale = self.height / 900
+            for widget in widgets:
+                left, top, width, height = widget.box
+                rect = (left, top, left + width, top + height)
+                font = _font(max(10, int(min(height * 0.45, 20 * scale))))
+                if widget.role == "panel":
+                    draw.rounded_rectangle(rect, radius=int(12 * scale), fill=colors["panel"],
+                                           outline=colors["border"])
+                    continue
+                if widget.role == "image":
+                    draw.rounded_rectangle(rect, radius=min(width, height) // 2, fill=colors["primary"])
+                    continue
+                if widget.role == "button":
+                    draw.rounded_rectangle(rect, radius=int(8 * scale), fill=colors["primary"])
+                    draw.text(widget.center, widget.text, fill=colors["primary_text"], font=font, anchor="mm")
+                elif widget.role == "link":
+                    draw.rectangle(rect, outline=colors["border"])
+                    draw.text((left + int(16 * scale), top + height // 4), widget.text,
+                              fill=colors["text"], font=font, anchor="lm")
+                elif widget.role == "textbox":
+                    focused = self.focused == widget.name
+                    draw.rounded_rectangle(rect, radius=int(6 * scale),
+                                           fill=colors["focus"] if focused else colors["input"],
+                                           outline=colors["primary"] if focused else colors["border"], width=2)
+                    value = self.values.get(widget.name, "")
+                    shown = "•" * len(value) if widget.name == "password_field" else value
+                    draw.text((left + int(12 * scale), top + height // 2), shown or widget.text,
+                              fill=colors["text"] if value else colors["muted"], font=font, anchor="lm")
+                elif widget.name.startswith("answer_"):
+                    draw.rounded_rectangle(rect, radius=int(10 * scale), fill=colors["bubble"])
+                    draw.text((left + int(16 * scale), top + int(16 * scale)), widget.text,
+                              fill=colors["text"], font=font)
+                else:
+                    draw.text(widget.center, widget.text, fill=colors["text"], font=font, anchor="mm")
+            self._image = image
+            self._image_version = self.version
+            self.stats["renders"] += 1
+            return image
+
+    def screen_size(self) -> Tuple[int, int]:
+        return (self.width, self.height)
+
+    def grab(self, region: Region = None) -> Frame:
+        region = self._full_region(region)
+        left, top, width, height = region
+        array = np.asarray(self.image())[top:top + height, left:left + width]
+        return Frame(array, time.monotonic(), next(self._seq), region)
+
+    # --- дерево доступности ---
+
+    def window_key(self):
+        with self.lock:
+            self._tick()
+            return (self.scene, self.version)
+
+    def elements(self, max_elements: int) -> List[AxElement]:
+        return [AxElement(widget.box, widget.text, "label" if widget.role == "text" else widget.role,
+                          f"sim {widget.role}")
+                for widget in self.widgets()[:max_elements] if widget.text]
+
+    # --- ввод ---
+
+    def hit(self, x: float, y: float) -> Optional[Widget]:
+        """Самый маленький кликабельный элемент под точкой"""
+        candidates = [widget for widget in self.widgets()
+                      if widget.role in ("button", "link", "textbox") and widget.contains(x, y)]
+        return min(candidates, key=lambda widget: widget.box[2] * widget.box[3]) if candidates else None
+
+    def click(self, x: float, y: float) -> Optional[str]:
+        """Клик в точку экрана; возвращает имя элемента, в который попал клик"""
+        with self.lock:
+            self.stats["clicks"] += 1
+            widget = self.hit(x, y)
+            self.history.append({"event": "click", "scene": self.scene, "point": (int(x), int(y)),
+                                 "hit": widget.name if widget else None,
+                                 "center": widget.center if widget else None})
+            if widget is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            if widget.role == "textbox":
+                self.focused = widget.name
+                self.version += 1
+            elif widget.on_click and self.effect_delay > 0:
+                self._delayed.append((widget.on_click, time.monotonic() + self.effect_delay))
+            elif widget.on_click:
+                self._activate(widget.on_click)
+            return widget.name
+
+    def _activate(self, action: str):
+        if action == "send":
+            text = self.values.get("chat_input", "").strip()
+            if text:
+                self.messages.append(("user", text))
+                self.values["chat_input"] = ""
+                self.version += 1
+        elif action == "unlock":
+            if self.values.get("password_field") == self.password:
+                self.values["password_field"] = ""
+                self.go("rabby_sign")
+            else:
+                self.error = "Incorrect password"
+                self.version += 1
+        elif action.startswith("prefer_"):
+            self.preferences.append(action[-1])
+            self.version += 1
+        else:
+            self.go(action)
+
+    def type_text(self, text: str):
+        with self.lock:
+            self.history.append({"event": "type", "scene": self.scene, "focused": self.focused, "text": text})
+            if not self.focused:
+                return
+            current = "" if self.selected else self.values.get(self.focused, "")
+            self.values[self.focused] = current + text
+            self.selected = False
+            self.version += 1
+
+    def press_key(self, key: str):
+        with self.lock:
+            self.stats["keys"] += 1
+            self.history.append({"event": "key", "scene": self.scene, "focused": self.focused, "key": key})
+            parts = [part for part in re.split(r"[+\s]+", key.strip()) if part]
+            name = parts[-1] if parts else "Return"
+            if len(parts) > 1 and name.lower() == "a":
+                self.selected = True
+            elif name in ("Return", "Enter"):
+                if self.focused == "chat_input":
+                    self._activate("send")
+                elif self.focused == "password_field":
+                    self._activate("unlock")
+            elif name in ("Delete", "Backspace") and self.focused:
+                value = self.values.get(self.focused, "")
+                self.values[self.focused] = "" if self.selected else value[:-1]
+                self.selected = False
+                self.version += 1
+
+    def navigate(self, url: str):
+        with self.lock:
+            self.history.append({"event": "navigate", "url": url})
+            if "accounts.google" in url:
+                self.go("google_chooser")
+            elif "yupp" in url:
+                self.go("yupp_chat")
+
+    # --- локальный планировщик вместо vision модели ---
+
+    def plan(self, payload: Dict) -> Dict:
+        """
+        Ответ chat/completions на запрос analyze_screen: план в грамматике action_grammar
+        по точным боксам (точки - в пикселях уменьшенной до 1024px копии скриншота)
+        """
+        text = ""
+        for message in payload.get("messages", []):
+            content = message.get("content")
+            for part in content if isinstance(content, list) else []:
+                if part.get("type") == "text":
+                    text += part["text"]
+        command = text.split("\n", 1)[0].replace("Command:", "").strip()
+        lowered = command.lower()
+        scale = min(1024, max(self.width, self.height)) / max(self.width, self.height)
+        targets = {widget.name: widget for widget in self.widgets()}
+
+        def click(name: str) -> Optional[Dict]:
+            widget = targets.get(name)
+            if not widget:
+                return None
+            x, y = widget.center
+            return {"a": "c", "m": None, "p": [int(x * scale), int(y * scale)], "v": None}
+
+        actions: List[Optional[Dict]] = []
+        quoted = re.search(r"'([^']*)'|\"([^\"]*)\"", command)
+        if "prefer" in lowered:
+            actions.append(click("prefer_a"))
+        elif quoted and any(word in lowered for word in ("напиши", "введи", "type", "write")):
+            actions += [click("chat_input"), {"a": "t", "m": None, "p": None,
+                                              "v": quoted.group(1) or quoted.group(2)}]
+            if "отправ" in lowered or "send" in lowered or "enter" in lowered:
+                actions.append({"a": "k", "m": None, "p": None, "v": "Return"})
+        elif "открой" in lowered or "open" in lowered:
+            actions.append({"a": "n", "m": None, "p": None, "v": "https://yupp.ai"})
+        elif "подожди" in lowered or "wait" in lowered:
+            seconds = re.findall(r"\d+", command)
+            actions.append({"a": "w", "m": None, "p": None, "v": seconds[0] if seconds else "1"})
+        content = json.dumps({"x": [action for action in actions if action]})
+        return {
+            "choices": [{"message": {"content": content}}],
+            "usage": {"prompt_tokens": 85 + len(text) // 4, "completion_tokens": len(content) // 4}
+        }
+
+    def vision_provider(self, name: str = "sim") -> VisionProvider:
+        """Провайдер HedgedVisionClient, отвечающий локальным планировщиком"""
+        return VisionProvider(name=name, api_url="sim://plan", model="sim", api_key="sim", handler=self.plan)
+
+
+class SimInput:
+    """Ввод и снимки с интерфейсом CdpInput (координаты страницы = пиксели сцены)"""
+
+    def __init__(self, screen: SimScreen):
+        self.screen = screen
+
+    def click_sync(self, x: float, y: float, screen: bool = False):
+        self.screen.click(x, y)
+
+    def screenshot_sync(self, clip: Box = None, image_format: str = "png"):
+        image = self.screen.image()
+        if clip:
+            left, top, width, height = clip
+            return image.crop((left, top, left + width, top + height))
+        return image.copy()
+
+    async def click(self, x: float, y: float, screen: bool = False):
+        self.click_sync(x, y, screen)
+
+    async def type_text(self, text: str):
+        self.screen.type_text(text)
+
+    async def press_key(self, key: str):
+        self.screen.press_key(key)
+
+    async def navigate(self, url: str):
+        self.screen.navigate(url)
+
+    async def scroll(self, direction: str = "down", amount: int = 600):
+        pass
+
+    async def screenshot(self, clip: Box = None, image_format: str = "png"):
+        return self.screenshot_sync(clip, image_format)
+
+
+class SimDom:
+    """Поиск элементов сцены с интерфейсом DomResolver"""
+
+    def __init__(self, screen: SimScreen):
+        self.screen = screen
+        self.stats = {"found": 0, "missed": 0, "errors": 0}
+
+    def find(self, selector: str = None, role: str = None, texts=(), exact: bool = False) -> Optional[DomElement]:
+        matches = [widget for widget in self.screen.widgets()
+                   if widget.role in DOM_TAGS and (not role or widget.role == role)]
+        needles = [text.lower() for text in texts]
+        if needles:
+            matches = [widget for widget in matches
+                       if any((widget.text.lower() == needle if exact else needle in widget.text.lower())
+                              for needle in needles)]
+        if not matches:
+            self.stats["missed"] += 1
+            return None
+        self.stats["found"] += 1
+        widget = min(matches, key=lambda widget: widget.box[2] * widget.box[3])
+        return DomElement(widget.box, widget.text, DOM_TAGS[widget.role], widget.role, len(matches), widget.box)
+
+    async def find_async(self, selector: str = None, role: str = None, texts=(),
+                         exact: bool = False) -> Optional[DomElement]:
+        return self.find(selector, role, texts, exact)
+
+
+class SimPyAutoGui:
+    """
+    Виртуальный дисплей с интерфейсом pyautogui: мышь и клавиатура идут в сцену,
+    скриншоты - из сцены. install() подменяет модуль pyautogui до импорта ypp_stg
+    (без рабочего стола настоящий pyautogui не импортируется).
+    """
+
+    FAILSAFE = False
+    PAUSE = 0.0
+
+    def __init__(self, screen: SimScreen = None):
+        self.screen = screen
+        self._position = (0, 0)
+        try:
+            from pyscreeze import ImageNotFoundException, locate
+        except ImportError:
+            class ImageNotFoundException(Exception):
+                pass
+            locate = None
+        self.ImageNotFoundException = ImageNotFoundException
+        self._locate = locate
+
+    def attach(self, screen: SimScreen):
+        self.screen = screen
+
+    def install(self) -> "SimPyAutoGui":
+        sys.modules["pyautogui"] = self
+        return self
+
+    def size(self) -> Tuple[int, int]:
+        return self.screen.screen_size()
+
+    def position(self) -> Tuple[int, int]:
+        return self._position
+
+    def moveTo(self, x=None, y=None, duration: float = 0.0, *args, **kwargs):
+        if x is not None and y is not None:
+            self._position = (int(x), int(y))
+
+    def click(self, x=None, y=None, *args, **kwargs):
+        if isinstance(x, (tuple, list)):
+            x, y = x
+        if x is not None and y is not None:
+            self._position = (int(x), int(y))
+        self.screen.click(*self._position)
+
+    def write(self, text: str, interval: float = 0.0):
+        self.screen.type_text(text)
+
+    typewrite = write
+
+    def press(self, key: str, *args, **kwargs):
+        self.screen.press_key({"enter": "Return", "return": "Return"}.get(key.lower(), key))
+
+    def hotkey(self, *keys, **kwargs):
+        self.screen.press_key("+".join(keys))
+
+    def screenshot(self, region: Region = None):
+        return self.screen.grab(region).to_pil()
+
+    def locate(self, needle, haystack, **kwargs):
+        if self._locate is None:
+            raise self.ImageNotFoundException(needle)
+        return self._locate(needle, haystack, **kwargs)
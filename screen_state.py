@@ -0,0 +1,196 @@
+"""
+Распознавание состояния экрана для сценариев входа
+
+Состояние (страница входа, выбор аккаунта, разрешения, приложение, окна Rabby)
+описывается текстовыми и шаблонными признаками. Классификация кадра:
+    1. быстрый путь - dHash кадра (256 бит) близок к запомненному хэшу ровно
+       одного состояния;
+    2. признаки - тексты ищутся в OCR индексе общего кадра (строится один раз
+       на кадр и потом переиспользуется резолверами шага), шаблоны - на самом кадре.
+Состояние, подтвержденное признаками, запоминает хэш кадра, поэтому повторные
+экраны распознаются без OCR. Исключающие тексты (exclude) проверяются и на
+быстром пути (по OCR кадра, который кэшируется на кадре): хэш, попавший на
+исключенный экран, забывается. Забыть хэш может и сценарий - если шаг
+состояния, распознанного по хэшу, не подтвердил его (forget).
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from frame_provider import SharedFrame, hamming
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+
+@dataclass
+class StateSpec:
+    """Описание состояния экрана"""
+    name: str
+    texts: List[str] = field(default_factory=list)  # признаки-тексты (без учета регистра)
+    templates: List[str] = field(default_factory=list)  # признаки-шаблоны (пути к изображениям)
+    exclude: List[str] = field(default_factory=list)  # тексты, при которых состояние отвергается
+    min_matches: int = 1  # сколько признаков должно совпасть
+
+    @classmethod
+    def from_config(cls, name: str, spec: Dict) -> "StateSpec":
+        return cls(
+            name=name,
+            texts=list(spec.get("texts", [])),
+            templates=list(spec.get("templates", [])),
+            exclude=list(spec.get("exclude", [])),
+            min_matches=spec.get("min_matches", 1)
+        )
+
+
+def locate_with_pyautogui(template: str, image, confidence: float = 0.8) -> Optional[Box]:
+    """Поиск шаблона на изображении (pyautogui / pyscreeze)"""
+    import pyautogui
+    try:
+        location = pyautogui.locate(template, image, confidence=confidence)
+    except pyautogui.ImageNotFoundException:
+        return None
+    return tuple(int(v) for v in location) if location else None
+
+
+class ScreenStateRecognizer:
+    """Классификация кадра по хэшу и признакам состояний"""
+
+    def __init__(self, states: List[StateSpec], hash_threshold: int = 12, hash_size: int = 16,
+                 path: str = None, locate: Callable[[str, object], Optional[Box]] = None,
+                 log: Callable[[str, str], None] = None):
+        """
+        Args:
+            states: Состояния в порядке приоритета (при равном числе признаков побеждает первое)
+            hash_threshold: Максимальное расстояние Хэмминга для быстрого пути
+            hash_size: Размер dHash (hash_size^2 бит)
+            path: JSON файл запомненных хэшей (None - только в памяти)
+            locate: Поиск шаблона (template, image) -> box
+            log: Функция логирования вида log(message, level)
+        """
+        self.states = states
+        self.hash_threshold = hash_threshold
+        self.hash_size = hash_size
+        self.path = path
+        self.locate = locate or locate_with_pyautogui
+        self.log = log or (lambda message, level="INFO": None)
+        self.hashes: Dict[str, List[int]] = self._load()
+        self.stats = {"hash_hits": 0, "hash_rejected": 0, "probe_hits": 0, "unknown": 0}
+        # Как распознан последний кадр: "hash", "probe" или None
+        self.last_method: Optional[str] = None
+
+    def _load(self) -> Dict[str, List[int]]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return {name: [int(h) for h in hashes] for name, hashes in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            self.log(f"Не удалось прочитать хэши состояний: {e}", "WARNING")
+            return {}
+
+    def save(self):
+        """Атомарное сохранение запомненных хэшей"""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.hashes, f)
+        os.replace(tmp_path, self.path)
+
+    def learn(self, state: str, frame: SharedFrame, max_hashes: int = 8):
+        """Запоминаем хэш кадра, подтвержденного признаками"""
+        value = frame.dhash(self.hash_size)
+        known = self.hashes.setdefault(state, [])
+        if any(hamming(value, h) <= self.hash_threshold for h in known):
+            return
+        known.append(value)
+        del known[:-max_hashes]
+        try:
+            self.save()
+        except OSError as e:
+            self.log(f"Не удалось сохранить хэши состояний: {e}", "WARNING")
+
+    def forget(self, state: str, frame: SharedFrame) -> bool:
+        """Забываем хэши состояния, близкие к кадру (хэш оказался ошибочным)"""
+        value = frame.dhash(self.hash_size)
+        known = self.hashes.get(state, [])
+        kept = [h for h in known if hamming(value, h) > self.hash_threshold]
+        if len(kept) == len(known):
+            return False
+        self.hashes[state] = kept
+        self.log(f"Хэш состояния '{state}' забыт", "DEBUG")
+        try:
+            self.save()
+        except OSError as e:
+            self.log(f"Не удалось сохранить хэши состояний: {e}", "WARNING")
+        return True
+
+    def match_hash(self, frame: SharedFrame) -> Optional[str]:
+        """Быстрый путь: состояние, чей запомненный хэш в пределах порога (если такое одно)"""
+        value = frame.dhash(self.hash_size)
+        matched = {
+            state.name for state in self.states
+            if any(hamming(value, known) <= self.hash_threshold for known in self.hashes.get(state.name, []))
+        }
+        # Похожие экраны разных состояний - неоднозначно, проверяем признаками
+        return matched.pop() if len(matched) == 1 else None
+
+    def probe(self, state: StateSpec, frame: SharedFrame, screen_text: str) -> int:
+        """Число совпавших признаков состояния (-1 - состояние исключено)"""
+        if any(text.lower() in screen_text for text in state.exclude):
+            return -1
+        matches = sum(1 for text in state.texts if text.lower() in screen_text)
+        for template in state.templates:
+            if matches >= state.min_matches:
+                break  # дорогие шаблоны не нужны, если текстов уже достаточно
+            try:
+                if self.locate(template, frame.image):
+                    matches += 1
+            except Exception as e:
+                self.log(f"Ошибка поиска шаблона {template}: {e}", "DEBUG")
+        return matches
+
+    def classify(self, frame: SharedFrame) -> Optional[str]:
+        """
+        Состояние кадра
+
+        Returns:
+            Имя состояния или None, если ни одно не подошло
+        """
+        screen_text = None
+        state = self.match_hash(frame)
+        if state:
+            spec = next(spec for spec in self.states if spec.name == state)
+            if spec.exclude:
+                screen_text = " ".join(text for text, _, _ in frame.ocr_words()).lower()
+            if screen_text is not None and any(text.lower() in screen_text for text in spec.exclude):
+                self.stats["hash_rejected"] += 1
+                self.log(f"Хэш указал на '{state}', но на экране исключающий текст", "DEBUG")
+                self.forget(state, frame)
+            else:
+                self.stats["hash_hits"] += 1
+                self.last_method = "hash"
+                self.log(f"Состояние экрана: {state} (по хэшу)", "DEBUG")
+                return state
+
+        if screen_text is None:
+            screen_text = " ".join(text for text, _, _ in frame.ocr_words()).lower()
+        best, best_matches = None, 0
+        for spec in self.states:
+            matches = self.probe(spec, frame, screen_text)
+            if matches >= spec.min_matches and matches > best_matches:
+                best, best_matches = spec.name, matches
+
+        if best is None:
+            self.last_method = None
+            self.stats["unknown"] += 1
+            self.log("Состояние экрана не распознано", "DEBUG")
+            return None
+
+        self.stats["probe_hits"] += 1
+        self.last_method = "probe"
+        self.log(f"Состояние экрана: {best} (признаков: {best_matches})", "DEBUG")
+        self.learn(best, frame)
+        return best
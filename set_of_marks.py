@@ -0,0 +1,209 @@
+"""
+Set-of-marks: выбор кандидата моделью вместо предсказания координат
+
+Кликабельные кандидаты находятся локально:
+    - строки OCR (ocr_layout.build_lines);
+    - прямоугольные контуры кнопок по границам (нужен opencv-python);
+    - известные шаблоны изображений (нужен opencv-python).
+Кандидаты нумеруются и рисуются поверх уменьшенного скриншота. Модель
+возвращает только номер метки, а точные координаты берутся из локального бокса.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ocr_layout import build_lines
+from vision_client import NOT_FOUND
+
+Box = Tuple[int, int, int, int]  # left, top, width, height
+
+# Цвета меток по источнику кандидата
+MARK_COLORS = {"ocr": (230, 30, 30), "contour": (30, 90, 230), "template": (20, 160, 60)}
+
+
+@dataclass
+class Mark:
+    """Пронумерованный кандидат"""
+    box: Box
+    source: str  # ocr, contour, template
+    text: str = ""
+    id: int = 0
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        left, top, width, height = self.box
+        return (left + width // 2, top + height // 2)
+
+
+def ocr_candidates(ocr_data: Dict, min_conf: float = 50) -> List[Mark]:
+    """Кандидаты из строк OCR"""
+    return [Mark(item.box, "ocr", item.text) for item in build_lines(ocr_data, min_conf)
+            if len(item.text.strip()) > 1]
+
+
+def contour_candidates(image, min_size: Tuple[int, int] = (40, 18),
+                       max_size: Tuple[int, int] = (600, 120)) -> List[Mark]:
+    """Прямоугольные области, похожие на кнопки и поля ввода (opencv)"""
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return []
+
+    gray = cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2GRAY)
+    edges = cv2.Canny(gray, 40, 120)
+    # Склеиваем разрывы рамок и скругленных углов
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=1)
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+    marks = []
+    for contour in contours:
+        left, top, width, height = cv2.boundingRect(contour)
+        if not (min_size[0] <= width <= max_size[0] and min_size[1] <= height <= max_size[1]):
+            continue
+        # Контур должен заполнять большую часть своего прямоугольника
+        if cv2.contourArea(contour) < 0.6 * width * height:
+            continue
+        marks.append(Mark((left, top, width, height), "contour"))
+    return marks
+
+
+def template_candidates(image, templates: Dict[str, str], threshold: float = 0.8) -> List[Mark]:
+    """Совпадения известных шаблонов (имя -> путь к изображению), opencv"""
+    if not templates:
+        return []
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return []
+
+    haystack = cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2GRAY)
+    marks = []
+    for name, path in templates.items():
+        needle = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if needle is None:
+            continue
+        height, width = needle.shape[:2]
+        result = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (left, top) = cv2.minMaxLoc(result)
+        if score >= threshold:
+            marks.append(Mark((left, top, width, height), "template", name))
+    return marks
+
+
+def iou(a: Box, b: Box) -> float:
+    """Intersection over union двух боксов"""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2 = min(a[0] + a[2], b[0] + b[2])
+    y2 = min(a[1] + a[3], b[1] + b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+
+def contains(outer: Box, inner: Box) -> bool:
+    return (outer[0] <= inner[0] and outer[1] <= inner[1] and
+            outer[0] + outer[2] >= inner[0] + inner[2] and outer[1] + outer[3] >= inner[1] + inner[3])
+
+
+def dedupe(marks: Sequence[Mark], threshold: float = 0.5) -> List[Mark]:
+    """
+    Удаление дублей: шаблоны важнее контуров, контуры важнее OCR.
+    Текст OCR внутри контура кнопки переносится в подпись контура.
+    """
+    priority = {"template": 0, "contour": 1, "ocr": 2}
+    kept: List[Mark] = []
+    for mark in sorted(marks, key=lambda m: priority.get(m.source, 3)):
+        duplicate = None
+        for other in kept:
+            if iou(mark.box, other.box) >= threshold or (
+                    mark.source == "ocr" and other.source == "contour" and contains(other.box, mark.box)):
+                duplicate = other
+                break
+        if duplicate is None:
+            kept.append(mark)
+        elif mark.text and not duplicate.text:
+            duplicate.text = mark.text
+    return kept
+
+
+def collect_candidates(image, ocr_data: Dict = None, templates: Dict[str, str] = None,
+                       max_marks: int = 40) -> List[Mark]:
+    """
+    Все кандидаты кадра, без дублей, пронумерованные в порядке чтения
+
+    Args:
+        image: PIL изображение кадра
+        ocr_data: Данные pytesseract для кадра (если есть)
+        templates: Известные шаблоны имя -> путь
+        max_marks: Максимум меток (лишние метки мешают модели)
+    """
+    marks = []
+    if ocr_data:
+        marks.extend(ocr_candidates(ocr_data))
+    marks.extend(contour_candidates(image))
+    marks.extend(template_candidates(image, templates or {}))
+
+    marks = dedupe(marks)
+    # Сначала кандидаты с текстом/шаблоном, затем остальные; внутри - порядок чтения
+    marks.sort(key=lambda m: (not (m.text or m.source == "template"), m.box[1] // 20, m.box[0]))
+    marks = marks[:max_marks]
+    marks.sort(key=lambda m: (m.box[1] // 20, m.box[0]))
+    for i, mark in enumerate(marks, start=1):
+        mark.id = i
+    return marks
+
+
+def draw_marks(image, marks: Sequence[Mark], max_side: int = 1024):
+    """
+    Уменьшенная копия кадра с нарисованными метками
+
+    Returns:
+        PIL изображение для отправки модели
+    """
+    from PIL import ImageDraw, ImageFont
+
+    canvas = image.convert("RGB").copy()
+    canvas.thumbnail((max_side, max_side))
+    scale = canvas.width / image.width
+
+    draw = ImageDraw.Draw(canvas)
+    try:
+        font = ImageFont.truetype("DejaVuSans-Bold.ttf", 13)
+    except Exception:
+        font = ImageFont.load_default()
+
+    for mark in marks:
+        left, top, width, height = (int(v * scale) for v in mark.box)
+        color = MARK_COLORS.get(mark.source, (230, 30, 30))
+        draw.rectangle([left, top, left + width, top + height], outline=color, width=2)
+
+        label = str(mark.id)
+        text_box = draw.textbbox((0, 0), label, font=font)
+        label_w, label_h = text_box[2] - text_box[0] + 4, text_box[3] - text_box[1] + 4
+        label_top = max(0, top - label_h)
+        draw.rectangle([left, label_top, left + label_w, label_top + label_h], fill=color)
+        draw.text((left + 2, label_top + 1), label, fill=(255, 255, 255), font=font)
+
+    return canvas
+
+
+def parse_mark_id(content: str, marks: Sequence[Mark]) -> Optional[Mark]:
+    """Валидатор ответа модели: номер метки; 0 / NOT_FOUND -> NOT_FOUND, мусор и несуществующий номер -> None"""
+    if "NOT_FOUND" in content:
+        return NOT_FOUND
+    match = re.search(r"\d+", content)
+    if not match:
+        return None
+    number = int(match.group())
+    if number == 0:
+        return NOT_FOUND
+    by_id = {mark.id: mark for mark in marks}
+    return by_id.get(number)
+
+
+def describe_marks(marks: Sequence[Mark], max_text: int = 30) -> str:
+    """Короткая легенда меток с текстом (помогает модели, стоит мало токенов)"""
+    return "\n".join(f"{mark.id}:{mark.text[:max_text]}" for mark in marks if mark.text)
@@ -0,0 +1,183 @@
+"""
+Прогон BrowserAutomation и YuppAutomation на симуляторе экрана (screen_sim)
+
+Без браузера, рабочего стола и платных моделей: захват, ввод, дерево доступности,
+DOM и vision модель подменяются сценой симулятора, паузы выключены (pace=0).
+Каждый прогон - новая сцена со случайным разрешением, темой и сдвигом раскладки.
+По истории кликов симулятора считаются попадания в нужный элемент, ошибка
+в пикселях относительно центра элемента и повторные клики по кнопкам, которые
+нельзя нажимать дважды (отправка, выбор ответа, вход).
+
+С --late-effect кнопки срабатывают с опозданием (дольше дедлайна проверки
+эффекта): повторных кликов при этом быть не должно, иначе код выхода 1.
+
+Использование:
+python sim_run.py --target both --runs 200 --seed 1
+python sim_run.py --target both --runs 5 --late-effect 2
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import sys
+import tempfile
+from collections import Counter
+import time
+from typing import Dict, List
+
+from screen_sim import RESOLUTIONS, THEMES, SimDom, SimInput, SimPyAutoGui, SimScreen
+
+# Какие элементы правильны для клика на каждой сцене
+EXPECTED = {
+    "google_signin": {"google_button"},
+    "google_chooser": {"email_account"},
+    "google_permissions": {"continue_button"},
+    "yupp_chat": {"chat_input", "send_button", "prefer_a", "prefer_b"},
+}
+
+STG_STEPS = [
+    {"name": "click_google", "type": "smart_google_click", "wait_for_change": 0},
+    {"name": "click_email", "type": "smart_email_click", "wait_for_change": 0},
+    {"name": "click_continue", "type": "smart_continue_click", "wait_for_change": 0},
+]
+
+# Кнопки, повторный клик по которым меняет результат (двойная отправка, отмена выбора)
+REPEAT_UNSAFE = {"google_button", "email_account", "continue_button", "send_button", "prefer_a", "prefer_b"}
+
+WORK_COMMANDS = [
+    "Напиши 'What is the tallest mountain?' и отправь",
+    "Нажми кнопку I prefer this",
+]
+
+
+def new_screen(rng: random.Random, scene: str, effect_delay: float = 0.0) -> SimScreen:
+    return SimScreen(scene, size=rng.choice(RESOLUTIONS), theme=rng.choice(list(THEMES)),
+                     seed=rng.randrange(1 << 30), effect_delay=effect_delay)
+
+
+def click_report(screens: List[SimScreen]) -> Dict:
+    """Попадания кликов в правильный элемент и ошибка в пикселях от центра элемента"""
+    clicks = [event for screen in screens for event in screen.history if event["event"] == "click"]
+    errors = [math.dist(event["point"], event["center"]) for event in clicks if event["hit"]]
+    correct = sum(1 for event in clicks if event["hit"] in EXPECTED.get(event["scene"], ()))
+    errors.sort()
+    repeated = 0
+    for screen in screens:
+        counts = Counter(event["hit"] for event in screen.history
+                         if event["event"] == "click" and event["hit"] in REPEAT_UNSAFE)
+        repeated += sum(count - 1 for count in counts.values())
+    return {
+        "repeated": repeated,
+        "clicks": len(clicks),
+        "correct": correct,
+        "missed": sum(1 for event in clicks if not event["hit"]),
+        "error_p50": errors[len(errors) // 2] if errors else None,
+        "error_max": errors[-1] if errors else None,
+    }
+
+
+def run_stg(runs: int, rng: random.Random, effect_delay: float = 0.0) -> Dict:
+    """BrowserAutomation: вход через Google (три smart_* шага) на каждой сцене"""
+    display = SimPyAutoGui().install()  # до импорта ypp_stg: pyautogui без дисплея не импортируется
+    from accessibility import AccessibilityResolver
+    from screen_capture import set_capture
+    from ypp_stg import BrowserAutomation
+
+    screens = []
+    automation = None
+    succeeded = 0
+    started = time.perf_counter()
+    for _ in range(runs):
+        screen = new_screen(rng, "google_signin", effect_delay)
+        screens.append(screen)
+        display.attach(screen)
+        set_capture(screen)
+        if automation is None:
+            automation = BrowserAutomation({
+                "screen": {"pace": 0, "step_delay": 0},
+                "logging": {"level": "ERROR", "frames": 0, "dump_dir": tempfile.gettempdir()},
+                "vision": {"providers": []},
+                "cdp": {"enabled": False},
+                "accessibility": {"enabled": False},
+                "memory": {"enabled": False},
+                "ledger": {"path": None},
+                "routing": {"stats_path": None},
+                "journal": {"enabled": False},
+                "steps": STG_STEPS,
+            })
+        automation.accessibility = AccessibilityResolver(backend=screen, log=automation.log)
+        automation.frames.invalidate("scene")
+        if automation.run_automation() and screen.scene == "done":
+            succeeded += 1
+    elapsed = time.perf_counter() - started
+    return {"runs": runs, "succeeded": succeeded, "steps": runs * len(STG_STEPS),
+            "elapsed": elapsed, **click_report(screens)}
+
+
+def run_work(runs: int, rng: random.Random, effect_delay: float = 0.0) -> Dict:
+    """YuppAutomation: вопрос в чат и выбор ответа на каждой сцене"""
+    from location_memory import LocationMemory
+    from ypp_work import YuppAutomation
+
+    memory_path = tempfile.NamedTemporaryFile(suffix=".json", delete=False).name
+    screens = []
+    succeeded = 0
+
+    async def run_all():
+        nonlocal succeeded
+        for _ in range(runs):
+            screen = new_screen(rng, "yupp_chat", effect_delay)
+            screens.append(screen)
+            automation = YuppAutomation(api_key="sim", cdp_port=None, use_marks=False, pace=0,
+                                        ledger_path=None, journal_dir=None, route_stats_path=None,
+                                        log_level="ERROR",
+                                        providers=[screen.vision_provider()])
+            automation.log.dump_dir = tempfile.gettempdir()
+            automation.use_input(SimInput(screen))
+            automation.dom = SimDom(screen)
+            automation.location_memory = LocationMemory(path=memory_path, log=automation.log)
+            if await automation.run_script(WORK_COMMANDS) and screen.preferences:
+                succeeded += 1
+            await automation.vision_client.close()
+
+    started = time.perf_counter()
+    asyncio.run(run_all())
+    elapsed = time.perf_counter() - started
+    return {"runs": runs, "succeeded": succeeded, "steps": runs * len(WORK_COMMANDS),
+            "elapsed": elapsed, **click_report(screens)}
+
+
+def print_report(name: str, report: Dict):
+    per_minute = report["steps"] / report["elapsed"] * 60 if report["elapsed"] else float("inf")
+    error_p50 = f"{report['error_p50']:.1f}" if report["error_p50"] is not None else "-"
+    error_max = f"{report['error_max']:.1f}" if report["error_max"] is not None else "-"
+    print(f"{name}: {report['succeeded']}/{report['runs']} прогонов, {report['steps']} шагов "
+          f"за {report['elapsed']:.1f}с ({per_minute:.0f} шагов/мин)")
+    print(f"  клики: {report['clicks']}, в нужный элемент {report['correct']}, мимо {report['missed']}, "
+          f"ошибка от центра p50 {error_p50} px, макс {error_max} px, повторных по кнопкам {report['repeated']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогон автоматизации на симуляторе экрана")
+    parser.add_argument("--target", choices=["stg", "work", "both"], default="both")
+    parser.add_argument("--runs", type=int, default=50, help="Прогонов сценария на каждую цель")
+    parser.add_argument("--seed", type=int, default=None, help="Зерно (разрешения, темы, раскладки)")
+    parser.add_argument("--late-effect", type=float, default=0.0,
+                        help="Задержка срабатывания кнопок, с (проверка отсутствия повторных кликов)")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    reports = []
+    if args.target in ("stg", "both"):
+        reports.append(("ypp_stg", run_stg(args.runs, rng, args.late_effect)))
+        print_report(*reports[-1])
+    if args.target in ("work", "both"):
+        reports.append(("ypp_work", run_work(args.runs, rng, args.late_effect)))
+        print_report(*reports[-1])
+    if args.late_effect and any(report["repeated"] for _, report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
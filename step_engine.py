@@ -0,0 +1,318 @@
+"""
+Асинхронный движок шагов для BrowserAutomation
+
+Вместо фиксированных пауз (step_delay, wait_for_load) движок следит за экраном
+и переходит к следующему шагу, как только страница изменилась и успокоилась.
+Заданные паузы становятся верхней границей ожидания. Пока идет ожидание,
+выполняется предзагрузка, объявленная следующим шагом в поле "prefetch":
+
+    "capture"      - кадр готового экрана становится общим кадром шага (FrameProvider)
+    "ocr"          - по этому кадру заранее строится OCR
+    "warm_vision"  - прогрев соединений с vision провайдерами
+
+Блокирующие вызовы (pyautogui, pytesseract, шаги BrowserAutomation) выполняются
+в пуле потоков. Поле шага "deadline" ограничивает время его выполнения: по
+истечении шаг получает флаг отмены (клики не выполняются, паузы и гонка
+стратегий прерываются), и движок дожидается его потока, прежде чем идти дальше.
+
+run_flow выполняет сценарий как конечный автомат: состояние экрана
+распознается (screen_state), и шаг выбирается по состоянию, поэтому
+пропущенные экраны не ждут и не кликаются вслепую, а сценарий продолжается
+с того места, где сейчас находится браузер.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from frame_provider import SharedFrame, frame_diff
+from screen_state import ScreenStateRecognizer
+
+# Предзагрузка по умолчанию для шагов поиска элементов
+DEFAULT_SMART_PREFETCH = ["capture", "ocr", "warm_vision"]
+
+
+class AsyncStepEngine:
+    """Выполнение списка шагов с ожиданием готовности экрана и предзагрузкой"""
+
+    def __init__(self, automation):
+        """
+        Args:
+            automation: Экземпляр BrowserAutomation
+        """
+        self.automation = automation
+        self.config = automation.config["engine"]
+        self.log = automation.log
+        self.executor = ThreadPoolExecutor(max_workers=self.config["max_workers"],
+                                           thread_name_prefix="step-engine")
+        self.background: List[asyncio.Task] = []
+
+    async def run_blocking(self, func: Callable, *args) -> Any:
+        """Выполнение блокирующей функции в пуле потоков"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def grab(self) -> SharedFrame:
+        """Новый кадр вне общего кэша (общим станет только кадр готового экрана)"""
+        return SharedFrame(self.automation.grab_screen())
+
+    async def wait_until_ready(self, max_wait: float) -> Optional[SharedFrame]:
+        """
+        Ожидание готовности экрана
+
+        Экран готов, когда он изменился и не меняется settle секунд. Если за
+        change_grace секунд изменений нет и экран стабилен - тоже готов.
+
+        Args:
+            max_wait: Верхняя граница ожидания, с
+
+        Returns:
+            Последний снятый кадр (готового экрана или на момент таймаута)
+        """
+        poll_interval = self.config["poll_interval"]
+        settle = self.config["settle"]
+        change_grace = self.config["change_grace"]
+        threshold = self.config["change_threshold"]
+
+        start = time.monotonic()
+        try:
+            previous = await self.run_blocking(self.grab)
+        except Exception as e:
+            self.log(f"Не удалось снять кадр, ждем {max_wait}с: {e}", "WARNING")
+            await asyncio.sleep(max_wait)
+            return None
+
+        changed = False
+        stable_since = time.monotonic()
+
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed >= max_wait:
+                self.log(f"Экран не успокоился за {max_wait}с, продолжаем", "DEBUG")
+                return previous
+
+            await asyncio.sleep(min(poll_interval, max_wait - elapsed))
+            frame = await self.run_blocking(self.grab)
+            diff = await self.run_blocking(frame_diff, previous, frame)
+            now = time.monotonic()
+
+            if diff > threshold:
+                changed = True
+                stable_since = now
+            elif now - stable_since >= settle and (changed or now - start >= change_grace):
+                self.log(f"Экран готов через {now - start:.1f}с (макс. {max_wait}с)", "DEBUG")
+                return frame
+
+            previous = frame
+
+    async def prefetch(self, kind: str, ready: asyncio.Future):
+        """Предзагрузка одного вида для следующего шага"""
+        try:
+            if kind == "warm_vision":
+                await asyncio.wrap_future(self.automation.vision_client.warm_in_background())
+                return
+
+            frame = await ready
+            if frame is None:
+                return
+
+            if kind == "ocr":
+                await self.run_blocking(frame.ocr_words)
+                self.log("OCR следующего экрана построен заранее", "DEBUG")
+
+        except Exception as e:
+            self.log(f"Предзагрузка '{kind}' не удалась: {e}", "DEBUG")
+
+    def prefetch_kinds(self, step: Dict) -> List[str]:
+        """Что предзагружать перед шагом"""
+        if "prefetch" in step:
+            return step["prefetch"]
+        if step.get("type", "").startswith("smart_"):
+            return DEFAULT_SMART_PREFETCH
+        return []
+
+    async def wait_before(self, step: Dict, max_wait: float):
+        """Ожидание готовности экрана с параллельной предзагрузкой для шага"""
+        ready = asyncio.get_running_loop().create_future()
+        kinds = self.prefetch_kinds(step)
+        for kind in kinds:
+            self.background.append(asyncio.create_task(self.prefetch(kind, ready)))
+
+        frame = await self.wait_until_ready(max_wait)
+        # Кадр делаем общим сразу, до запуска шага (задачи предзагрузки стартуют позже)
+        if frame is not None and {"capture", "ocr"} & set(kinds):
+            self.automation.frames.put(frame)
+        ready.set_result(frame)
+
+    async def execute(self, step: Dict) -> bool:
+        """Выполнение шага в пуле потоков с дедлайном"""
+        deadline = step.get("deadline", self.config["step_deadline"])
+        if self.automation.step_cancelled():
+            self.log(f"Шаг '{step.get('name', 'unknown')}' пропущен: запуск отменен", "WARNING")
+            return False
+        cancel = threading.Event()
+        task = asyncio.ensure_future(self.run_blocking(self.automation.execute_step, step, cancel))
+        if not deadline:
+            return await task
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=deadline)
+        except asyncio.TimeoutError:
+            self.log(f"Шаг '{step.get('name', 'unknown')}' не уложился в дедлайн {deadline}с", "ERROR")
+            # wait_for только перестает ждать: поток шага еще работает и не должен кликать
+            # во время следующего шага - отменяем и дожидаемся его
+            cancel.set()
+            try:
+                await task
+            except Exception as e:
+                self.log(f"Отмененный шаг завершился ошибкой: {e}", "DEBUG")
+            return False
+
+    async def run(self, steps: List[Dict]) -> bool:
+        """
+        Выполнение шагов
+
+        Подряд идущие паузы (step_delay между шагами и шаги wait_for_load)
+        сливаются в одно ожидание готовности экрана с суммарной верхней границей.
+        Шаги delay остаются фиксированными паузами.
+        """
+        self.log("🚀 Запуск автоматизации (асинхронный движок)")
+        step_delay = self.automation.config["screen"]["step_delay"]
+        wait_budget = 0.0
+        started = time.monotonic()
+
+        try:
+            for i, step in enumerate(steps):
+                step_type = step.get("type", "unknown")
+                self.log(f"Шаг {i+1}/{len(steps)}")
+
+                if step_type == "wait_for_load":
+                    wait_budget += step.get("seconds", 3)
+                    continue
+
+                if i > 0:
+                    wait_budget += step_delay
+                if wait_budget:
+                    await self.wait_before(step, wait_budget)
+                    wait_budget = 0.0
+
+                if step_type == "delay":
+                    delay = step.get("seconds", 1)
+                    self.log(f"Ожидание {delay} секунд")
+                    await asyncio.sleep(delay)
+                    continue
+
+                if not await self.execute(step):
+                    self.log(f"Шаг {i+1} не выполнен", "ERROR")
+                    return False
+
+            self.log(f"🎉 Автоматизация завершена успешно за {time.monotonic() - started:.1f}с!", "SUCCESS")
+            return True
+
+        except Exception as e:
+            self.log(f"Критическая ошибка: {e}", "ERROR")
+            return False
+
+        finally:
+            await self.shutdown()
+
+    async def run_flow(self, flow: Dict, recognizer: ScreenStateRecognizer) -> bool:
+        """
+        Выполнение сценария по распознанному состоянию экрана
+
+        Args:
+            flow: Сценарий:
+                "setup" - шаги перед сценарием (например, поиск браузера),
+                "transitions" - состояние -> шаг,
+                "terminal" - состояния завершения,
+                "timeout" - общий лимит, с; "max_wait" - лимит ожидания готовности экрана, с;
+                "stuck_limit" - сколько раз подряд допускается одно и то же состояние после шага;
+                "unknown_limit" - сколько раз подряд допускается нераспознанный экран
+            recognizer: Распознаватель состояний
+
+        Returns:
+            True, если достигнуто терминальное состояние
+        """
+        transitions = flow.get("transitions", {})
+        terminal = set(flow.get("terminal", []))
+        max_wait = flow.get("max_wait", 8)
+        stuck_limit = flow.get("stuck_limit", 3)
+        unknown_limit = flow.get("unknown_limit", 5)
+        started = time.monotonic()
+        deadline = started + flow.get("timeout", 120)
+
+        self.log("🚀 Запуск сценария по состояниям экрана")
+        try:
+            for step in flow.get("setup", []):
+                if not await self.execute(step):
+                    self.log(f"Подготовительный шаг '{step.get('name', 'unknown')}' не выполнен", "ERROR")
+                    return False
+
+            frame = await self.run_blocking(self.grab)
+            previous_state, repeats, unknown = None, 0, 0
+
+            while time.monotonic() < deadline:
+                if self.automation.step_cancelled():
+                    self.log("Сценарий отменен", "WARNING")
+                    return False
+                state = await self.run_blocking(recognizer.classify, frame)
+
+                if state in terminal:
+                    self.log(f"🎉 Сценарий завершен в состоянии '{state}' за "
+                             f"{time.monotonic() - started:.1f}с", "SUCCESS")
+                    return True
+
+                step = transitions.get(state)
+                if step is None:
+                    unknown += 1
+                    if unknown > unknown_limit:
+                        self.log(f"Экран не распознан {unknown} раз подряд", "ERROR")
+                        return False
+                    self.log(f"Нет шага для состояния '{state}', ждем изменения экрана", "DEBUG")
+                    frame = await self.wait_until_ready(max_wait) or await self.run_blocking(self.grab)
+                    continue
+                unknown = 0
+
+                # Пока шел OCR, экран мог измениться - тогда распознаем заново
+                current = await self.run_blocking(self.grab)
+                if await self.run_blocking(frame_diff, frame, current) > self.config["change_threshold"]:
+                    frame = current
+                    continue
+                frame.timestamp = time.monotonic()
+
+                repeats = repeats + 1 if state == previous_state else 1
+                if repeats > stuck_limit:
+                    self.log(f"Состояние '{state}' не меняется после {stuck_limit} попыток", "ERROR")
+                    if recognizer.last_method == "hash":
+                        recognizer.forget(state, frame)
+                    return False
+                previous_state = state
+
+                # Кадр (и его OCR) уже распознан - резолверы шага работают на нем же, без ожиданий
+                self.automation.frames.put(frame)
+                self.log(f"Состояние '{state}' -> шаг '{step.get('name', step.get('type'))}'")
+                if not await self.execute({**step, "wait_for_change": 0}):
+                    self.log(f"Шаг для состояния '{state}' не выполнен", "WARNING")
+                    # Состояние по хэшу шаг не подтвердил - в следующий раз распознаем по признакам
+                    if recognizer.last_method == "hash":
+                        recognizer.forget(state, frame)
+
+                frame = await self.wait_until_ready(max_wait) or await self.run_blocking(self.grab)
+
+            self.log(f"Сценарий не завершен за {flow.get('timeout', 120)}с", "ERROR")
+            return False
+
+        except Exception as e:
+            self.log(f"Критическая ошибка: {e}", "ERROR")
+            return False
+
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        """Отмена фоновой предзагрузки и остановка пула потоков"""
+        for task in self.background:
+            task.cancel()
+        await asyncio.gather(*self.background, return_exceptions=True)
+        self.executor.shutdown(wait=False)
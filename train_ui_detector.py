@@ -0,0 +1,189 @@
+"""
+Обучение и экспорт UI детектора (ui_detector.py) в ONNX
+
+Датасет в формате YOLO собирается из двух источников:
+    - синтетические экраны screen_sim: все сцены, разрешения, темы и сдвиги
+      раскладки; разметка - точные боксы всех элементов сцены;
+    - размеченные корпуса resolver_eval (labels.jsonl со скриншотами реальных
+      запусков): бокс цели, класс - по типу шага, экрану или команде. Остальные
+      элементы таких кадров не размечены - чтобы модель не училась считать их
+      фоном (и подавлять button / text_input), от кадра остается только
+      окрестность целей, все остальное закрашивается серым, как поля letterbox.
+      Корпуса дополняют синтетику, а не заменяют ее.
+
+Обучение - Ultralytics YOLOv8n на CPU (pip install ultralytics), экспорт в ONNX
+с динамическим batch; имена классов записываются в метаданные модели.
+
+Использование:
+python train_ui_detector.py --sim 3000 --corpus corpus_real --epochs 60 --output models/ui_detector.onnx
+python train_ui_detector.py --sim 500 --dataset-only  # только датасет (ui_dataset/)
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+from typing import Dict, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from ui_detector import CLASSES
+
+Box = Tuple[int, int, int, int]
+
+# Элементы симулятора -> классы детектора (остальные по роли: button/link - button, textbox - text_input)
+SIM_CLASSES = {
+    "google_button": "google",
+    "email_account": "account_row",
+    "continue_button": "continue",
+    "sign_button": "sign",
+    "prefer_a": "prefer",
+    "prefer_b": "prefer",
+}
+ROLE_CLASSES = {"button": "button", "link": "button", "textbox": "text_input"}
+
+# Цель размеченного корпуса -> класс (по типу шага ypp_stg)
+STEP_CLASSES = {
+    "smart_google_click": "google",
+    "smart_email_click": "account_row",
+    "smart_continue_click": "continue",
+}
+# Кнопка Sign окна подписи Rabby: экран (состояние ypp_stg) или точная команда
+# (подстрока "sign" есть и в командах входа через Google - "Sign in")
+SIGN_SCREENS = {"rabby_sign"}
+SIGN_COMMANDS = {"sign", "нажми sign", "click sign", "нажми кнопку sign", "click the sign button"}
+# Видимая окрестность целей кадра корпуса: высота бокса, но не меньше CONTEXT_MIN пикселей
+# (по ширине широкой кнопки в окрестность попали бы соседние неразмеченные элементы)
+CONTEXT_MIN = 24
+MASK_COLOR = (114, 114, 114)
+
+
+def corpus_class(sample) -> Optional[str]:
+    """Класс цели размеченного скриншота: по типу шага или экрану, иначе по команде ypp_work"""
+    if sample.step in STEP_CLASSES:
+        return STEP_CLASSES[sample.step]
+    command = " ".join((sample.command or "").lower().split())
+    if sample.screen in SIGN_SCREENS or command in SIGN_COMMANDS:
+        return "sign"
+    if "prefer" in command:
+        return "prefer"
+    return None
+
+
+def mask_unlabeled(image: Image.Image, boxes: Sequence[Box]) -> Image.Image:
+    """Кадр, где видны только цели с окрестностью (неразмеченные элементы не станут фоном)"""
+    canvas = Image.new("RGB", image.size, MASK_COLOR)
+    for left, top, width, height in boxes:
+        pad = max(CONTEXT_MIN, height)
+        area = (max(0, left - pad), max(0, top - pad),
+                min(image.width, left + width + pad), min(image.height, top + height + pad))
+        canvas.paste(image.crop(area), area[:2])
+    return canvas
+
+
+def yolo_line(label: str, box: Box, size: Tuple[int, int]) -> str:
+    left, top, width, height = box
+    image_width, image_height = size
+    return (f"{CLASSES.index(label)} {(left + width / 2) / image_width:.6f} {(top + height / 2) / image_height:.6f} "
+            f"{width / image_width:.6f} {height / image_height:.6f}")
+
+
+def sim_samples(count: int, rng: random.Random):
+    """(изображение, [(класс, бокс)]) синтетических экранов"""
+    from screen_sim import RESOLUTIONS, SCENES, THEMES, SimScreen
+
+    questions = ["What is the tallest mountain?", "Explain recursion", "Best pasta recipe?"]
+    scenes = [scene for scene in SCENES if scene != "done"]
+    for index in range(count):
+        scene = scenes[index % len(scenes)]
+        screen = SimScreen(scene, size=rng.choice(RESOLUTIONS), theme=rng.choice(list(THEMES)),
+                           jitter=0.04, seed=rng.randrange(1 << 30))
+        if scene == "yupp_chat" and rng.random() < 0.8:
+            screen.messages.append(("user", rng.choice(questions)))
+            screen.version += 1
+        labels = []
+        for widget in screen.widgets():
+            label = SIM_CLASSES.get(widget.name) or ROLE_CLASSES.get(widget.role)
+            if label:
+                labels.append((label, widget.box))
+        yield screen.image().copy(), labels
+
+
+def corpus_samples(directories: Sequence[str]):
+    from resolver_eval import load_corpus
+
+    for directory in directories:
+        for sample in load_corpus(directory):
+            label = corpus_class(sample)
+            if label is None:
+                continue
+            with Image.open(sample.image) as image:
+                yield mask_unlabeled(image.convert("RGB"), sample.boxes), [(label, box) for box in sample.boxes]
+
+
+def build_dataset(directory: str, sim: int, corpora: Sequence[str], val_fraction: float = 0.1,
+                  seed: int = None) -> str:
+    """Датасет YOLO (images/, labels/, data.yaml); возвращает путь к data.yaml"""
+    rng = random.Random(seed)
+    for split in ("train", "val"):
+        os.makedirs(os.path.join(directory, "images", split), exist_ok=True)
+        os.makedirs(os.path.join(directory, "labels", split), exist_ok=True)
+
+    counts: Dict[str, int] = {label: 0 for label in CLASSES}
+    total = 0
+    sources = [("sim", sim_samples(sim, rng)), ("corpus", corpus_samples(corpora))]
+    for source, samples in sources:
+        for image, labels in samples:
+            split = "val" if rng.random() < val_fraction else "train"
+            name = f"{source}_{total:05d}"
+            image.save(os.path.join(directory, "images", split, f"{name}.png"), compress_level=1)
+            with open(os.path.join(directory, "labels", split, f"{name}.txt"), "w") as f:
+                f.write("\n".join(yolo_line(label, box, image.size) for label, box in labels) + "\n")
+            for label, _ in labels:
+                counts[label] += 1
+            total += 1
+
+    data_path = os.path.join(directory, "data.yaml")
+    with open(data_path, "w", encoding="utf-8") as f:
+        f.write(f"path: {os.path.abspath(directory)}\ntrain: images/train\nval: images/val\n")
+        f.write(f"names: {json.dumps(list(CLASSES))}\n")
+    print(f"Датасет {directory}: {total} кадров, объекты по классам {counts}")
+    return data_path
+
+
+def train(data_path: str, base: str, epochs: int, image_size: int, batch: int, output: str) -> str:
+    """Обучение YOLOv8 на CPU и экспорт в ONNX (динамический batch)"""
+    from ultralytics import YOLO
+
+    model = YOLO(base)
+    model.train(data=data_path, epochs=epochs, imgsz=image_size, batch=batch, device="cpu",
+                project="ui_detector_runs", name="train", exist_ok=True)
+    exported = model.export(format="onnx", imgsz=image_size, dynamic=True, simplify=True)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    shutil.copy(exported, output)
+    print(f"Модель: {output}")
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обучение UI детектора и экспорт в ONNX")
+    parser.add_argument("--sim", type=int, default=2000, help="Синтетических кадров")
+    parser.add_argument("--corpus", nargs="*", default=[], help="Каталоги размеченных корпусов (labels.jsonl)")
+    parser.add_argument("--dataset", default="ui_dataset", help="Каталог датасета")
+    parser.add_argument("--dataset-only", action="store_true", help="Только собрать датасет")
+    parser.add_argument("--base", default="yolov8n.pt", help="Исходные веса Ultralytics")
+    parser.add_argument("--epochs", type=int, default=60)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="models/ui_detector.onnx")
+    args = parser.parse_args()
+
+    data_path = build_dataset(args.dataset, args.sim, args.corpus, seed=args.seed)
+    if not args.dataset_only:
+        train(data_path, args.base, args.epochs, args.imgsz, args.batch, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Локальный детектор элементов интерфейса (ONNX Runtime, только CPU)
+
+Небольшая модель обнаружения объектов (YOLOv8n, экспорт train_ui_detector.py)
+находит на кадре кнопки, поля ввода и конкретные цели скриптов: кнопки
+prefer, Continue, строки аккаунтов Google, кнопку Sign (Rabby) и кнопку входа
+через Google. Без сети и токенов, десятки миллисекунд на кадр - поэтому
+детектор стоит уровнем перед платными vision моделями.
+
+Формат выхода модели - как у экспорта Ultralytics: (N, 4 + классы, якоря),
+боксы cx, cy, w, h в пикселях входа. Кадры приводятся к input_size с
+сохранением пропорций (letterbox) и идут пакетом, если вход модели допускает
+динамический batch. Имена классов берутся из метаданных модели, иначе CLASSES.
+
+Зависимость опциональна: pip install onnxruntime
+
+Замер на своем CPU:
+python ui_detector.py bench models/ui_detector.onnx corpus_sim/*.png --batch 1 4 8
+"""
+
+import argparse
+import ast
+import glob
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+CLASSES = ("button", "text_input", "prefer", "continue", "account_row", "sign", "google")
+
+
+@dataclass
+class UIDetection:
+    """Найденный элемент"""
+    label: str
+    confidence: float
+    box: Tuple[int, int, int, int]  # left, top, width, height в пикселях кадра
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        left, top, width, height = self.box
+        return (left + width // 2, top + height // 2)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> List[int]:
+    """Подавление пересекающихся боксов (x1, y1, x2, y2); индексы оставленных по убыванию score"""
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(int(best))
+        rest = order[1:]
+        x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        iou = inter / (areas[best] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return keep
+
+
+class UIDetector:
+    """Детектор элементов интерфейса на ONNX Runtime (CPUExecutionProvider)"""
+
+    def __init__(self, model_path: str, classes: Sequence[str] = CLASSES, input_size: int = 640,
+                 conf_threshold: float = 0.35, iou_threshold: float = 0.45, threads: int = None,
+                 max_batch: int = 8, log: Callable[[str, str], None] = None):
+        """
+        Args:
+            model_path: Файл .onnx
+            classes: Имена классов, если их нет в метаданных модели
+            input_size: Сторона входа модели (если вход не фиксирован в модели)
+            conf_threshold: Минимальная уверенность детекции
+            iou_threshold: Порог пересечения для подавления дублей
+            threads: Потоков ONNX Runtime (None - по числу ядер)
+            max_batch: Кадров в одном вызове модели
+            log: Функция логирования вида log(message, level)
+        """
+        import onnxruntime as ort
+
+        self.log = log or (lambda message, level="INFO": None)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        self.input_size = height if isinstance(height, int) and height == width else input_size
+        self.dynamic_batch = not isinstance(batch, int)
+        self.max_batch = max_batch if self.dynamic_batch else (batch or 1)
+
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        if names:
+            parsed = ast.literal_eval(names)  # Ultralytics: "{0: 'button', 1: ...}"
+            self.classes = [parsed[index] for index in sorted(parsed)] if isinstance(parsed, dict) else list(parsed)
+        else:
+            self.classes = list(classes)
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.stats = {"frames": 0, "batches": 0, "ms": 0.0}
+        self.log(f"UI детектор {model_path}: вход {self.input_size}px, "
+                 f"batch {'динамический' if self.dynamic_batch else self.max_batch}, классы {self.classes}", "DEBUG")
+
+    def _prepare(self, image) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+        """Letterbox к input_size: (CHW float32, масштаб, отступы x, y)"""
+        image = getattr(image, "image", image)  # SharedFrame или PIL
+        image = image.convert("RGB")
+        size = self.input_size
+        scale = min(size / image.width, size / image.height)
+        width, height = max(1, round(image.width * scale)), max(1, round(image.height * scale))
+        pad = ((size - width) / 2, (size - height) / 2)
+        canvas = Image.new("RGB", (size, size), (114, 114, 114))
+        canvas.paste(image.resize((width, height), Image.Resampling.BILINEAR), (int(pad[0]), int(pad[1])))
+        array = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1) / 255.0
+        return array, scale, (int(pad[0]), int(pad[1]))
+
+    def _decode(self, output: np.ndarray, scale: float, pad: Tuple[float, float]) -> List[UIDetection]:
+        predictions = output.T  # (якоря, 4 + классы)
+        scores = predictions[:, 4:]
+        labels = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), labels]
+        mask = confidences >= self.conf_threshold
+        if not mask.any():
+            return []
+        predictions, labels, confidences = predictions[mask], labels[mask], confidences[mask]
+        cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / scale
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / scale
+
+        detections = []
+        for label in np.unique(labels):
+            index = np.where(labels == label)[0]
+            for keep in nms(boxes[index], confidences[index], self.iou_threshold):
+                x1, y1, x2, y2 = boxes[index[keep]]
+                name = self.classes[label] if label < len(self.classes) else str(label)
+                detections.append(UIDetection(name, float(confidences[index[keep]]),
+                                              (int(x1), int(y1), int(x2 - x1), int(y2 - y1))))
+        detections.sort(key=lambda detection: -detection.confidence)
+        return detections
+
+    def detect_batch(self, images: Sequence) -> List[List[UIDetection]]:
+        """Детекции для каждого кадра (кадры идут в модель пакетами по max_batch)"""
+        results = []
+        for start in range(0, len(images), self.max_batch):
+            chunk = [self._prepare(image) for image in images[start:start + self.max_batch]]
+            started = time.perf_counter()
+            outputs = self.session.run(None, {self.input_name: np.stack([item[0] for item in chunk])})[0]
+            self.stats["ms"] += (time.perf_counter() - started) * 1000
+            self.stats["batches"] += 1
+            self.stats["frames"] += len(chunk)
+            results.extend(self._decode(output, scale, pad) for output, (_, scale, pad) in zip(outputs, chunk))
+        return results
+
+    def detect(self, image) -> List[UIDetection]:
+        return self.detect_batch([image])[0]
+
+    def find(self, label: str, image) -> Optional[UIDetection]:
+        """Самая уверенная детекция класса label (None - нет)"""
+        return next((detection for detection in self.detect(image) if detection.label == label), None)
+
+    def ms_per_frame(self) -> Optional[float]:
+        """Среднее время модели на кадр, мс (без подготовки изображения)"""
+        return self.stats["ms"] / self.stats["frames"] if self.stats["frames"] else None
+
+
+def load_detector(config: Dict, log: Callable[[str, str], None] = None) -> Optional[UIDetector]:
+    """
+    Детектор по конфигурации {"enabled", "model", "conf_threshold", "threads", ...}
+    (None - выключен, нет файла модели или onnxruntime)
+    """
+    log = log or (lambda message, level="INFO": None)
+    if not config.get("enabled", True) or not config.get("model"):
+        return None
+    try:
+        return UIDetector(config["model"], input_size=config.get("input_size", 640),
+                          conf_threshold=config.get("conf_threshold", 0.35),
+                          iou_threshold=config.get("iou_threshold", 0.45),
+                          threads=config.get("threads"), max_batch=config.get("max_batch", 8), log=log)
+    except ImportError:
+        log("UI детектор выключен: pip install onnxruntime", "DEBUG")
+    except Exception as e:
+        log(f"UI детектор не загружен ({config['model']}): {e}", "DEBUG")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UI детектор: детекции и замер скорости на CPU")
+    parser.add_argument("command", choices=["detect", "bench"])
+    parser.add_argument("model", help="Файл .onnx")
+    parser.add_argument("images", nargs="+", help="Изображения (можно шаблоны)")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4, 8], help="Размеры пакета для bench")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--conf", type=float, default=0.35)
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов bench на каждый размер пакета")
+    args = parser.parse_args()
+
+    paths = sorted({path for pattern in args.images for path in glob.glob(pattern)})
+    images = [Image.open(path).convert("RGB") for path in paths]
+    if not images:
+        parser.error("нет изображений")
+
+    if args.command == "detect":
+        detector = UIDetector(args.model, conf_threshold=args.conf, threads=args.threads)
+        for path, detections in zip(paths, detector.detect_batch(images)):
+            print(path)
+            for detection in detections:
+                print(f"  {detection.label:12} {detection.confidence:.2f} {detection.box}")
+        print(f"{detector.ms_per_frame():.1f} мс/кадр")
+        return
+
+    for batch in args.batch:
+        detector = UIDetector(args.model, conf_threshold=args.conf, threads=args.threads, max_batch=batch)
+        detector.detect_batch(images[:batch])  # прогрев
+        detector.stats = {"frames": 0, "batches": 0, "ms": 0.0}
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            detector.detect_batch(images)
+        total = (time.perf_counter() - started) * 1000 / (len(images) * args.repeat)
+        print(f"batch {detector.max_batch}: модель {detector.ms_per_frame():.1f} мс/кадр, "
+              f"с подготовкой и разбором {total:.1f} мс/кадр")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Пакетные vision запросы нескольких исполнителей (профилей) одним вызовом модели
+
+Когда несколько исполнителей одновременно анализируют экраны одного типа, каждый
+отправляет полный запрос с одинаковым длинным системным промптом. Пакетный слой
+собирает такие запросы в окне window секунд (или пока не наберется max_batch) и
+отправляет один запрос: системный промпт один раз, затем скриншоты с пометкой
+"Request k". Модель отвечает JSON {"answers": [{"k": k, "a": <ответ>}]}, где
+ответ - то же, что она ответила бы на запрос k отдельно.
+
+Каждый ответ проверяется валидатором и confident своего вызывающего; координаты
+в ответе - пиксели своего изображения, поэтому пересчет в точки клика остается
+у вызывающего (как и при одиночном запросе). Невалидный, неуверенный или
+отсутствующий ответ - вызывающий сразу повторяет запрос отдельно (с эскалацией).
+Добавленная задержка ограничена окном: запрос, оставшийся в окне один, уходит
+как обычный.
+
+Пакет отправляет первый вызывающий (лидер) через свой ModelRouter в своем event
+loop; остальные ждут результат - исполнители могут работать в разных потоках и
+разных event loop. В журнал стоимости лидера пишется один вызов с purpose
+batch_<purpose>.
+
+Пакетные API провайдеров (OpenAI Batch) отвечают за минуты и часы - для шагов
+автоматизации не подходят, поэтому пакет - это один многокартиночный запрос.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from vision_client import NOT_FOUND, VisionResult
+
+BATCH_PROMPT = """
+You will receive several independent requests, each marked "Request k:" and followed by its screenshot.
+Answer every request exactly as you would answer it alone; coordinates refer to that request's own image.
+Respond with JSON only: {"answers": [{"k": <request number>, "a": <your answer to that request>}]}"""
+
+
+@dataclass
+class _Item:
+    messages: List[Dict]
+    validator: Callable[[str], Any]
+    confident: Optional[Callable[[Any], bool]]
+    max_tokens: int
+    future: Future = field(default_factory=Future)
+
+
+@dataclass
+class _Batch:
+    key: tuple
+    items: List[_Item] = field(default_factory=list)
+    full: Future = field(default_factory=Future)
+
+
+def parse_answers(content: str, count: int) -> Optional[Dict[int, str]]:
+    """Ответ пакета -> номер запроса (с 1) -> текст ответа; None - ответ не по схеме"""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("answers"), list):
+        return None
+    answers = {}
+    for entry in data["answers"]:
+        if not isinstance(entry, dict) or not isinstance(entry.get("k"), int) or "a" not in entry:
+            continue
+        if 1 <= entry["k"] <= count:
+            answer = entry["a"]
+            answers[entry["k"]] = answer if isinstance(answer, str) else json.dumps(answer, ensure_ascii=False)
+    return answers or None
+
+
+class VisionBatcher:
+    """Сборка одновременных запросов одного типа в один многокартиночный вызов"""
+
+    def __init__(self, window: float = 0.05, max_batch: int = 6,
+                 log: Callable[[str, str], None] = None):
+        """
+        Args:
+            window: Сколько ждать попутные запросы после первого, с
+            max_batch: Максимум запросов в пакете (дальше - отправка сразу)
+            log: Функция логирования вида log(message, level)
+        """
+        self.window = window
+        self.max_batch = max_batch
+        self.log = log or (lambda message, level="INFO": None)
+        self._lock = threading.Lock()
+        self._open: Dict[tuple, _Batch] = {}
+        self.stats = {"requests": 0, "batches": 0, "batched": 0, "solo": 0, "retried": 0}
+
+    @staticmethod
+    def _key(task: str, messages: List[Dict]) -> Optional[tuple]:
+        """Ключ совместимости: тип запроса и системный промпт (None - запрос не пакетируется)"""
+        if (len(messages) != 2 or messages[0].get("role") != "system"
+                or messages[1].get("role") != "user" or not isinstance(messages[1].get("content"), list)):
+            return None
+        return (task, messages[0]["content"])
+
+    async def request(self, router, task: str, messages: List[Dict], validator: Callable[[str], Any] = None,
+                      confident: Callable[[Any], bool] = None, max_tokens: int = 300,
+                      extra: Dict = None, purpose: str = "") -> Optional[VisionResult]:
+        """
+        Запрос через пакет (аргументы как у ModelRouter.request)
+
+        extra одиночного запроса (например, строгая схема ответа) в пакете заменяется на
+        json_object, при повторе отдельно - используется как есть.
+        """
+        validator = validator or (lambda content: content)
+        key = self._key(task, messages)
+        self.stats["requests"] += 1
+        if key is None or self.window <= 0:
+            self.stats["solo"] += 1
+            return await router.request(task, messages, validator=validator, confident=confident,
+                                        max_tokens=max_tokens, extra=extra, purpose=purpose)
+
+        item = _Item(messages, validator, confident, max_tokens)
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch(key)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch:
+                del self._open[key]
+                batch.full.set_result(True)
+
+        if leader:
+            try:
+                try:
+                    await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(batch.full)), self.window)
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    if self._open.get(key) is batch:
+                        del self._open[key]
+                await self._send(router, task, batch, purpose)
+            finally:
+                # Лидер упал или отменен - остальные не должны ждать вечно
+                for other in batch.items:
+                    if not other.future.done():
+                        other.future.set_result(None)
+
+        result = await asyncio.wrap_future(item.future)
+        if result is None:
+            # Ответа для этого запроса в пакете нет или он не прошел проверку - отдельный запрос
+            if len(batch.items) > 1:
+                self.stats["retried"] += 1
+            return await router.request(task, messages, validator=validator, confident=confident,
+                                        max_tokens=max_tokens, extra=extra, purpose=purpose)
+        return result
+
+    async def _send(self, router, task: str, batch: _Batch, purpose: str):
+        """Отправка пакета лидером и раздача ответов (None - вызывающий повторит запрос сам)"""
+        items = batch.items
+        if len(items) == 1:
+            self.stats["solo"] += 1
+            items[0].future.set_result(None)
+            return
+
+        content = []
+        for k, item in enumerate(items, 1):
+            parts = item.messages[1]["content"]
+            content.append({"type": "text", "text": f"Request {k}:"})
+            content.extend(parts)
+        messages = [{"role": "system", "content": batch.key[1] + "\n" + BATCH_PROMPT},
+                    {"role": "user", "content": content}]
+
+        started = time.monotonic()
+        try:
+            result = await router.request(
+                task, messages, validator=lambda text: parse_answers(text, len(items)),
+                max_tokens=sum(item.max_tokens for item in items) + 10 * len(items),
+                extra={"response_format": {"type": "json_object"}}, purpose=f"batch_{purpose or task}")
+        except Exception as e:
+            self.log(f"Пакет из {len(items)} запросов не отправлен: {e}", "WARNING")
+            result = None
+        self.stats["batches"] += 1
+        self.stats["batched"] += len(items)
+
+        answers = result.parsed if result else {}
+        delivered = 0
+        for k, item in enumerate(items, 1):
+            answer = answers.get(k)
+            parsed = None
+            if answer is not None:
+                try:
+                    parsed = item.validator(answer.strip())
+                except Exception:
+                    parsed = None
+            if parsed is not None and (item.confident is None or parsed is NOT_FOUND or item.confident(parsed)):
+                delivered += 1
+                item.future.set_result(VisionResult(
+                    provider=result.provider, model=result.model, content=answer, parsed=parsed,
+                    latency=time.monotonic() - started, latencies=result.latencies, outcomes=result.outcomes))
+            else:
+                item.future.set_result(None)
+        self.log(f"Пакет {task}: {len(items)} запросов одним вызовом, принято {delivered} ответов "
+                 f"за {time.monotonic() - started:.2f}с", "DEBUG")
@@ -0,0 +1,379 @@
+"""
+Провайдер-независимый клиент vision/chat моделей с хеджированием запросов
+
+Один и тот же запрос сначала уходит основному провайдеру. Если ответа нет
+за hedge_delay секунд (или провайдер вернул ошибку/мусор), запрос дублируется
+следующему провайдеру или модели. Берется первый валидный ответ, остальные
+запросы отменяются. По каждому провайдеру копится статистика побед и задержек.
+
+Валидатор возвращает None только для мусора. Определенный отрицательный ответ
+("цели на экране нет") - это NOT_FOUND: он принимается как обычный ответ, чтобы
+запрос об отсутствующей цели не оплачивался у всех провайдеров по очереди.
+
+Все провайдеры должны поддерживать OpenAI-совместимый /chat/completions
+(OpenAI, DeepSeek и т.п.) или отвечать локальным обработчиком (handler).
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from vision_ledger import VisionLedger, image_stats
+
+
+class _NotFound:
+    """Определенный отрицательный ответ модели (ложен в условиях)"""
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "NOT_FOUND"
+
+
+NOT_FOUND = _NotFound()
+
+
+@dataclass
+class VisionProvider:
+    """Описание провайдера модели"""
+    name: str
+    api_url: str
+    model: str
+    api_key: str = None
+    api_key_env: str = None  # переменная окружения с ключом, если api_key не задан
+    timeout: float = 30  # общий таймаут запроса
+    extra: Dict = field(default_factory=dict)  # дополнительные поля payload
+    handler: Callable[[Dict], Dict] = None  # локальный обработчик payload вместо HTTP (симулятор)
+
+    def resolve_key(self) -> Optional[str]:
+        return self.api_key or (os.getenv(self.api_key_env) if self.api_key_env else None)
+
+
+@dataclass
+class VisionResult:
+    """Результат хеджированного запроса"""
+    provider: str  # победивший провайдер
+    model: str
+    content: str  # сырой текст ответа
+    parsed: Any  # результат валидатора
+    latency: float  # задержка победителя, с
+    usage: Dict = field(default_factory=dict)
+    latencies: Dict[str, float] = field(default_factory=dict)  # задержки всех запущенных провайдеров
+    outcomes: Dict[str, str] = field(default_factory=dict)  # won / invalid / error / cancelled
+
+
+class HedgedVisionClient:
+    """Клиент с хеджированием: первый валидный ответ побеждает"""
+
+    def __init__(self, providers: List[VisionProvider], hedge_delay: float = None,
+                 min_hedge_delay: float = 1.5, default_hedge_delay: float = 4.0,
+                 log: Callable[[str, str], None] = None, ledger: VisionLedger = None):
+        """
+        Args:
+            providers: Провайдеры в порядке приоритета (первый - основной)
+            hedge_delay: Фиксированная задержка перед дублированием запроса;
+                None - адаптивная (p90 задержек основного провайдера)
+            min_hedge_delay: Нижняя граница адаптивной задержки
+            default_hedge_delay: Задержка, пока статистики мало
+            log: Функция логирования вида log(message, level)
+            ledger: Журнал токенов и стоимости (каждый вызов провайдера, включая дубли)
+        """
+        self.providers = [p for p in providers if p.resolve_key()]
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.log = log or (lambda message, level="INFO": None)
+        self.ledger = ledger
+        # Сессии с keep-alive соединениями (по одной на event loop) и фоновый loop для синхронного кода
+        self._sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self.stats: Dict[str, Dict] = {
+            p.name: {"calls": 0, "wins": 0, "errors": 0, "invalid": 0,
+                     "cancelled": 0, "latencies": deque(maxlen=200)}
+            for p in self.providers
+        }
+
+    def _session(self) -> aiohttp.ClientSession:
+        """Сессия текущего event loop; соединения переиспользуются между запросами"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession()
+            self._sessions[loop] = session
+        return session
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        """Фоновый event loop для вызовов из синхронного кода"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True,
+                                 name="vision-client").start()
+            return self._loop
+
+    def current_hedge_delay(self, primary: VisionProvider = None) -> float:
+        """Задержка перед отправкой дублирующего запроса (по задержкам основного провайдера)"""
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        primary = primary or (self.providers[0] if self.providers else None)
+        if primary is None:
+            return self.default_hedge_delay
+
+        latencies = sorted(self.stats[primary.name]["latencies"])
+        if len(latencies) < 10:
+            return self.default_hedge_delay
+        p90 = latencies[int(len(latencies) * 0.9) - 1]
+        return max(self.min_hedge_delay, p90)
+
+    async def _call(self, session: aiohttp.ClientSession, provider: VisionProvider,
+                    messages: List[Dict], max_tokens: int, temperature: float,
+                    extra: Dict = None) -> Dict:
+        """Один запрос к провайдеру"""
+        payload = {
+            "model": provider.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            **(extra or {}),
+            **provider.extra  # возможности конкретного провайдера важнее общих полей запроса
+        }
+        if provider.handler is not None:
+            return await asyncio.to_thread(provider.handler, payload)
+        headers = {
+            "Authorization": f"Bearer {provider.resolve_key()}",
+            "Content-Type": "application/json"
+        }
+        timeout = aiohttp.ClientTimeout(total=provider.timeout)
+
+        async with session.post(provider.api_url, json=payload, headers=headers, timeout=timeout) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise RuntimeError(f"{provider.name} API ошибка {response.status}: {error_text[:200]}")
+            return await response.json()
+
+    async def request(self, messages: List[Dict], validator: Callable[[str], Any] = None,
+                      max_tokens: int = 300, temperature: float = 0.1,
+                      extra: Dict = None, purpose: str = "",
+                      providers: List[VisionProvider] = None) -> Optional[VisionResult]:
+        """
+        Хеджированный запрос
+
+        Args:
+            messages: Сообщения в формате chat/completions
+            validator: Функция content -> parsed; None или исключение означает невалидный ответ,
+                NOT_FOUND - определенный отрицательный ответ (принимается, хеджирования нет)
+            max_tokens: Лимит токенов ответа
+            temperature: Температура
+            extra: Дополнительные поля payload для всех провайдеров
+            purpose: Назначение запроса для журнала стоимости
+            providers: Подмножество провайдеров клиента в порядке хеджирования (по умолчанию все)
+
+        Returns:
+            VisionResult победителя или None, если ни один провайдер не дал валидный ответ
+        """
+        providers = self.providers if providers is None else providers
+        if not providers:
+            self.log("Нет провайдеров с API ключом", "ERROR")
+            return None
+
+        validator = validator or (lambda content: content)
+        hedge_delay = self.current_hedge_delay(providers[0])
+        started: Dict[asyncio.Task, tuple] = {}
+        latencies: Dict[str, float] = {}
+        outcomes: Dict[str, str] = {}
+        next_index = 0
+        image = image_stats(messages) if self.ledger else (0, 0)
+
+        def account(provider: VisionProvider, outcome: str, latency: float, usage: Dict = None):
+            if self.ledger:
+                self.ledger.record(provider.name, provider.model, outcome, latency, usage, image, purpose)
+
+        session = self._session()
+
+        def launch():
+            nonlocal next_index
+            provider = providers[next_index]
+            next_index += 1
+            self.stats[provider.name]["calls"] += 1
+            task = asyncio.ensure_future(
+                self._call(session, provider, messages, max_tokens, temperature, extra))
+            started[task] = (provider, time.monotonic())
+            if next_index > 1:
+                self.log(f"Хеджирование: дублируем запрос в {provider.name}/{provider.model}", "DEBUG")
+
+        launch()
+        pending = set(started)
+        try:
+            while pending:
+                can_hedge = next_index < len(providers)
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    # Основной провайдер медлит - отправляем дубль
+                    launch()
+                    pending = {t for t in started if not t.done()}
+                    continue
+
+                for task in done:
+                    provider, start = started[task]
+                    latency = time.monotonic() - start
+                    latencies[provider.name] = latency
+                    stats = self.stats[provider.name]
+
+                    data = {}
+                    try:
+                        data = task.result()
+                        content = data['choices'][0]['message']['content'] or ""
+                        parsed = validator(content.strip())
+                    except Exception as e:
+                        stats["errors"] += 1
+                        outcomes[provider.name] = "error"
+                        account(provider, "error", latency, data.get("usage"))
+                        self.log(f"{provider.name}: {e}", "WARNING")
+                        continue
+
+                    stats["latencies"].append(latency)
+                    if parsed is None:
+                        stats["invalid"] += 1
+                        outcomes[provider.name] = "invalid"
+                        account(provider, "invalid", latency, data.get("usage"))
+                        continue
+
+                    stats["wins"] += 1
+                    outcomes[provider.name] = "won"
+                    account(provider, "parsed", latency, data.get("usage"))
+                    self.log(f"Ответ от {provider.name} за {latency:.2f}с", "DEBUG")
+                    return VisionResult(
+                        provider=provider.name,
+                        model=provider.model,
+                        content=content,
+                        parsed=parsed,
+                        latency=latency,
+                        usage=data.get("usage") or {},
+                        latencies=latencies,
+                        outcomes=outcomes
+                    )
+
+                # Ошибка или невалидный ответ - сразу пробуем следующего провайдера
+                if next_index < len(providers):
+                    launch()
+                    pending = {t for t in started if not t.done()}
+
+            return None
+
+        finally:
+            for task, (provider, start) in started.items():
+                if not task.done():
+                    task.cancel()
+                    stats = self.stats[provider.name]
+                    stats["cancelled"] += 1
+                    # Нижняя оценка задержки - чтобы адаптивная задержка не занижалась
+                    latencies[provider.name] = time.monotonic() - start
+                    stats["latencies"].append(latencies[provider.name])
+                    outcomes[provider.name] = "cancelled"
+                    account(provider, "cancelled", latencies[provider.name])
+            await asyncio.gather(*started, return_exceptions=True)
+
+    def run_sync(self, coroutine, cancel: threading.Event = None) -> Any:
+        """
+        Выполнение корутины в фоновом loop из синхронного кода (там же живут сессии request_sync)
+
+        cancel - флаг отмены вызывающего (например, проигравшей стратегии гонки): корутина
+        снимается, незавершенные запросы к провайдерам отменяются, результат - None.
+        Корутина видит contextvars вызывающего (контекст лога для атрибуции в журнале).
+        """
+        context = contextvars.copy_context()
+
+        async def in_caller_context():
+            for var, value in context.items():
+                var.set(value)
+            return await coroutine
+
+        future = asyncio.run_coroutine_threadsafe(in_caller_context(), self._background_loop())
+        if cancel is None:
+            return future.result()
+        done = threading.Event()
+        future.add_done_callback(lambda _: done.set())
+        while not done.wait(0.05):
+            if cancel.is_set():
+                future.cancel()
+                return None
+        return future.result()
+
+    def request_sync(self, *args, cancel: threading.Event = None, **kwargs) -> Optional[VisionResult]:
+        """Синхронная обертка для кода без event loop (запрос идет в фоновом loop)"""
+        return self.run_sync(self.request(*args, **kwargs), cancel)
+
+    async def warm(self):
+        """Прогрев соединений (DNS, TCP, TLS) со всеми провайдерами"""
+        session = self._session()
+
+        async def ping(provider: VisionProvider):
+            parts = urlsplit(provider.api_url)
+            try:
+                async with session.get(f"{parts.scheme}://{parts.netloc}/",
+                                       timeout=aiohttp.ClientTimeout(total=5)) as response:
+                    await response.read()
+            except Exception as e:
+                self.log(f"Прогрев {provider.name} не удался: {e}", "DEBUG")
+
+        await asyncio.gather(*(ping(p) for p in self.providers if p.handler is None))
+
+    def warm_in_background(self) -> Future:
+        """Прогрев соединений фонового loop (их использует request_sync)"""
+        return asyncio.run_coroutine_threadsafe(self.warm(), self._background_loop())
+
+    async def close(self):
+        """Закрытие сессий текущего event loop"""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session and not session.closed:
+            await session.close()
+
+    def summary(self) -> Dict[str, Dict]:
+        """Сводка по провайдерам: победы, ошибки, p50/p95 задержки"""
+        result = {}
+        for name, stats in self.stats.items():
+            latencies = sorted(stats["latencies"])
+            result[name] = {
+                "calls": stats["calls"],
+                "wins": stats["wins"],
+                "errors": stats["errors"],
+                "invalid": stats["invalid"],
+                "cancelled": stats["cancelled"],
+                "p50": latencies[len(latencies) // 2] if latencies else None,
+                "p95": latencies[max(0, int(len(latencies) * 0.95) - 1)] if latencies else None
+            }
+        return result
+
+
+def providers_from_config(items: List[Dict]) -> List[VisionProvider]:
+    """Создание провайдеров из списка словарей конфигурации"""
+    return [VisionProvider(**item) for item in items]
+
+
+def parse_point(content: str) -> Optional[tuple]:
+    """Валидатор ответа вида 'x,y'; NOT_FOUND -> NOT_FOUND, мусор -> None"""
+    if "NOT_FOUND" in content:
+        return NOT_FOUND
+    if "," not in content:
+        return None
+    try:
+        parts = content.replace(" ", "").split(",")
+        return (int(parts[0]), int(parts[1]))
+    except ValueError:
+        return None
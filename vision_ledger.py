@@ -0,0 +1,273 @@
+"""
+Учет вызовов vision/chat моделей: токены, стоимость, задержка, исход
+
+Каждый вызов провайдера (в том числе проигравший или отмененный дубль
+хеджирования) записывается с атрибуцией: скрипт, профиль, команда, шаг,
+назначение запроса. Записи дописываются в JSONL файл, поэтому по нему можно
+строить как сводку текущего запуска, так и скользящую за N дней.
+
+Исходы: parsed (ответ принят), invalid (не прошел проверку), error, cancelled
+(дубль отменен после победы другого), fallback (модель не помогла, вызывающий
+код перешел к эвристике).
+
+Использование:
+python vision_ledger.py --days 7 --by script,step
+python vision_ledger.py --days 1 --csv costs.csv
+"""
+
+import argparse
+import base64
+import csv
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import asdict, dataclass, fields
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Цена за 1M токенов в долларах: (вход, кэшированный вход, выход)
+PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "deepseek-chat": (0.27, 0.07, 1.10),
+}
+
+
+@dataclass
+class CallRecord:
+    """Один вызов модели"""
+    ts: float
+    run: str
+    script: str = ""
+    profile: str = ""
+    command: str = ""
+    step: str = ""
+    purpose: str = ""  # назначение запроса: plan, find_button, marks, ocr_layout...
+    provider: str = ""
+    model: str = ""
+    image_bytes: int = 0
+    image_pixels: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    outcome: str = ""
+    cost: float = 0.0
+
+
+def _image_size(data: bytes) -> Tuple[int, int]:
+    """Размер PNG/JPEG по заголовку (без декодирования)"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:2] == b"\xff\xd8":
+        index = 2
+        while index + 9 < len(data):
+            if data[index] != 0xFF:
+                index += 1
+                continue
+            marker = data[index + 1]
+            length = struct.unpack(">H", data[index + 2:index + 4])[0]
+            if marker in (0xC0, 0xC1, 0xC2):
+                height, width = struct.unpack(">HH", data[index + 5:index + 9])
+                return width, height
+            index += 2 + length
+    return 0, 0
+
+
+def image_stats(messages: List[Dict]) -> Tuple[int, int]:
+    """Сумма байт и пикселей изображений в сообщениях chat/completions"""
+    total_bytes = total_pixels = 0
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for part in content:
+            url = (part.get("image_url") or {}).get("url", "") if isinstance(part, dict) else ""
+            if not url.startswith("data:"):
+                continue
+            encoded = url.split(",", 1)[-1]
+            total_bytes += len(encoded) * 3 // 4
+            width, height = _image_size(base64.b64decode(encoded[:4096]))
+            total_pixels += width * height
+    return total_bytes, total_pixels
+
+
+def usage_tokens(usage: Dict) -> Tuple[int, int, int]:
+    """(prompt, cached, completion) из usage OpenAI или DeepSeek"""
+    usage = usage or {}
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") \
+        or usage.get("prompt_cache_hit_tokens") or 0
+    return int(usage.get("prompt_tokens") or 0), int(cached), int(usage.get("completion_tokens") or 0)
+
+
+def percentile(values: Sequence[float], fraction: float) -> Optional[float]:
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(len(values) * fraction + 0.5) - 1))]
+
+
+def summarize(records: Iterable[CallRecord], by: Sequence[str] = ("provider", "model")) -> Dict[str, Dict]:
+    """Сводка по группам: вызовы, исходы, токены, стоимость, p50/p95 задержки"""
+    groups: Dict[str, List[CallRecord]] = defaultdict(list)
+    for record in records:
+        groups["/".join(str(getattr(record, key)) or "-" for key in by)].append(record)
+
+    result = {}
+    for key, items in sorted(groups.items()):
+        outcomes: Dict[str, int] = defaultdict(int)
+        for item in items:
+            outcomes[item.outcome] += 1
+        latencies = [item.latency for item in items if item.provider and item.outcome != "cancelled"]
+        result[key] = {
+            "calls": len(items),
+            "outcomes": dict(outcomes),
+            "prompt_tokens": sum(item.prompt_tokens for item in items),
+            "cached_tokens": sum(item.cached_tokens for item in items),
+            "completion_tokens": sum(item.completion_tokens for item in items),
+            "image_mpx": round(sum(item.image_pixels for item in items) / 1e6, 2),
+            "cost": round(sum(item.cost for item in items), 5),
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95)
+        }
+    return result
+
+
+class VisionLedger:
+    """Журнал вызовов моделей текущего запуска с записью в JSONL"""
+
+    def __init__(self, path: Optional[str] = "vision_ledger.jsonl", script: str = "", profile: str = "",
+                 prices: Dict[str, Tuple[float, float, float]] = None,
+                 context: Callable[[], Dict] = None):
+        """
+        Args:
+            path: JSONL файл для всех запусков (None - только в памяти)
+            script, profile: Атрибуция запуска
+            prices: Цены моделей поверх PRICES (за 1M токенов: вход, кэш, выход)
+            context: Функция текущего контекста (command, step) - например, контекст лога
+        """
+        self.path = path
+        self.script = script
+        self.profile = profile
+        self.prices = {**PRICES, **(prices or {})}
+        self.context = context or dict
+        self.run = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.records: List[CallRecord] = []
+        self._lock = threading.Lock()
+
+    def price(self, model: str, prompt: int, cached: int, completion: int) -> float:
+        """Стоимость вызова в долларах (модель без цены - 0)"""
+        rates = self.prices.get(model)
+        if rates is None:
+            # Версии моделей (gpt-4o-2024-08-06) - по самому длинному совпадающему префиксу
+            matches = [name for name in self.prices if model.startswith(name)]
+            rates = self.prices[max(matches, key=len)] if matches else (0.0, 0.0, 0.0)
+        input_rate, cached_rate, output_rate = rates
+        return ((prompt - cached) * input_rate + cached * cached_rate + completion * output_rate) / 1e6
+
+    def record(self, provider: str = "", model: str = "", outcome: str = "", latency: float = 0.0,
+               usage: Dict = None, image: Tuple[int, int] = (0, 0), purpose: str = "") -> CallRecord:
+        """
+        Запись одного вызова (или исхода fallback без вызова)
+
+        Args:
+            image: (байт, пикселей) изображений запроса - см. image_stats
+        """
+        prompt, cached, completion = usage_tokens(usage)
+        image_bytes, image_pixels = image
+        context = self.context() or {}
+        record = CallRecord(
+            ts=time.time(), run=self.run, script=self.script, profile=self.profile,
+            command=str(context.get("command", "")), step=str(context.get("step", "")),
+            purpose=purpose or str(context.get("purpose", "")), provider=provider, model=model,
+            image_bytes=image_bytes, image_pixels=image_pixels,
+            prompt_tokens=prompt, cached_tokens=cached, completion_tokens=completion,
+            latency=round(latency, 3), outcome=outcome,
+            cost=round(self.price(model, prompt, cached, completion), 6)
+        )
+        with self._lock:
+            self.records.append(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+        return record
+
+    # --- сводки и экспорт ---
+
+    def run_summary(self, by: Sequence[str] = ("provider", "model")) -> Dict[str, Dict]:
+        """Сводка текущего запуска"""
+        with self._lock:
+            return summarize(list(self.records), by)
+
+    def totals(self) -> Dict:
+        """Итог текущего запуска одной строкой: вызовы, токены, стоимость"""
+        return summarize(list(self.records), by=("run",)).get(self.run, {"calls": 0, "cost": 0.0})
+
+    def history(self, days: float = 7.0) -> List[CallRecord]:
+        """Записи всех запусков за последние days дней из файла"""
+        if not self.path or not os.path.exists(self.path):
+            return list(self.records)
+        return load_records(self.path, since=time.time() - days * 86400)
+
+    def rolling_summary(self, days: float = 7.0, by: Sequence[str] = ("script", "purpose")) -> Dict[str, Dict]:
+        """Скользящая сводка за days дней по всем запускам"""
+        return summarize(self.history(days), by)
+
+
+def load_records(path: str, since: float = 0.0) -> List[CallRecord]:
+    names = {f.name for f in fields(CallRecord)}
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            if data.get("ts", 0) >= since:
+                records.append(CallRecord(**{key: value for key, value in data.items() if key in names}))
+    return records
+
+
+def export_csv(records: Iterable[CallRecord], path: str):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=[field.name for field in fields(CallRecord)])
+        writer.writeheader()
+        writer.writerows(asdict(record) for record in records)
+
+
+def export_jsonl(records: Iterable[CallRecord], path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(asdict(record), ensure_ascii=False) + "\n" for record in records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сводка стоимости вызовов моделей")
+    parser.add_argument("--ledger", default="vision_ledger.jsonl", help="JSONL журнал")
+    parser.add_argument("--days", type=float, default=7, help="Окно сводки, дней")
+    parser.add_argument("--by", default="script,purpose", help="Поля группировки через запятую")
+    parser.add_argument("--csv", help="Экспорт записей окна в CSV")
+    parser.add_argument("--jsonl", help="Экспорт записей окна в JSONL")
+    args = parser.parse_args()
+
+    records = load_records(args.ledger, since=time.time() - args.days * 86400)
+    if args.csv:
+        export_csv(records, args.csv)
+    if args.jsonl:
+        export_jsonl(records, args.jsonl)
+
+    print(f"{len(records)} вызовов за {args.days:g} дн.")
+    for key, stats in summarize(records, args.by.split(",")).items():
+        p50 = f"{stats['p50']:.2f}с" if stats["p50"] is not None else "-"
+        p95 = f"{stats['p95']:.2f}с" if stats["p95"] is not None else "-"
+        print(f"{key:40} {stats['calls']:5} выз. ${stats['cost']:.4f} "
+              f"ток. {stats['prompt_tokens']}/{stats['completion_tokens']} "
+              f"p50 {p50} p95 {p95} {stats['outcomes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,100 @@ import subprocess
 import psutil
 import platform
 import os
-from typing import Optional, Dict, List, Tuple
+import asyncio
+import atexit
+import threading
+from typing import Callable, Optional, Dict, List, Tuple
+
+from accessibility import AccessibilityResolver
+from action_verify import ActionVerifier, Expectation
+from cdp_client import CdpConnection
+from cdp_input import CdpInput
+from dom_resolver import DomResolver
+from frame_ring import FrameRingService, RingSharedFrame
+from frame_provider import FrameProvider, SharedFrame
+from location_memory import LocationMemory, box_center
+from ocr_layout import LayoutItem, compress_layout, parse_item_id
+from set_of_marks import collect_candidates, describe_marks, draw_marks, parse_mark_id
+from resolver_race import Candidate, ResolverRace
+from run_journal import RunJournal, screen_hash
+from run_log import RunLogger
+from screen_capture import grab_image
+from screen_state import ScreenStateRecognizer, StateSpec
+from step_engine import AsyncStepEngine
+from ui_detector import UIDetection, load_detector
+from model_router import ModelRouter
+from vision_client import NOT_FOUND, HedgedVisionClient, parse_point, providers_from_config
+from vision_ledger import VisionLedger
 
 class BrowserAutomation:
     """Универсальный класс для автоматизации браузера"""
     
+    # Цели smart_* шагов: тексты для OCR, описание для vision, эвристика по зонам,
+    # последовательный поиск (если гонка стратегий выключена)
+    SMART_TARGETS = {
+        "smart_google_click": {
+            "target": "google_button",
+            "texts": "GOOGLE_TEXTS",
+            "ocr_confidence": 0.9,
+            "vision": "Sign in with Google / Continue with Google button",
+            "heuristic": "google_button_fallback",
+            "detector": "google",  # класс UI детектора
+            "finder": "find_google_button_smart",
+            "dom_role": None,  # роль для поиска через DOM и дерево доступности (None - любой элемент)
+            "expect": {"kind": "screen_changes"}
+        },
+        "smart_email_click": {
+            "target": "email_account",
+            "texts": "ACCOUNT_PATTERNS",
+            "ocr_confidence": 0.8,
+            "vision": "first Google account row in the account chooser",
+            "heuristic": "email_account_fallback",
+            "detector": "account_row",
+            "finder": "find_email_account_smart",
+            "dom_role": "link",
+            "wait_for_change": 5,
+            "expect": {"kind": "target_disappears"}
+        },
+        "smart_continue_click": {
+            "target": "continue_button",
+            "texts": "CONTINUE_TEXTS",
+            "ocr_confidence": 0.8,
+            "vision": "Continue/Продолжить button in bottom right area",
+            "heuristic": "find_continue_button_by_zones",
+            "detector": "continue",
+            "finder": "find_continue_button_ai_enhanced",
+            "dom_role": "button",
+            "ocr_ai": True,
+            "expect": {"kind": "target_disappears"}
+        }
+    }
+    
+    # Варианты текста кнопки Google
+    GOOGLE_TEXTS = [
+        "Sign in with Google",
+        "Continue with Google", 
+        "Login with Google"
+    ]
+    
+    # Характерные тексты строки аккаунта
+    ACCOUNT_PATTERNS = [
+        "@gmail.com",
+        "gmail.com",
+        "Choose an account",
+        "boban marjan",
+        "marjanboban01"
+    ]
+    
+    # Варианты текста кнопки Продолжить
+    CONTINUE_TEXTS = [
+        "Продовжити",
+        "Продолжить", 
+        "Continue",
+        "Далі",
+        "Next"
+    ]
+    
     def __init__(self, config: Dict = None):
         """
         Инициализация с конфигурацией
@@ -29,7 +118,20 @@ class BrowserAutomation:
                 "margin_from_edges": 50,
                 "click_duration": 0.5,
                 "move_duration": 0.3,
-                "step_delay": 2
+                "step_delay": 2,
+                "pace": 1.0  # множитель всех пауз и ожиданий (0 - без пауз, для симулятора)
+            },
+            
+            # Лог: уровень консоли, JSON вывод и бортовой самописец (дамп при сбое шага)
+            "logging": {
+                "level": "INFO",
+                "json_console": False,  # JSON строки вместо иконок
+                "file": None,  # JSONL файл всех записей (None - без файла)
+                "file_level": "DEBUG",
+                "ring_size": 2000,  # последние записи для дампа (всех уровней)
+                "frames": 4,  # последние кадры экрана для дампа
+                "frame_side": 800,
+                "dump_dir": "flight_records"
             },
             
             # Настройки поиска элементов
@@ -39,6 +141,181 @@ class BrowserAutomation:
                 "retry_delay": 1
             },
             
+            # Модели для AI поиска (первая - основная, остальные - хедж при медленном ответе)
+            "vision": {
+                "providers": [
+                    {
+                        "name": "deepseek",
+                        "api_url": "https://api.deepseek.com/v1/chat/completions",
+                        "model": "deepseek-chat",
+                        "api_key_env": "DEEPSEEK_API_KEY",  # без ключа провайдер пропускается
+                        "timeout": 30
+                    },
+                    {
+                        "name": "openai",
+                        "api_url": "https://api.openai.com/v1/chat/completions",
+                        "model": "gpt-4o-mini",
+                        "api_key_env": "OPENAI_API_KEY",
+                        "timeout": 30
+                    }
+                ],
+                "hedge_delay": None,  # None - адаптивная задержка (p90 основного провайдера)
+                # marks - модель выбирает номер локально найденного кандидата (set-of-marks),
+                # coords - модель сама называет координаты
+                "mode": "marks",
+                "marks": {
+                    "max_marks": 40,
+                    "max_side": 1024,  # размер изображения с метками, отправляемого модели
+                    "templates": {}  # известные шаблоны: имя -> путь к изображению
+                }
+            },
+            
+            # Поиск элементов через DOM (SunBrowser с --remote-debugging-port) - до OCR и vision
+            "cdp": {
+                "enabled": True,
+                "host": "127.0.0.1",
+                "port": 9222,
+                "url_filter": None,  # подстрока URL нужной вкладки
+                "screen_scale": 1.0,  # масштаб экрана ОС (2.0 для Retina)
+                "offset": [0, 0],  # поправка координат окна, если расчет неточен
+                "input": "os"  # "cdp" - клики прямо во вкладку через DevTools, без мыши ОС и фокуса окна
+            },
+            
+            # Дерево доступности ОС (AT-SPI / macOS AX): нативные кнопки без OCR и vision
+            "accessibility": {
+                "enabled": True,
+                "ttl": 2.0,  # срок жизни снимка окна, с (сбрасывается и по событиям изменения)
+                "max_elements": 3000  # предел обхода дерева
+            },
+            
+            # Параллельный поиск для smart_* шагов
+            "race": {
+                "enabled": True,
+                "threshold": 0.8,  # результат с такой уверенностью принимается сразу
+                "deadline": 25,  # иначе лучший результат к дедлайну, с
+                "max_workers": 6  # не меньше числа стратегий (пул расширяется, если потоки заняли отставшие)
+            },
+            
+            # Компактная OCR разметка для AI выбора кнопки
+            "layout": {
+                "token_budget": 250  # бюджет токенов на список строк
+            },
+            
+            # Общий кадр экрана для всех резолверов шага
+            "frames": {
+                "ttl": 1.0,  # кадр переиспользуется столько секунд (сбрасывается после ввода)
+                # Кольцо кадров в разделяемой памяти: захват в отдельном процессе,
+                # OCR и поиск шаблона - в пуле процессов без копирования кадра
+                "ring": {
+                    "enabled": False,
+                    "slots": 8,
+                    "workers": None,  # None - по числу ядер
+                    "interval": None,  # None - захват только по запросу
+                    "backend": "auto"
+                }
+            },
+            
+            # Асинхронный движок шагов (run_automation_async)
+            "engine": {
+                "poll_interval": 0.25,  # период проверки готовности экрана, с
+                "settle": 0.5,  # экран считается готовым, если не менялся столько секунд
+                "change_grace": 1.0,  # если экран так и не изменился - ждем не дольше этого
+                "change_threshold": 1.5,  # средняя разница уменьшенных кадров (0-255)
+                "step_deadline": None,  # дедлайн шага по умолчанию, с
+                "max_workers": 4
+            },
+            
+            # Проверка эффекта клика (шаги с ключом "expect" и smart_* шаги)
+            "verify": {
+                "enabled": True,
+                "radius": 120,  # область вокруг точки клика, пикселей
+                "threshold": 4.0,  # средняя разница уменьшенных кадров (0-255)
+                "deadline": 1.5,  # сколько ждать эффекта, с
+                "poll_interval": 0.1,
+                "nudge": 6  # сдвиг точки при повторном клике, пикселей (только для expect с "repeatable": true)
+            },
+            
+            # Состояния экрана (в порядке приоритета) для сценариев run_flow
+            "states": {
+                "hashes_path": "screen_states.json",  # запомненные хэши экранов
+                "hash_threshold": 12,
+                "definitions": {
+                    "in_app": {"texts": ["I prefer this", "New chat"]},
+                    "rabby_unlock": {
+                        "texts": ["Unlock", "Enter the Password"],
+                        "templates": ["src/adspower_automation/strategies/rabby_password_field.png"]
+                    },
+                    "rabby_sign": {"texts": ["Signature request", "Sign Text", "Rabby"], "min_matches": 2},
+                    "account_chooser": {"texts": ["Choose an account", "Выберите аккаунт",
+                                                 "Оберіть обліковий запис", "@gmail.com"]},
+                    "permissions": {"texts": ["wants to access", "wants access", "signing back in",
+                                              "Продолжить", "Продовжити"],
+                                    "exclude": ["Choose an account"]},
+                    "signin_page": {"texts": ["Sign in with Google", "Continue with Google", "Login with Google"]}
+                }
+            },
+            
+            # Сценарии по состояниям экрана: состояние -> шаг
+            "flows": {
+                "google_signin": {
+                    "setup": [{"name": "find_browser", "type": "browser_detection",
+                               "description": "Поиск и активация браузера"}],
+                    "transitions": {
+                        "signin_page": {"name": "click_google_signin", "type": "smart_google_click"},
+                        "account_chooser": {"name": "click_email_account", "type": "smart_email_click"},
+                        "permissions": {"name": "click_continue_button", "type": "smart_continue_click"}
+                    },
+                    "terminal": ["in_app"],
+                    "timeout": 120,
+                    "max_wait": 8
+                }
+            },
+            
+            # Журнал токенов, стоимости и задержек вызовов моделей (сводка: python vision_ledger.py)
+            "ledger": {
+                "path": "vision_ledger.jsonl",  # None - только в памяти
+                "prices": {}  # модель -> [вход, кэш, выход] $ за 1M токенов поверх vision_ledger.PRICES
+            },
+            
+            # Локальный UI детектор (ONNX Runtime, CPU): уровень перед vision моделями
+            "detector": {
+                "enabled": True,  # без файла модели или onnxruntime детектор просто не используется
+                "model": "models/ui_detector.onnx",
+                "conf_threshold": 0.35,
+                "accept": 0.6,  # детекция с такой уверенностью принимается без гонки OCR/vision
+                "threads": None  # потоков ONNX Runtime (None - по числу ядер)
+            },
+            
+            # Выбор модели по типу запроса: уровни провайдеров (имена из vision.providers), следующий
+            # уровень - только при ошибке или невалидном ответе; статистика копится между запусками
+            "routing": {
+                "stats_path": "model_stats.json",  # None - только в памяти
+                "min_samples": 10,  # запросов до пропуска слабого уровня
+                "min_success": 0.5,  # успешность, ниже которой уровень пропускается
+                "tasks": {
+                    "locate": {"tiers": [["deepseek", "openai"]]},  # координаты кнопки на скриншоте
+                    "pick_mark": {"tiers": [["deepseek", "openai"]]},  # номер метки set-of-marks
+                    "pick_text": {"tiers": [["deepseek"], ["openai"]]}  # номер строки OCR-разметки
+                }
+            },
+            
+            # Журнал выполненных шагов run_automation: после сбоя запуск продолжается с первого
+            # невыполненного шага (шаги browser_detection выполняются всегда)
+            "journal": {
+                "enabled": True,
+                "dir": "run_journal",
+                "hash_threshold": 12  # расстояние Хэмминга dHash, при котором экран совпадает с журналом
+            },
+            
+            # Память расположения элементов (поиск сначала там, где нашли в прошлый раз)
+            "memory": {
+                "enabled": True,
+                "path": "location_memory.json",
+                "profile": "default",
+                "roi_padding": 80,
+                "half_life_days": 7
+            },
+            
             # Шаги автоматизации (последовательность действий)
             "steps": [
                 {
@@ -64,6 +341,99 @@ class BrowserAutomation:
         
         # Объединяем переданную конфигурацию с дефолтной
         self.config = self._merge_configs(self.default_config, config or {})
+        self.log = RunLogger("stg", **self.config["logging"])
+        
+        # Память координат найденных элементов
+        memory_config = self.config["memory"]
+        self.location_memory = LocationMemory(
+            path=memory_config["path"],
+            profile=memory_config["profile"],
+            half_life_days=memory_config["half_life_days"],
+            roi_padding=memory_config["roi_padding"],
+            log=self.log
+        ) if memory_config["enabled"] else None
+        
+        # Кольцо кадров (процесс захвата + пул резолверов)
+        ring_config = self.config["frames"]["ring"]
+        self.frame_ring = None
+        if ring_config["enabled"]:
+            self.frame_ring = FrameRingService(slots=ring_config["slots"], workers=ring_config["workers"],
+                                               interval=ring_config["interval"], backend=ring_config["backend"],
+                                               log=self.log)
+            atexit.register(self.frame_ring.close)
+        
+        # Общий кадр экрана (с кэшем уменьшенной копии, хэша и OCR)
+        self.frames = FrameProvider(ttl=self.config["frames"]["ttl"], grab=self.grab_frame, log=self.log,
+                                    on_capture=self.log.frame)
+        
+        # Параллельный запуск стратегий поиска
+        self.resolver_race = ResolverRace(max_workers=self.config["race"]["max_workers"], log=self.log)
+        
+        # Проверка эффекта действий по локальному сравнению кадров
+        self.verifier = ActionVerifier(grab=self.grab_screen,
+                                       poll_interval=self.config["verify"]["poll_interval"], log=self.log)
+        
+        # Клики текущего шага (для журнала выполнения)
+        self.step_clicks: List[Tuple[int, int]] = []
+        # Флаг отмены текущего шага (движок выставляет его по дедлайну шага)
+        self.step_cancel: Optional[threading.Event] = None
+        # Флаг отмены всего запуска (например, job_queue потерял аренду задания)
+        self.run_cancel: Optional[threading.Event] = None
+        
+        # Распознавание состояния экрана для сценариев
+        states_config = self.config["states"]
+        self.state_recognizer = ScreenStateRecognizer(
+            [StateSpec.from_config(name, spec) for name, spec in states_config["definitions"].items()],
+            hash_threshold=states_config["hash_threshold"],
+            path=states_config["hashes_path"],
+            locate=lambda template, image: self.locate_template(template, [0.8], image=image),
+            log=self.log
+        )
+        
+        # Поиск элементов через DOM профиля
+        cdp_config = self.config["cdp"]
+        self.dom_resolver = DomResolver(
+            CdpConnection(cdp_config["host"], cdp_config["port"], cdp_config["url_filter"], log=self.log),
+            screen_scale=cdp_config["screen_scale"],
+            offset=tuple(cdp_config["offset"]),
+            log=self.log
+        ) if cdp_config["enabled"] else None
+        self.cdp_input = CdpInput(self.dom_resolver.connection, screen_scale=cdp_config["screen_scale"]) \
+            if self.dom_resolver and cdp_config["input"] == "cdp" else None
+        
+        # Поиск нативных элементов через дерево доступности
+        accessibility_config = self.config["accessibility"]
+        self.accessibility = AccessibilityResolver(
+            ttl=accessibility_config["ttl"],
+            max_elements=accessibility_config["max_elements"],
+            log=self.log
+        ) if accessibility_config["enabled"] else None
+        
+        # Клиент vision моделей с хеджированием
+        vision_config = self.config["vision"]
+        self.ledger = VisionLedger(
+            self.config["ledger"]["path"],
+            script="ypp_stg",
+            profile=self.config["memory"]["profile"],
+            prices={model: tuple(rates) for model, rates in self.config["ledger"]["prices"].items()},
+            context=lambda: self.log.context
+        )
+        self.vision_client = HedgedVisionClient(
+            providers_from_config(vision_config["providers"]),
+            hedge_delay=vision_config["hedge_delay"],
+            log=self.log,
+            ledger=self.ledger
+        )
+        self.detector = load_detector(self.config["detector"], log=self.log)
+        routing_config = self.config["routing"]
+        self.router = ModelRouter(
+            self.vision_client,
+            rules=routing_config["tasks"],
+            stats_path=routing_config["stats_path"],
+            min_samples=routing_config["min_samples"],
+            min_success=routing_config["min_success"],
+            log=self.log
+        )
         
         # Настройки pyautogui
         self.original_failsafe = pyautogui.FAILSAFE
@@ -79,15 +449,24 @@ class BrowserAutomation:
                 result[key] = value
         return result
     
-    def log(self, message: str, level: str = "INFO"):
-        """Универсальная функция логирования"""
-        icons = {"INFO": "ℹ️", "SUCCESS": "✅", "WARNING": "⚠️", "ERROR": "❌", "DEBUG": "🔍"}
-        print(f"{icons.get(level, 'ℹ️')} {message}")
+    def pause(self, seconds: float):
+        """Пауза с учетом screen.pace (прерывается отменой шага или запуска)"""
+        seconds *= self.config["screen"]["pace"]
+        if seconds > 0:
+            cancel = self.step_cancel or self.run_cancel
+            if cancel is not None:
+                cancel.wait(seconds)
+            else:
+                time.sleep(seconds)
+    
+    def step_cancelled(self) -> bool:
+        """Шаг отменен движком (дедлайн истек) или отменен весь запуск - ввод больше не выполняется"""
+        return any(cancel is not None and cancel.is_set() for cancel in (self.step_cancel, self.run_cancel))
     
     def get_screen_info(self) -> Tuple[int, int]:
         """Получение информации об экране"""
         width, height = pyautogui.size()
-        self.log(f"Размер экрана: {width}x{height}", "DEBUG")
+        self.log("Размер экрана: %sx%s", "DEBUG", width, height)
         return width, height
     
     def coords_from_ratio(self, x_ratio: float, y_ratio: float) -> Tuple[int, int]:
@@ -105,8 +484,39 @@ class BrowserAutomation:
         return (margin <= x <= screen_width - margin and 
                 margin <= y <= screen_height - margin)
     
-    def safe_click(self, x: int, y: int) -> bool:
-        """Безопасный клик по координатам"""
+    def safe_click(self, x: int, y: int, expect: Dict = None,
+                   resolve: Callable[[], Optional[Tuple[int, int]]] = None) -> bool:
+        """
+        Безопасный клик по координатам
+        
+        Args:
+            x, y: Точка клика
+            expect: Ожидаемый эффект клика (см. action_verify.Expectation.from_config);
+                без него клик считается успешным сразу
+            resolve: Повторный дешевый поиск цели, если эффекта нет
+        """
+        verify_config = self.config["verify"]
+        if not expect or not verify_config["enabled"]:
+            return self._click(x, y)
+        
+        try:
+            expectation = Expectation.from_config(expect, point=(x, y), defaults=verify_config)
+            verified = self.verifier.perform(
+                lambda point: self._click(*point), (x, y), expectation,
+                resolve=resolve, nudge=verify_config["nudge"])
+        except Exception as e:
+            self.log(f"Ошибка проверки клика: {e}", "WARNING")
+            return True  # клик выполнен, проверить эффект не удалось
+        
+        if verified:
+            self.log(f"Эффект клика подтвержден ({expectation.kind})", "SUCCESS")
+        return verified
+    
+    def _click(self, x: int, y: int) -> bool:
+        """Клик с коррекцией небезопасных координат"""
+        if self.step_cancelled():
+            self.log(f"Клик по ({x}, {y}) пропущен: шаг отменен", "WARNING")
+            return False
         try:
             if not self.is_coords_safe(x, y):
                 self.log(f"Координаты ({x}, {y}) небезопасны, корректируем...", "WARNING")
@@ -114,15 +524,37 @@ class BrowserAutomation:
                 margin = self.config["screen"]["margin_from_edges"]
                 x = max(margin, min(x, screen_width - margin))
                 y = max(margin, min(y, screen_height - margin))
-                self.log(f"Скорректированные координаты: ({x}, {y})", "DEBUG")
+                self.log("Скорректированные координаты: (%s, %s)", "DEBUG", x, y)
+            
+            if self.cdp_input:
+                try:
+                    offset_x, offset_y = self.config["cdp"]["offset"]
+                    self.cdp_input.click_sync(x - offset_x, y - offset_y, screen=True)
+                    self.step_clicks.append((x, y))
+                    self.frames.invalidate("click")
+                    if self.accessibility:
+                        self.accessibility.invalidate()
+                    self.log(f"Клик через DevTools по ({x}, {y})", "SUCCESS")
+                    return True
+                except Exception as e:
+                    self.log(f"Клик через DevTools не удался ({e}), кликаем мышью", "WARNING")
             
             # Плавное перемещение и клик
             move_duration = self.config["screen"]["move_duration"]
             click_duration = self.config["screen"]["click_duration"]
             
-            pyautogui.moveTo(x, y, duration=move_duration)
-            time.sleep(0.2)
+            pyautogui.moveTo(x, y, duration=move_duration * self.config["screen"]["pace"])
+            self.pause(0.2)
+            if self.step_cancelled():
+                self.log(f"Клик по ({x}, {y}) пропущен: шаг отменен", "WARNING")
+                return False
             pyautogui.click(x, y)
+            self.step_clicks.append((x, y))
+            
+            # После клика общий кадр и снимок дерева доступности устарели
+            self.frames.invalidate("click")
+            if self.accessibility:
+                self.accessibility.invalidate()
             
             current_pos = pyautogui.position()
             self.log(f"Клик выполнен по ({x}, {y}), текущая позиция: {current_pos}", "SUCCESS")
@@ -199,7 +631,7 @@ class BrowserAutomation:
             result = subprocess.run(['osascript', '-e', activate_script], capture_output=True, text=True)
             
             if result.returncode == 0:
-                time.sleep(1)
+                self.pause(1)
                 self.log(f"Окно активировано: {app_name}", "SUCCESS")
                 return True
             else:
@@ -210,7 +642,7 @@ class BrowserAutomation:
             self.log(f"Ошибка активации окна: {e}", "ERROR")
             return False
     
-    def click_by_coordinates(self, coords: Dict) -> bool:
+    def click_by_coordinates(self, coords: Dict, expect: Dict = None) -> bool:
         """Клик по относительным координатам"""
         if "x_ratio" in coords and "y_ratio" in coords:
             x, y = self.coords_from_ratio(coords["x_ratio"], coords["y_ratio"])
@@ -218,19 +650,44 @@ class BrowserAutomation:
             x, y = coords.get("x", 0), coords.get("y", 0)
         
         self.log(f"Клик по координатам: ({x}, {y})")
-        return self.safe_click(x, y)
+        return self.safe_click(x, y, expect)
     
-    def find_element_by_text(self, text: str, confidence: float = 0.8) -> Optional[Tuple[int, int]]:
-        """Поиск элемента по тексту на экране"""
+    def find_text_box(self, text: str, confidence: float = 0.8,
+                      region: Tuple[int, int, int, int] = None,
+                      screenshot=None) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Поиск бокса текста на экране
+        
+        Args:
+            text: Искомый текст
+            confidence: Минимальная уверенность OCR (0-1)
+            region: Окно поиска (left, top, width, height); без него - весь экран
+            screenshot: Кадр экрана (SharedFrame или PIL); без него - свежий общий кадр,
+                а при заданном окне и отсутствии свежего кадра - захват только окна
+        
+        Returns:
+            Бокс (left, top, width, height) в координатах экрана
+        """
         try:
             import pytesseract
             from PIL import Image
             
-            # Делаем скриншот экрана
-            screenshot = pyautogui.screenshot()
+            if screenshot is None and not region:
+                screenshot = self.frames.get()
+            elif screenshot is None:
+                screenshot = self.frames.peek()
             
-            # Извлекаем текст и координаты
-            ocr_data = pytesseract.image_to_data(screenshot, output_type=pytesseract.Output.DICT)
+            if screenshot is not None:
+                # Общий кадр: OCR всего кадра один раз (кэш), окно - фильтром по координатам
+                ocr_data = self.as_shared_frame(screenshot).ocr()
+                offset_x, offset_y = 0, 0
+            else:
+                # Делаем скриншот экрана (или только окна поиска)
+                screenshot = self.grab_screen(region)
+                offset_x, offset_y = (region[0], region[1]) if region else (0, 0)
+                
+                # Извлекаем текст и координаты
+                ocr_data = pytesseract.image_to_data(screenshot, output_type=pytesseract.Output.DICT)
             
             # Ищем все совпадения в центральной области экрана
             screen_width, screen_height = self.get_screen_info()
@@ -240,21 +697,26 @@ class BrowserAutomation:
                 if (text.lower() in detected_text.lower() and 
                     int(ocr_data['conf'][i]) > confidence * 100):
                     
-                    x = ocr_data['left'][i] + ocr_data['width'][i] // 2
-                    y = ocr_data['top'][i] + ocr_data['height'][i] // 2
+                    box = (ocr_data['left'][i] + offset_x, ocr_data['top'][i] + offset_y,
+                           ocr_data['width'][i], ocr_data['height'][i])
+                    x, y = box_center(box)
                     
-                    # Проверяем что элемент в центральной области
-                    if (screen_width * 0.2 <= x <= screen_width * 0.8 and
-                        screen_height * 0.3 <= y <= screen_height * 0.8):
-                        center_matches.append((x, y))
-                        self.log(f"Найден текст '{text}' на координатах ({x}, {y})", "DEBUG")
+                    if region and not (region[0] <= x <= region[0] + region[2] and
+                                       region[1] <= y <= region[1] + region[3]):
+                        continue
+                    
+                    # Проверяем что элемент в центральной области (окно из памяти проверено ранее)
+                    if region or (screen_width * 0.2 <= x <= screen_width * 0.8 and
+                                  screen_height * 0.3 <= y <= screen_height * 0.8):
+                        center_matches.append(box)
+                        self.log("Найден текст '%s' на координатах (%s, %s)", "DEBUG", text, x, y)
             
             if center_matches:
                 # Берем самый центральный элемент
                 center_x, center_y = screen_width // 2, screen_height // 2
                 best_match = min(center_matches, 
-                               key=lambda p: abs(p[0] - center_x) + abs(p[1] - center_y))
-                self.log(f"Выбран наиболее центральный элемент: {best_match}", "SUCCESS")
+                               key=lambda b: abs(box_center(b)[0] - center_x) + abs(box_center(b)[1] - center_y))
+                self.log(f"Выбран наиболее центральный элемент: {box_center(best_match)}", "SUCCESS")
                 return best_match
             
             return None
@@ -266,24 +728,111 @@ class BrowserAutomation:
             self.log(f"Ошибка поиска по тексту: {e}", "ERROR")
             return None
     
+    def grab_screen(self, region: Tuple[int, int, int, int] = None):
+        """Новый скриншот экрана (или области) через слой захвата screen_capture"""
+        return grab_image(region)
+    
+    def grab_frame(self):
+        """Кадр для общего FrameProvider: из кольца кадров, если оно включено"""
+        if self.frame_ring:
+            frame = self.frame_ring.shared_frame()
+            if frame is not None:
+                return frame
+            self.log("Кольцо кадров не ответило, прямой захват", "DEBUG")
+        return self.grab_screen()
+    
+    def as_shared_frame(self, screenshot) -> SharedFrame:
+        """Кадр с кэшем артефактов: SharedFrame как есть, PIL изображение - в обертке"""
+        return screenshot if isinstance(screenshot, SharedFrame) else SharedFrame(screenshot)
+    
+    def find_element_by_text(self, text: str, confidence: float = 0.8,
+                             region: Tuple[int, int, int, int] = None) -> Optional[Tuple[int, int]]:
+        """Поиск элемента по тексту на экране"""
+        box = self.find_text_box(text, confidence, region)
+        return box_center(box) if box else None
+    
+    def find_texts_box(self, texts: List[str], confidence: float = 0.8,
+                       region: Tuple[int, int, int, int] = None, screenshot=None,
+                       cancel=None) -> Optional[Tuple[int, int, int, int]]:
+        """Поиск первого найденного текста из списка вариантов"""
+        for text in texts:
+            if cancel is not None and cancel.is_set():
+                return None
+            box = self.find_text_box(text, confidence, region, screenshot)
+            if box:
+                self.log(f"Найдено по тексту '{text}'", "SUCCESS")
+                return box
+        return None
+    
+    def find_in_remembered_region(self, target: str,
+                                  finder: Callable[[Tuple[int, int, int, int]], Optional[Tuple[int, int, int, int]]],
+                                  cancel=None) -> Optional[Tuple[int, int]]:
+        """
+        Быстрая проверка маленького окна вокруг места, где цель нашли в прошлый раз
+        
+        Args:
+            target: Имя цели в памяти
+            finder: Функция поиска бокса в окне (region -> box)
+            cancel: Флаг отмены (поиск прерван - это не промах, память не штрафуется)
+        
+        Returns:
+            Центр найденного элемента или None (тогда нужен полный поиск)
+        """
+        if not self.location_memory:
+            return None
+        
+        resolution = self.get_screen_info()
+        region = self.location_memory.search_region(target, resolution)
+        if not region:
+            return None
+        
+        self.log("Проверяем запомненную область '%s': %s", "DEBUG", target, region)
+        box = finder(region)
+        if box:
+            self.location_memory.record_hit(target, resolution, box)
+            self.log(f"'{target}' найден в запомненной области", "SUCCESS")
+            return box_center(box)
+        
+        if cancel is not None and cancel.is_set():
+            return None
+        self.location_memory.record_miss(target, resolution)
+        self.log("'%s' не найден в запомненной области, полный поиск", "DEBUG", target)
+        return None
+    
+    def remember_location(self, target: str, box: Tuple[int, int, int, int] = None,
+                          point: Tuple[int, int] = None):
+        """Запоминаем бокс (или точку) найденной цели"""
+        if not self.location_memory:
+            return
+        resolution = self.get_screen_info()
+        if box:
+            self.location_memory.record_hit(target, resolution, box)
+        elif point:
+            self.location_memory.record_point(target, resolution, point)
+    
     def find_google_button_smart(self) -> Optional[Tuple[int, int]]:
         """Умный поиск кнопки Google по различным признакам"""
         self.log("Умный поиск кнопки Google...")
         
-        # 1. Пробуем найти по тексту (только точные совпадения)
-        text_variations = [
-            "Sign in with Google",
-            "Continue with Google", 
-            "Login with Google"
-        ]
+        text_variations = self.GOOGLE_TEXTS
         
-        for text in text_variations:
-            coords = self.find_element_by_text(text, confidence=0.9)
-            if coords:
-                self.log(f"Кнопка найдена по тексту '{text}'", "SUCCESS")
-                return coords
+        # 0. Сначала проверяем место, где кнопку нашли в прошлый раз
+        coords = self.find_in_remembered_region(
+            "google_button", lambda region: self.find_texts_box(text_variations, 0.9, region))
+        if coords:
+            return coords
+        
+        # 1. Пробуем найти по тексту (только точные совпадения)
+        box = self.find_texts_box(text_variations, confidence=0.9)
+        if box:
+            self.remember_location("google_button", box)
+            return box_center(box)
         
         # 2. Fallback: предполагаемая позиция по центру экрана
+        return self.google_button_fallback()
+    
+    def google_button_fallback(self) -> Tuple[int, int]:
+        """Предполагаемая позиция кнопки Google"""
         screen_width, screen_height = self.get_screen_info()
         fallback_x = screen_width // 2
         fallback_y = int(screen_height * 0.75)  # Кнопка обычно в нижней части
@@ -296,14 +845,14 @@ class BrowserAutomation:
         self.log(f"Ожидание изменения страницы ({timeout}с)...")
         
         # Делаем скриншот до
-        screenshot_before = pyautogui.screenshot()
+        screenshot_before = self.frames.fresh()
         
         for i in range(timeout):
-            time.sleep(1)
-            screenshot_after = pyautogui.screenshot()
+            self.pause(1)
+            screenshot_after = self.frames.fresh()
             
             # Сравниваем скриншоты (простое сравнение по размеру данных)
-            if screenshot_before.tobytes() != screenshot_after.tobytes():
+            if screenshot_before.image.tobytes() != screenshot_after.image.tobytes():
                 self.log(f"Страница изменилась через {i+1}с", "SUCCESS")
                 return True
             
@@ -321,21 +870,24 @@ class BrowserAutomation:
         self.wait_for_page_change(timeout=5)
         
         # 1. Поиск по характерным текстам для аккаунта
-        account_patterns = [
-            "@gmail.com",
-            "gmail.com",
-            "Choose an account",
-            "boban marjan",
-            "marjanboban01"
-        ]
+        account_patterns = self.ACCOUNT_PATTERNS
         
-        for pattern in account_patterns:
-            coords = self.find_element_by_text(pattern, confidence=0.8)
-            if coords:
-                self.log(f"Аккаунт найден по тексту '{pattern}'", "SUCCESS")
-                return coords
+        # Сначала запомненная область
+        coords = self.find_in_remembered_region(
+            "email_account", lambda region: self.find_texts_box(account_patterns, 0.8, region))
+        if coords:
+            return coords
+        
+        box = self.find_texts_box(account_patterns, confidence=0.8)
+        if box:
+            self.remember_location("email_account", box)
+            return box_center(box)
         
         # 2. Поиск первого аккаунта в списке (скорректированные координаты)
+        return self.email_account_fallback()
+    
+    def email_account_fallback(self) -> Optional[Tuple[int, int]]:
+        """Предполагаемая позиция первого аккаунта в списке"""
         screen_width, screen_height = self.get_screen_info()
         
         # Скорректированные координаты: правее на 30px, ниже на 20px
@@ -360,22 +912,26 @@ class BrowserAutomation:
         """Умный поиск кнопки Продолжить"""
         self.log("Умный поиск кнопки Продолжить...")
         
-        # 1. Поиск по тексту кнопки
-        continue_texts = [
-            "Продовжити",
-            "Продолжить", 
-            "Continue",
-            "Далі",
-            "Next"
-        ]
+        # 1. Дерево доступности: точные границы без OCR
+        if self.accessibility:
+            element = self.accessibility.find(role="button", names=self.CONTINUE_TEXTS)
+            if element:
+                self.remember_location("continue_button", element.box)
+                return element.center
         
-        for text in continue_texts:
-            coords = self.find_element_by_text(text, confidence=0.8)
-            if coords:
-                self.log(f"Кнопка Продолжить найдена по тексту '{text}'", "SUCCESS")
-                return coords
+        # 2. Поиск по тексту кнопки
+        continue_texts = self.CONTINUE_TEXTS
         
-        # 2. Универсальный поиск через зоны экрана
+        box = self.find_texts_box(continue_texts, confidence=0.8)
+        if box:
+            self.remember_location("continue_button", box)
+            return box_center(box)
+        
+        # 3. Универсальный поиск через зоны экрана
+        return self.find_continue_button_by_zones()
+    
+    def find_continue_button_by_zones(self) -> Optional[Tuple[int, int]]:
+        """Эвристика: типичные зоны кнопки Продолжить (правый нижний квадрант)"""
         screen_width, screen_height = self.get_screen_info()
         
         # Определяем зоны поиска для кнопки (правый нижний квадрант)
@@ -411,7 +967,7 @@ class BrowserAutomation:
             x = int(screen_width * zone["x_ratio"])
             y = int(screen_height * zone["y_ratio"])
             
-            self.log(f"Пробуем зону '{zone['name']}': ({x}, {y})", "DEBUG")
+            self.log("Пробуем зону '%s': (%s, %s)", "DEBUG", zone['name'], x, y)
             
             # Можно добавить проверку цвета пикселя или другую валидацию
             if self.is_coords_safe(x, y):
@@ -424,137 +980,211 @@ class BrowserAutomation:
         
         fallback_x = screen_width - margin_from_right
         fallback_y = screen_height - margin_from_bottom
-        
-    def find_button_with_ai_vision(self, button_description: str = "Continue button") -> Optional[Tuple[int, int]]:
-        """Поиск кнопки с помощью AI Vision (DeepSeek)"""
+        return (fallback_x, fallback_y)
+    
+    def find_button_with_ai_vision(self, button_description: str = "Continue button",
+                                   screenshot=None, cancel=None) -> Optional[Tuple[int, int]]:
+        """Поиск кнопки с помощью AI Vision (DeepSeek, с хеджированием на вторую модель; cancel снимает запрос)"""
         try:
             import base64
-            import requests
             from io import BytesIO
             
             self.log(f"AI Vision поиск: {button_description}")
             
-            # Делаем скриншот
-            screenshot = pyautogui.screenshot()
+            # Делаем скриншот (если кадр не передан)
+            frame = self.as_shared_frame(screenshot) if screenshot is not None else self.frames.get()
+            
+            # Выбор среди локально найденных кандидатов; координаты модели - только если кандидатов нет
+            if self.config["vision"]["mode"] == "marks":
+                found, coords = self.find_button_with_marks(button_description, frame, cancel)
+                if found:
+                    return coords
+            if cancel is not None and cancel.is_set():
+                return None
             
             # Конвертируем в base64
             buffer = BytesIO()
-            screenshot.save(buffer, format='PNG')
+            frame.image.save(buffer, format='PNG')
             img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
             
-            # Запрос к DeepSeek API
-            api_key = "sk-2f6aad2a5d76478c9f4c70b48d0b2efd"  # Замените на ваш ключ
-            
-            payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"""Найди на этом скриншоте кнопку: {button_description}
-                                
-                                Проанализируй изображение и найди кнопку с текстом "Продолжить", "Continue", "Далі" или похожим.
-                                
-                                Верни ТОЛЬКО координаты в формате: x,y
-                                Где x,y - это пиксельные координаты центра кнопки.
-                                
-                                Если кнопка не найдена, верни: NOT_FOUND"""
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{img_base64}"
-                                }
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": f"""Найди на этом скриншоте кнопку: {button_description}
+                            
+                            Проанализируй изображение и найди кнопку с текстом "Продолжить", "Continue", "Далі" или похожим.
+                            
+                            Верни ТОЛЬКО координаты в формате: x,y
+                            Где x,y - это пиксельные координаты центра кнопки.
+                            
+                            Если кнопка не найдена, верни: NOT_FOUND"""
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/png;base64,{img_base64}"
                             }
-                        ]
-                    }
-                ],
-                "temperature": 0.1,
-                "max_tokens": 50
-            }
+                        }
+                    ]
+                }
+            ]
             
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
+            # Координаты вне экрана считаем невалидным ответом - тогда побеждает другой провайдер
+            screen_width, screen_height = self.get_screen_info()
             
-            response = requests.post(
-                "https://api.deepseek.com/v1/chat/completions",
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
+            def validate(content: str) -> Optional[Tuple[int, int]]:
+                point = parse_point(content)
+                if point is NOT_FOUND:
+                    return point
+                if point and 0 <= point[0] <= screen_width and 0 <= point[1] <= screen_height:
+                    return point
+                self.log(f"AI ответ не подходит: {content}", "DEBUG")
+                return None
             
-            if response.status_code == 200:
-                result = response.json()
-                ai_response = result['choices'][0]['message']['content'].strip()
-                
-                self.log(f"AI ответ: {ai_response}", "DEBUG")
-                
-                # Парсим координаты
-                if "NOT_FOUND" not in ai_response and "," in ai_response:
-                    try:
-                        coords = ai_response.replace(" ", "").split(",")
-                        x, y = int(coords[0]), int(coords[1])
-                        
-                        # Проверяем валидность координат
-                        screen_width, screen_height = self.get_screen_info()
-                        if 0 <= x <= screen_width and 0 <= y <= screen_height:
-                            self.log(f"✅ AI нашел кнопку: ({x}, {y})", "SUCCESS")
-                            return (x, y)
-                        else:
-                            self.log(f"⚠️ AI координаты вне экрана: ({x}, {y})", "WARNING")
-                    except ValueError:
-                        self.log(f"❌ Не удалось распарсить координаты: {ai_response}", "ERROR")
-                
+            result = self.router.request_sync("locate", messages, validator=validate, max_tokens=50,
+                                              purpose="vision_point", cancel=cancel)
+            if cancel is not None and cancel.is_set():
+                return None
+            if result and result.parsed is NOT_FOUND:
+                self.log(f"AI: кнопки нет на экране [{result.provider}]", "DEBUG")
+            elif result:
+                x, y = result.parsed
+                self.log(f"✅ AI нашел кнопку: ({x}, {y}) [{result.provider}, {result.latency:.1f}с]", "SUCCESS")
+                return (x, y)
+            
+            self.ledger.record(outcome="fallback", purpose="vision_point")
             return None
             
         except Exception as e:
             self.log(f"Ошибка AI Vision: {e}", "ERROR")
             return None
     
+    def find_button_with_marks(self, button_description: str, frame: SharedFrame,
+                               cancel=None) -> Tuple[bool, Optional[Tuple[int, int]]]:
+        """
+        Поиск кнопки через set-of-marks: кандидаты (OCR, контуры, шаблоны) находятся
+        локально, модель видит их пронумерованными и отвечает только номером метки.
+        
+        Returns:
+            (были ли кандидаты, координаты центра выбранного бокса или None)
+        """
+        import base64
+        from io import BytesIO
+        
+        marks_config = self.config["vision"]["marks"]
+        try:
+            ocr_data = frame.ocr()
+        except ImportError:
+            ocr_data = None
+        marks = collect_candidates(frame.image, ocr_data, marks_config["templates"],
+                                   marks_config["max_marks"])
+        if not marks:
+            self.log("Set-of-marks: кандидатов нет, запрашиваем координаты", "DEBUG")
+            return False, None
+        
+        image = draw_marks(frame.image, marks, marks_config["max_side"])
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+        img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        
+        legend = describe_marks(marks)
+        if cancel is not None and cancel.is_set():
+            return True, None
+        messages = [
+            {
+                "role": "system",
+                "content": """На скриншоте кликабельные элементы обведены рамками с номерами в углу.
+Найди элемент, который является нужной кнопкой.
+Ответь ТОЛЬКО номером метки. Если подходящей метки нет, ответь: 0"""
+            },
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": f"Кнопка: {button_description}\n\nТекст меток:\n{legend}"},
+                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_base64}"}}
+                ]
+            }
+        ]
+        
+        result = self.router.request_sync(
+            "pick_mark", messages, validator=lambda content: parse_mark_id(content, marks), max_tokens=5,
+            purpose="marks", cancel=cancel)
+        if cancel is not None and cancel.is_set():
+            return True, None
+        if result and result.parsed is not NOT_FOUND:
+            mark = result.parsed
+            x, y = mark.center
+            self.log(f"✅ AI выбрал метку #{mark.id} ({mark.source} '{mark.text}'): ({x}, {y}) "
+                     f"[{result.provider}, {result.latency:.1f}с]", "SUCCESS")
+            return True, (x, y)
+        
+        self.log(f"Set-of-marks: ни одна из {len(marks)} меток не подошла", "DEBUG")
+        self.ledger.record(outcome="fallback", purpose="marks")
+        return True, None
+    
     def find_continue_button_ai_enhanced(self) -> Optional[Tuple[int, int]]:
         """AI-улучшенный поиск кнопки Продолжить"""
         self.log("🤖 AI-улучшенный поиск кнопки Продолжить...")
         
+        # Метод 0: Запомненная область (дешевая проверка OCR в маленьком окне)
+        coords = self.find_in_remembered_region(
+            "continue_button", lambda region: self.find_texts_box(self.CONTINUE_TEXTS, 0.8, region))
+        if coords:
+            return coords
+        
         # Метод 1: AI Vision (DeepSeek)
         coords = self.find_button_with_ai_vision("Continue/Продолжить button in bottom right area")
         if coords:
+            self.remember_location("continue_button", point=coords)
             return coords
         
         # Метод 2: OCR + AI анализ
         coords = self.find_button_with_smart_ai_ocr()
         if coords:
+            self.remember_location("continue_button", point=coords)
             return coords
         
         # Fallback к обычному методу
         self.log("AI не нашел кнопку, используем обычный поиск", "WARNING")
         return self.find_continue_button_smart()
     
-    def find_button_with_smart_ai_ocr(self) -> Optional[Tuple[int, int]]:
-        """Умный OCR + AI для поиска кнопок"""
+    def find_button_with_smart_ai_ocr(self, screenshot=None, button_description: str = "Продолжить/Continue/Далі",
+                                      keywords: List[str] = None,
+                                      prior: Tuple[float, float] = (0.78, 0.80),
+                                      cancel=None) -> Optional[Tuple[int, int]]:
+        """
+        Умный OCR + AI для поиска кнопок
+        
+        Args:
+            screenshot: Кадр экрана (по умолчанию общий кадр шага)
+            button_description: Какую кнопку ищем (для промпта)
+            keywords: Ожидаемые тексты кнопки (по умолчанию CONTINUE_TEXTS)
+            prior: Ожидаемый центр кнопки в долях экрана
+            cancel: Флаг отмены (до и во время запроса к модели)
+        """
         try:
             import pytesseract
             
-            # Делаем скриншот
-            screenshot = pyautogui.screenshot()
+            # Общий кадр шага (если кадр не передан)
+            frame = self.as_shared_frame(screenshot) if screenshot is not None else self.frames.get()
             
-            # Извлекаем весь текст с координатами
-            ocr_data = pytesseract.image_to_data(screenshot, output_type=pytesseract.Output.DICT)
+            # Извлекаем весь текст с координатами (OCR кадра считается один раз на шаг)
+            ocr_data = frame.ocr()
             
-            # Собираем все найденные тексты
-            found_texts = []
-            for i, text in enumerate(ocr_data['text']):
-                if text.strip() and int(ocr_data['conf'][i]) > 50:
-                    x = ocr_data['left'][i] + ocr_data['width'][i] // 2
-                    y = ocr_data['top'][i] + ocr_data['height'][i] // 2
-                    found_texts.append(f"{text}:{x},{y}")
+            # Сжимаем разметку: строки вместо слов, без хрома и мусора, лучшие кандидаты первыми
+            layout, items = compress_layout(
+                ocr_data, frame.size,
+                prior=prior,
+                keywords=keywords or self.CONTINUE_TEXTS,
+                token_budget=self.config["layout"]["token_budget"]
+            )
             
-            if found_texts:
-                # Используем AI для анализа найденных текстов
-                ai_analysis = self.analyze_texts_with_ai(found_texts)
+            if items and not (cancel is not None and cancel.is_set()):
+                # Используем AI для выбора строки
+                ai_analysis = self.analyze_layout_with_ai(layout, items, button_description, cancel)
                 if ai_analysis:
                     return ai_analysis
             
@@ -564,107 +1194,282 @@ class BrowserAutomation:
             self.log("Для smart OCR нужно: pip install pytesseract", "WARNING")
             return None
     
-    def analyze_texts_with_ai(self, texts: List[str]) -> Optional[Tuple[int, int]]:
-        """Анализ найденных текстов с помощью AI"""
+    def analyze_layout_with_ai(self, layout: str, items: Dict[int, LayoutItem],
+                               button_description: str, cancel=None) -> Optional[Tuple[int, int]]:
+        """Выбор кнопки моделью по номеру строки компактной разметки"""
         try:
-            import requests
-            
-            api_key = "YOUR_DEEPSEEK_API_KEY"  # Замените на ваш ключ
-            
-            texts_str = "\n".join(texts[:20])  # Берем первые 20 элементов
-            
-            payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": f"""Из списка найденных текстов с координатами найди кнопку "Продолжить"/"Continue"/"Далі":
-
-{texts_str}
-
-Формат: текст:x,y
-
-Найди текст который означает "продолжить" или "continue" и верни его координаты в формате: x,y
-Если не найдено, верни: NOT_FOUND"""
-                    }
-                ],
-                "temperature": 0.1,
-                "max_tokens": 30
-            }
-            
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(
-                "https://api.deepseek.com/v1/chat/completions",
-                json=payload,
-                headers=headers,
-                timeout=15
-            )
+            # Неизменная часть промпта идет первой (кэширование промпта у провайдера)
+            messages = [
+                {
+                    "role": "system",
+                    "content": """Тебе дан список строк текста с экрана в формате: номер|текст|x%,y%
+(x%,y% - центр строки в процентах ширины и высоты экрана, строки отсортированы по вероятности).
+Найди строку, которая является нужной кнопкой.
+Ответь ТОЛЬКО номером строки. Если подходящей строки нет, ответь: 0"""
+                },
+                {
+                    "role": "user",
+                    "content": f"Кнопка: {button_description}\n\n{layout}"
+                }
+            ]
             
-            if response.status_code == 200:
-                result = response.json()
-                ai_response = result['choices'][0]['message']['content'].strip()
-                
-                if "NOT_FOUND" not in ai_response and "," in ai_response:
-                    coords = ai_response.replace(" ", "").split(",")
-                    x, y = int(coords[0]), int(coords[1])
-                    self.log(f"✅ AI анализ OCR нашел: ({x}, {y})", "SUCCESS")
-                    return (x, y)
+            result = self.router.request_sync(
+                "pick_text", messages, validator=lambda content: parse_item_id(content, items), max_tokens=5,
+                purpose="ocr_layout", cancel=cancel)
+            if cancel is not None and cancel.is_set():
+                return None
+            if result and result.parsed is NOT_FOUND:
+                self.log(f"AI анализ OCR: подходящей строки нет [{result.provider}]", "DEBUG")
+            elif result:
+                item = result.parsed
+                x, y = item.center
+                self.log(f"✅ AI анализ OCR выбрал #{item.id} '{item.text}': ({x}, {y}) [{result.provider}]", "SUCCESS")
+                return (x, y)
             
+            self.ledger.record(outcome="fallback", purpose="ocr_layout")
             return None
             
         except Exception as e:
             self.log(f"Ошибка AI анализа: {e}", "ERROR")
             return None
     
-    def click_by_screenshot(self, screenshot_path: str, fallback_coords: Dict = None) -> bool:
+    def smart_target_strategies(self, step_type: str) -> List[Tuple[str, Callable]]:
+        """Независимые стратегии поиска цели smart_* шага (для гонки на одном кадре)"""
+        spec = self.SMART_TARGETS[step_type]
+        target = spec["target"]
+        texts = getattr(self, spec["texts"])
+        ocr_confidence = spec["ocr_confidence"]
+        
+        def memory(frame, cancel):
+            point = self.find_in_remembered_region(
+                target, lambda region: self.find_texts_box(texts, ocr_confidence, region, frame, cancel), cancel)
+            return Candidate(point, 0.95) if point else None
+        
+        def ocr_text(frame, cancel):
+            box = self.find_texts_box(texts, ocr_confidence, screenshot=frame, cancel=cancel)
+            return Candidate(box_center(box), 0.9, box=box) if box else None
+        
+        def detector(frame, cancel):
+            detection = self.detect_smart_target(step_type, frame)
+            return Candidate(detection.center, detection.confidence, box=detection.box) if detection else None
+        
+        def ai_vision(frame, cancel):
+            point = self.find_button_with_ai_vision(spec["vision"], screenshot=frame, cancel=cancel)
+            return Candidate(point, 0.85) if point else None
+        
+        def ocr_ai(frame, cancel):
+            point = self.find_button_with_smart_ai_ocr(screenshot=frame, cancel=cancel)
+            return Candidate(point, 0.8) if point else None
+        
+        def heuristic(frame, cancel):
+            point = getattr(self, spec["heuristic"])()
+            return Candidate(point, 0.1) if point else None
+        
+        strategies = [("memory", memory), ("ocr_text", ocr_text)]
+        if self.detector and spec.get("detector"):
+            strategies.append(("detector", detector))
+        strategies.append(("ai_vision", ai_vision))
+        if spec.get("ocr_ai"):
+            strategies.append(("ocr_ai", ocr_ai))
+        strategies.append(("heuristic", heuristic))
+        return strategies
+    
+    def detect_smart_target(self, step_type: str, frame: SharedFrame) -> Optional[UIDetection]:
+        """Цель smart_* шага по UI детектору (детекции считаются один раз на кадр)"""
+        label = self.SMART_TARGETS[step_type].get("detector")
+        if not self.detector or not label:
+            return None
+        detections = frame.derived("ui_detections", lambda: self.detector.detect(frame.image))
+        return next((detection for detection in detections if detection.label == label), None)
+    
+    def find_smart_target_in_dom(self, step_type: str) -> Optional[Tuple[int, int]]:
+        """Поиск цели smart_* шага через DOM вкладки (None - не найдена или DevTools недоступен)"""
+        if not self.dom_resolver:
+            return None
+        spec = self.SMART_TARGETS[step_type]
+        element = self.dom_resolver.find(role=spec.get("dom_role"), texts=getattr(self, spec["texts"]))
+        if not element:
+            return None
+        self.log(f"Цель '{spec['target']}' найдена через DOM: <{element.tag}> '{element.text}' "
+                 f"{element.center}", "SUCCESS")
+        return element.center
+    
+    def find_smart_target_in_accessibility(self, step_type: str) -> Optional[Tuple[int, int]]:
+        """Поиск цели smart_* шага в дереве доступности активного окна"""
+        if not self.accessibility:
+            return None
+        spec = self.SMART_TARGETS[step_type]
+        element = self.accessibility.find(role=spec.get("dom_role"), names=getattr(self, spec["texts"]))
+        if not element:
+            return None
+        self.log(f"Цель '{spec['target']}' найдена в дереве доступности: {element.native_role} "
+                 f"'{element.name}' {element.center}", "SUCCESS")
+        return element.center
+    
+    def resolve_smart_target(self, step: Dict) -> Optional[Tuple[int, int]]:
+        """
+        Поиск цели smart_* шага гонкой стратегий на одном кадре
+        
+        Args:
+            step: Шаг автоматизации (может переопределять race_threshold / race_deadline)
+        
+        Returns:
+            Координаты победителя или None
+        """
+        step_type = step["type"]
+        spec = self.SMART_TARGETS[step_type]
+        race_config = self.config["race"]
+        
+        # Свежий общий кадр после клика означает, что движок уже дождался готовности экрана
+        # (шаг сценария по состояниям передает wait_for_change=0: экран уже распознан)
+        wait_for_change = step.get("wait_for_change", spec.get("wait_for_change"))
+        if wait_for_change and self.frames.peek() is None:
+            self.wait_for_page_change(timeout=wait_for_change)
+        
+        # DOM и дерево доступности - миллисекунды и без токенов; гонка OCR/vision только если они не помогли
+        point = self.find_smart_target_in_dom(step_type) or self.find_smart_target_in_accessibility(step_type)
+        if point:
+            return point
+        
+        # Локальный детектор - десятки миллисекунд на CPU; уверенная детекция не доходит до OCR и vision
+        frame = self.frames.get()
+        detection = self.detect_smart_target(step_type, frame)
+        if detection and detection.confidence >= self.config["detector"]["accept"]:
+            self.log(f"Цель '{spec['target']}' найдена UI детектором ({detection.confidence:.2f}): "
+                     f"{detection.center}", "SUCCESS")
+            self.remember_location(spec["target"], box=detection.box, point=detection.center)
+            return detection.center
+        
+        candidate = self.resolver_race.race(
+            self.smart_target_strategies(step_type),
+            frame,
+            threshold=step.get("race_threshold", race_config["threshold"]),
+            deadline=step.get("race_deadline", race_config["deadline"]),
+            abort=self.step_cancel
+        )
+        if not candidate:
+            return None
+        
+        self.log(f"Цель '{spec['target']}' найдена стратегией '{candidate.strategy}': {candidate.point}", "SUCCESS")
+        
+        # Запоминаем проверенные находки (эвристику и саму память не записываем)
+        if candidate.strategy not in ("memory", "heuristic"):
+            self.remember_location(spec["target"], box=candidate.box, point=candidate.point)
+        return candidate.point
+    
+    def reresolve_by_text(self, step_type: str) -> Optional[Tuple[int, int]]:
+        """Дешевый повторный поиск цели smart_* шага по OCR нового кадра (без модели)"""
+        spec = self.SMART_TARGETS[step_type]
+        box = self.find_texts_box(getattr(self, spec["texts"]), spec["ocr_confidence"],
+                                  screenshot=self.frames.fresh())
+        return box_center(box) if box else None
+    
+    def locate_template(self, screenshot_path: str, confidence_levels: List[float],
+                        region: Tuple[int, int, int, int] = None,
+                        image=None) -> Optional[Tuple[int, int, int, int]]:
+        """Поиск шаблона на экране (в окне region или на готовом изображении) с понижением confidence"""
+        # Один захват на все уровни confidence (без окна - общий кадр шага)
+        if image is not None:
+            haystack, region = image, None
+        elif region:
+            haystack = self.grab_screen(region)
+        else:
+            frame = self.frames.get()
+            if isinstance(frame, RingSharedFrame):
+                # Кадр кольца: поиск в пуле процессов по самому кадру в разделяемой памяти
+                return frame.match_template(screenshot_path, confidence_levels)
+            haystack = frame.image
+        offset_x, offset_y = (region[0], region[1]) if region else (0, 0)
+        
+        for confidence in confidence_levels:
+            try:
+                location = pyautogui.locate(screenshot_path, haystack, confidence=confidence)
+                if location:
+                    left, top, width, height = (int(v) for v in location)
+                    return (left + offset_x, top + offset_y, width, height)
+            except pyautogui.ImageNotFoundException:
+                continue
+            except Exception as e:
+                self.log("Ошибка поиска (confidence=%s): %s", "DEBUG", confidence, e)
+                continue
+        return None
+    
+    def click_by_screenshot(self, screenshot_path: str, fallback_coords: Dict = None,
+                            expect: Dict = None) -> bool:
         """Универсальный клик по скриншоту с fallback"""
         self.log(f"Поиск элемента по скриншоту: {screenshot_path}")
         
         if not os.path.exists(screenshot_path):
             self.log(f"Файл скриншота не найден: {screenshot_path}", "WARNING")
             if fallback_coords:
-                return self.click_by_coordinates(fallback_coords)
+                return self.click_by_coordinates(fallback_coords, expect)
             return False
         
         # Уменьшаем количество попыток чтобы не зависать
         max_attempts = 3
         confidence_levels = [0.8, 0.6, 0.4]
         
+        def resolve() -> Optional[Tuple[int, int]]:
+            location = self.locate_template(screenshot_path, confidence_levels)
+            return box_center(location) if location else None
+        
+        # Сначала ищем шаблон в запомненной области
+        coords = self.find_in_remembered_region(
+            screenshot_path, lambda region: self.locate_template(screenshot_path, confidence_levels, region))
+        if coords and self.is_coords_safe(*coords):
+            return self.safe_click(*coords, expect, resolve)
+        
         for attempt in range(max_attempts):
-            for confidence in confidence_levels:
-                try:
-                    location = pyautogui.locateCenterOnScreen(screenshot_path, confidence=confidence)
-                    
-                    if location:
-                        self.log(f"Элемент найден: {location} (confidence={confidence})", "SUCCESS")
-                        
-                        if self.is_coords_safe(int(location.x), int(location.y)):
-                            return self.safe_click(int(location.x), int(location.y))
-                        else:
-                            self.log(f"Координаты небезопасны: {location}", "WARNING")
+            location = self.locate_template(screenshot_path, confidence_levels)
+            
+            if location:
+                x, y = box_center(location)
+                self.log(f"Элемент найден: ({x}, {y})", "SUCCESS")
                 
-                except pyautogui.ImageNotFoundException:
-                    continue
-                except Exception as e:
-                    self.log(f"Ошибка поиска (confidence={confidence}): {e}", "DEBUG")
-                    continue
+                if self.is_coords_safe(x, y):
+                    self.remember_location(screenshot_path, location)
+                    return self.safe_click(x, y, expect, resolve)
+                else:
+                    self.log(f"Координаты небезопасны: ({x}, {y})", "WARNING")
             
-            time.sleep(0.5)  # Уменьшили задержку
+            self.pause(0.5)  # Уменьшили задержку
+            self.frames.invalidate("retry")
         
         self.log("Элемент не найден по скриншоту, переходим к умному поиску", "WARNING")
         
         # Используем fallback координаты если есть
         if fallback_coords:
             self.log("Используем fallback координаты", "INFO")
-            return self.click_by_coordinates(fallback_coords)
+            return self.click_by_coordinates(fallback_coords, expect)
         
         return False
     
-    def execute_step(self, step: Dict) -> bool:
+    def execute_step(self, step: Dict, cancel: threading.Event = None) -> bool:
+        """
+        Выполнение одного шага автоматизации (со счетчиками захватов экрана и дампом при сбое)
+        
+        Args:
+            step: Шаг
+            cancel: Флаг отмены шага: после него клики не выполняются, паузы и гонка прерываются
+        """
+        name = step.get("name", "unknown")
+        self.frames.begin_step(name)
+        self.step_clicks = []
+        self.step_cancel = cancel
+        result = False
+        try:
+            with self.log.scope(step=name):
+                result = self._execute_step(step)
+            return result
+        finally:
+            self.step_cancel = None
+            metrics = self.frames.end_step()
+            self.log("Захватов экрана за шаг: %d (переиспользований кадра: %d)", "DEBUG",
+                     metrics['captures'], metrics['hits'])
+            if not result:
+                self.log.dump(f"step_{name}")
+    
+    def _execute_step(self, step: Dict) -> bool:
         """Выполнение одного шага автоматизации"""
         step_name = step.get("name", "unknown")
         step_type = step.get("type", "unknown")
@@ -681,40 +1486,36 @@ class BrowserAutomation:
         elif step_type == "screenshot_click":
             screenshot_path = step.get("screenshot_path")
             fallback_coords = step.get("fallback_coords")
-            return self.click_by_screenshot(screenshot_path, fallback_coords)
-            
-        elif step_type == "smart_google_click":
-            coords = self.find_google_button_smart()
-            if coords:
-                return self.safe_click(coords[0], coords[1])
-            return False
-            
-        elif step_type == "smart_email_click":
-            coords = self.find_email_account_smart()
-            if coords:
-                return self.safe_click(coords[0], coords[1])
-            return False
+            return self.click_by_screenshot(screenshot_path, fallback_coords, step.get("expect"))
             
-        elif step_type == "smart_continue_click":
-            coords = self.find_continue_button_ai_enhanced()  # Используем AI версию
+        elif step_type in self.SMART_TARGETS:
+            if self.config["race"]["enabled"]:
+                # Все стратегии параллельно на одном кадре
+                coords = self.resolve_smart_target(step)
+            else:
+                coords = (self.find_smart_target_in_dom(step_type)
+                          or self.find_smart_target_in_accessibility(step_type)
+                          or getattr(self, self.SMART_TARGETS[step_type]["finder"])())
             if coords:
-                return self.safe_click(coords[0], coords[1])
+                spec = self.SMART_TARGETS[step_type]
+                return self.safe_click(coords[0], coords[1], step.get("expect", spec.get("expect")),
+                                       resolve=lambda: self.reresolve_by_text(step_type))
             return False
             
         elif step_type == "wait_for_load":
             seconds = step.get("seconds", 3)
             self.log(f"Ожидание загрузки {seconds} секунд")
-            time.sleep(seconds)
+            self.pause(seconds)
             return True
             
         elif step_type == "coordinate_click":
             coords = step.get("coords", {})
-            return self.click_by_coordinates(coords)
+            return self.click_by_coordinates(coords, step.get("expect"))
             
         elif step_type == "delay":
             delay = step.get("seconds", 1)
             self.log(f"Ожидание {delay} секунд")
-            time.sleep(delay)
+            self.pause(delay)
             return True
             
         else:
@@ -729,17 +1530,42 @@ class BrowserAutomation:
             steps = self.config.get("steps", [])
             step_delay = self.config["screen"]["step_delay"]
             
+            # Продолжение после сбоя: выполненные шаги из журнала не повторяются
+            journal_config = self.config["journal"]
+            journal = RunJournal(steps, "ypp_stg", self.config["memory"]["profile"], journal_config["dir"],
+                                 journal_config["hash_threshold"], log=self.log) \
+                if journal_config["enabled"] else None
+            start = 0
+            if journal and journal.completed:
+                start = journal.resume_index(screen_hash(self.frames.fresh()))
+                if start:
+                    self.log(f"Продолжение по журналу: шаги 1-{start} уже выполнены", "SUCCESS")
+            
             for i, step in enumerate(steps):
+                # Подготовка окружения (поиск и активация браузера) нужна и при продолжении
+                if i < start and step.get("type") != "browser_detection":
+                    continue
+                if self.step_cancelled():
+                    self.log("Запуск отменен", "WARNING")
+                    return False
                 self.log(f"Шаг {i+1}/{len(steps)}")
+                if journal and i > start:
+                    # Экран, с которого начинается шаг, - состояние после предыдущего (общий кадр шага)
+                    journal.mark_screen(i - 1, screen_hash(self.frames.get()))
                 
-                if not self.execute_step(step):
+                if not self.execute_step(step, self.run_cancel):
                     self.log(f"Шаг {i+1} не выполнен", "ERROR")
                     return False
+                if journal and i >= start:
+                    journal.complete(i, step.get("name", step.get("type", "")),
+                                     [{"click": point} for point in self.step_clicks])
                 
                 # Задержка между шагами (кроме последнего)
                 if i < len(steps) - 1:
-                    time.sleep(step_delay)
+                    self.pause(step_delay)
             
+            if journal:
+                journal.finish()
             self.log("🎉 Автоматизация завершена успешно!", "SUCCESS")
             return True
             
@@ -747,9 +1573,63 @@ class BrowserAutomation:
             self.log(f"Критическая ошибка: {e}", "ERROR")
             return False
         finally:
+            self.log_run_stats()
+            
             # Восстанавливаем FAILSAFE
             pyautogui.FAILSAFE = self.original_failsafe
 
+    def log_run_stats(self):
+        """Итоги запуска: стратегии поиска, состояния экрана, захваты, проверка кликов, резолверы, модели"""
+        for name, stats in self.resolver_race.summary().items():
+            self.log(f"Стратегия '{name}': {stats}", "DEBUG")
+        if any(self.state_recognizer.stats.values()):
+            self.log(f"Распознавание состояний: {self.state_recognizer.stats}", "DEBUG")
+        self.log(f"Захваты экрана: {self.frames.summary()}", "DEBUG")
+        if self.frame_ring:
+            self.log(f"Кольцо кадров: {self.frame_ring.stats} {self.frame_ring.ring.stats()}", "DEBUG")
+        self.log(f"Проверка кликов: {self.verifier.stats}", "DEBUG")
+        if self.dom_resolver:
+            self.log(f"Поиск через DOM: {self.dom_resolver.stats}", "DEBUG")
+        if self.accessibility:
+            self.log(f"Дерево доступности: {self.accessibility.stats}", "DEBUG")
+        if self.detector and self.detector.stats["frames"]:
+            self.log(f"UI детектор: {self.detector.stats['frames']} кадров, "
+                     f"{self.detector.ms_per_frame():.1f} мс/кадр", "DEBUG")
+        self.log_vision_costs()
+
+    def log_vision_costs(self):
+        """Итог вызовов моделей за запуск (подробности - в журнале стоимости) и сохранение статистики маршрутов"""
+        try:
+            self.router.save()
+        except OSError as e:
+            self.log(f"Статистика моделей не сохранена: {e}", "WARNING")
+        totals = self.ledger.totals()
+        if totals["calls"]:
+            self.log(f"Вызовы моделей: {totals['calls']}, токены {totals['prompt_tokens']}/"
+                     f"{totals['completion_tokens']}, ${totals['cost']:.4f} {totals['outcomes']}")
+            for key, stats in self.ledger.run_summary().items():
+                self.log(f"Модель {key}: {stats}", "DEBUG")
+            self.log(f"Маршруты моделей: {self.router.summary()}", "DEBUG")
+
+    def run_flow(self, name: str = "google_signin") -> bool:
+        """Запуск сценария по состояниям экрана (шаг выбирается по распознанному экрану)"""
+        try:
+            result = asyncio.run(AsyncStepEngine(self).run_flow(self.config["flows"][name], self.state_recognizer))
+            if not result:
+                self.log.dump(f"flow_{name}")
+            return result
+        finally:
+            self.log_run_stats()
+            pyautogui.FAILSAFE = self.original_failsafe
+    
+    def run_automation_async(self) -> bool:
+        """Запуск автоматизации через асинхронный движок с ожиданием готовности и предзагрузкой"""
+        try:
+            return asyncio.run(AsyncStepEngine(self).run(self.config.get("steps", [])))
+        finally:
+            self.log_run_stats()
+            pyautogui.FAILSAFE = self.original_failsafe
+
 # Пример использования
 if __name__ == "__main__":
     # Кастомная конфигурация (опционально)
@@ -795,4 +1675,5 @@ if __name__ == "__main__":
     
     # Создание и запуск автоматизации
     automation = BrowserAutomation(custom_config)
-    automation.run_automation()
\ No newline at end of file
+    # Сценарий по состояниям экрана (линейный список steps: automation.run_automation_async())
+    automation.run_flow("google_signin")
\ No newline at end of file
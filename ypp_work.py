@@ -13,13 +13,30 @@ import asyncio
 import time
 import subprocess
 import base64
-import json
 import os
 import re
+import threading
 from typing import Dict, List, Optional, Tuple
-from PIL import Image, ImageGrab
-import aiohttp
-from dataclasses import dataclass
+from PIL import Image
+from dataclasses import dataclass, replace
+from io import BytesIO
+
+from action_grammar import RESPONSE_FORMAT, SYSTEM_PROMPT_COORDS, SYSTEM_PROMPT_MARKS, parse_plan
+from action_verify import ActionVerifier, Expectation, nudge_points, region_around
+from cdp_client import CdpConnection
+from cdp_input import CdpInput
+from dom_resolver import DomResolver
+from frame_ring import FrameRingService, RingSharedFrame
+from location_memory import LocationMemory, box_center
+from model_router import ModelRouter
+from run_journal import RunJournal, screen_hash
+from run_log import RunLogger
+from screen_capture import grab_image
+from set_of_marks import Mark, collect_candidates, describe_marks, draw_marks
+from ui_detector import load_detector
+from vision_batch import VisionBatcher
+from vision_client import HedgedVisionClient, VisionProvider
+from vision_ledger import VisionLedger
 
 @dataclass
 class BrowserAction:
@@ -29,11 +46,36 @@ class BrowserAction:
     value: str = None  # текст для ввода
     coordinates: Tuple[int, int] = None  # координаты для клика
     description: str = ""  # описание действия
+    source: str = "ai"  # откуда действие: ai, fallback, memory, dom, detector
+    expect: Optional[Expectation] = None  # ожидаемый эффект (пиксели скриншота)
+    repeatable: bool = False  # повторный клик безопасен (фокус поля ввода, а не отправка или выбор)
+
+# План сначала у быстрой модели; gpt-4o - только если ответ невалиден или клик без известной цели
+ROUTING = {"plan": {"tiers": [["openai-mini"], ["openai"]]}}
+
 
 class YuppAutomation:
     """Оптимизированная автоматизация для yupp.ai"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, profile: str = "default", display_scale: float = 1.0,
+                 hedge_providers: List[VisionProvider] = None, hedge_delay: float = None,
+                 use_marks: bool = True, verify_actions: bool = True, cdp_port: Optional[int] = 9222,
+                 input_backend: str = "os", log_level: str = "INFO", log_file: str = None,
+                 ledger_path: Optional[str] = "vision_ledger.jsonl",
+                 providers: List[VisionProvider] = None, pace: float = 1.0,
+                 journal_dir: Optional[str] = "run_journal", routing: Dict = None,
+                 route_stats_path: Optional[str] = "model_stats.json", batcher: VisionBatcher = None,
+                 detector_model: Optional[str] = "models/ui_detector.onnx", detector_accept: float = 0.6,
+                 frame_ring: FrameRingService = None):
+        # Лог с самописцем: при неудачной команде последние записи и скриншоты пишутся в flight_records/
+        self.log = RunLogger(f"work-{profile}", level=log_level, file=log_file)
+        self.profile = profile
+        # Журнал выполненных команд run_script для продолжения после сбоя (None - без журнала)
+        self.journal_dir = journal_dir
+        self.last_actions: List[Dict] = []
+        # Флаг отмены запуска (например, job_queue потерял аренду задания): действия больше не выполняются
+        self.cancel: Optional[threading.Event] = None
+        
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
         self.api_url = "https://api.openai.com/v1/chat/completions"
         self.model = "gpt-4o"
@@ -41,27 +83,117 @@ class YuppAutomation:
         if not self.api_key:
             raise ValueError("OpenAI API ключ не найден. Установите OPENAI_API_KEY или передайте ключ.")
         
-    def log(self, message: str, level: str = "INFO"):
-        """Логирование с цветными иконками"""
-        icons = {
-            "INFO": "ℹ️", "SUCCESS": "✅", "WARNING": "⚠️", 
-            "ERROR": "❌", "AI": "🤖", "ACTION": "⚡"
-        }
-        print(f"{icons.get(level, 'ℹ️')} {message}")
+        # Основная модель + хедж (по умолчанию более быстрая модель того же провайдера)
+        if hedge_providers is None:
+            hedge_providers = [VisionProvider(
+                name="openai-mini", api_url=self.api_url, model="gpt-4o-mini", api_key=self.api_key)]
+        # Журнал токенов и стоимости вызовов (атрибуция по команде из контекста лога)
+        self.ledger = VisionLedger(ledger_path, script="ypp_work", profile=profile,
+                                   context=lambda: self.log.context)
+        # providers - полный список вместо openai + хедж (например, локальный планировщик симулятора)
+        if providers is None:
+            providers = [VisionProvider(name="openai", api_url=self.api_url, model=self.model,
+                                        api_key=self.api_key)] + hedge_providers
+        self.vision_client = HedgedVisionClient(
+            providers,
+            hedge_delay=hedge_delay,
+            log=self.log,
+            ledger=self.ledger
+        )
+        # Уровни моделей по типу запроса (имена провайдеров) со статистикой между запусками
+        self.router = ModelRouter(self.vision_client, rules=ROUTING if routing is None else routing,
+                                  stats_path=route_stats_path, log=self.log)
+        # Общий для исполнителей процесса пакетный слой (None - каждый запрос отдельно)
+        self.batcher = batcher
+        # Локальный UI детектор кнопок prefer (None - нет модели или onnxruntime)
+        self.detector = load_detector({"model": detector_model}, log=self.log)
+        self.detector_accept = detector_accept
+        # Кольцо кадров (None - захват в этом процессе): OCR скриншотов считается в его пуле
+        self.frame_ring = frame_ring
+        self.ring_frames: Dict[str, RingSharedFrame] = {}
+        
+        # Память расположения кнопок prefer (координаты клика, ключ - разрешение скриншота)
+        self.location_memory = LocationMemory(profile=profile, log=self.log)
+        # Пикселей скриншота на одну точку клика (2.0 для Retina)
+        self.display_scale = display_scale
+        # Множитель пауз между действиями и ожиданий загрузки (0 - без пауз, для симулятора)
+        self.pace = pace
+        # Set-of-marks: модель выбирает номер локально найденного элемента вместо координат
+        self.use_marks = use_marks
+        
+        # Поиск кнопок через DOM вкладки (None - отключено); координаты DOM - уже точки клика
+        self.dom = DomResolver(CdpConnection(port=cdp_port, log=self.log), screen_scale=display_scale,
+                               log=self.log) if cdp_port else None
+        
+        # Ввод: "os" - osascript с активацией окна, "cdp" - события прямо во вкладку через DevTools
+        # (без фокуса; скриншоты - только страница в CSS пикселях, они же точки клика)
+        self.cdp_input = None
+        # Пикселей скриншота на одну точку клика
+        self.click_scale = display_scale
+        
+        # Проверка эффекта кликов по локальному сравнению кадров
+        self.verify_actions = verify_actions
+        self.verifier = ActionVerifier(grab=grab_image, log=self.log)
+        if input_backend == "cdp":
+            connection = self.dom.connection if self.dom else CdpConnection(port=cdp_port or 9222, log=self.log)
+            self.use_input(CdpInput(connection, screen_scale=display_scale))
+    
+    def use_input(self, backend):
+        """
+        Ввод и снимки через бэкенд с интерфейсом CdpInput (координаты страницы = пиксели снимка)
+        
+        Args:
+            backend: CdpInput или screen_sim.SimInput
+        """
+        self.cdp_input = backend
+        self.click_scale = 1.0
+        self.verifier.grab = backend.screenshot_sync
+    
+    async def pause(self, seconds: float):
+        """Пауза с учетом pace"""
+        if seconds * self.pace > 0:
+            await asyncio.sleep(seconds * self.pace)
+        
+    async def current_screen_hash(self) -> Optional[int]:
+        """Хэш текущего экрана для журнала (None - снимок не удался)"""
+        try:
+            image = await self.cdp_input.screenshot() if self.cdp_input else await asyncio.to_thread(grab_image)
+            return screen_hash(image)
+        except Exception as e:
+            self.log(f"Хэш экрана недоступен: {e}", "DEBUG")
+            return None
     
     async def take_screenshot(self) -> str:
         """Создание скриншота с уникальным именем"""
         try:
-            screenshot = ImageGrab.grab()
-            timestamp = int(time.time() * 1000)  # Более уникальное имя
+            frame = None
+            if self.frame_ring and not self.cdp_input:
+                frame = await asyncio.to_thread(self.frame_ring.shared_frame)
+            if frame is not None:
+                screenshot = frame.image
+            else:
+                screenshot = await self.cdp_input.screenshot() if self.cdp_input else grab_image()
+            self.log.frame(screenshot, "screenshot")
+            timestamp = time.time_ns()  # уникальное имя и при нескольких скриншотах за миллисекунду
             path = f"/tmp/yupp_screenshot_{timestamp}.png"
-            screenshot.save(path, optimize=True, quality=85)
+            # Файл читается только локально (модели уходит уменьшенная копия) - быстрое сжатие
+            screenshot.save(path, compress_level=1)
+            if frame is not None:
+                self.ring_frames[path] = frame
             self.log(f"📸 Скриншот: {path}")
             return path
         except Exception as e:
             self.log(f"Ошибка создания скриншота: {e}", "ERROR")
             return None
     
+    def discard_screenshot(self, path: str):
+        """Удаление файла скриншота и его кадра кольца"""
+        self.ring_frames.pop(path, None)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
     def image_to_base64(self, image_path: str) -> str:
         """Конвертация изображения в base64 с оптимизацией"""
         try:
@@ -86,156 +218,140 @@ class YuppAutomation:
             self.log(f"Ошибка конвертации изображения: {e}", "ERROR")
             return None
     
-    def parse_json_response(self, content: str) -> dict:
-        """Улучшенный парсинг JSON ответов от AI"""
+    def prepare_marks(self, screenshot_path: str) -> Tuple[List[Mark], Optional[str]]:
+        """
+        Кандидаты для set-of-marks: OCR строки и контуры кнопок скриншота,
+        пронумерованные и нарисованные на уменьшенной копии
+        
+        Returns:
+            (метки в пикселях скриншота, base64 изображения с метками)
+        """
         try:
-            # Ищем JSON блок
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            
-            if json_start == -1 or json_end <= json_start:
-                raise ValueError("JSON блок не найден")
-            
-            json_str = content[json_start:json_end]
-            
-            # Очищаем от частых проблем
-            json_str = re.sub(r'\.{3,}', '', json_str)  # Убираем многоточия
-            json_str = re.sub(r',\s*}', '}', json_str)  # Убираем лишние запятые
-            json_str = re.sub(r',\s*]', ']', json_str)  # Убираем лишние запятые в массивах
-            
-            # Пытаемся парсить
-            try:
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                # Если не получилось, ищем только массив actions
-                actions_match = re.search(r'"actions"\s*:\s*(\[.*?\])', json_str, re.DOTALL)
-                if actions_match:
-                    actions_json = actions_match.group(1)
-                    actions = json.loads(actions_json)
-                    return {"actions": actions}
-                else:
-                    raise ValueError("Не удалось извлечь actions")
-                    
+            with Image.open(screenshot_path) as img:
+                img = img.convert("RGB")
+                try:
+                    frame = self.ring_frames.get(screenshot_path)
+                    if frame is not None:
+                        ocr_data = frame.ocr()  # в пуле кольца по кадру в разделяемой памяти
+                    else:
+                        import pytesseract
+                        ocr_data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+                except ImportError:
+                    ocr_data = None
+                
+                marks = collect_candidates(img, ocr_data)
+                if not marks:
+                    return [], None
+                
+                marked = draw_marks(img, marks)
+                buffer = BytesIO()
+                marked.save(buffer, format='PNG', optimize=True)
+                return marks, base64.b64encode(buffer.getvalue()).decode('utf-8')
+                
         except Exception as e:
-            self.log(f"Ошибка парсинга JSON: {e}", "ERROR")
+            self.log(f"Ошибка подготовки меток: {e}", "WARNING")
+            return [], None
+    
+    def mark_to_coordinates(self, mark_id, marks: List[Mark]) -> Optional[Tuple[int, int]]:
+        """Номер метки -> координаты клика (центр локального бокса)"""
+        by_id = {mark.id: mark for mark in marks}
+        try:
+            mark = by_id.get(int(mark_id))
+        except (TypeError, ValueError):
+            return None
+        if not mark:
             return None
+        x, y = mark.center
+        return (int(x / self.click_scale), int(y / self.click_scale))
     
     async def analyze_screen(self, command: str, screenshot_path: str) -> List[BrowserAction]:
-        """Анализ скриншота и создание плана действий"""
+        """Анализ скриншота и создание плана действий (компактная грамматика action_grammar)"""
         try:
-            image_base64 = self.image_to_base64(screenshot_path)
-            if not image_base64:
-                return self.get_fallback_actions(command)
+            marks, image_base64 = self.prepare_marks(screenshot_path) if self.use_marks else ([], None)
+            if marks:
+                system_prompt = SYSTEM_PROMPT_MARKS
+                context = f"Marks with text:\n{describe_marks(marks)}"
+                point_scale = 1.0
+                bounds = None
+            else:
+                image_base64 = self.image_to_base64(screenshot_path)
+                if not image_base64:
+                    return self.get_fallback_actions(command)
+                system_prompt = SYSTEM_PROMPT_COORDS
+                context = ""
+                # Модель видит уменьшенную копию: пиксели копии -> пиксели скриншота
+                with Image.open(screenshot_path) as img:
+                    point_scale = max(img.size) / min(1024, max(img.size))
+                    bounds = (img.width / point_scale, img.height / point_scale)
             
-            # Улучшенный системный промпт с фокусом на кнопки prefer
-            system_prompt = """You are an expert browser automation AI for yupp.ai website. 
-
-ANALYZE the screenshot carefully and create precise actions for the user's command.
-
-AVAILABLE ACTIONS:
-1. click - Click element (MUST provide exact [x, y] coordinates)
-2. type - Type text into input field
-3. key - Press key (Return, Tab, Delete, etc.)
-4. navigate - Go to URL
-5. wait - Wait specified seconds
-6. scroll - Scroll page (up/down)
-
-SPECIAL FOCUS FOR YUPP.AI:
-- Input field: Usually in bottom center (around y=700-800)
-- "I prefer this" buttons: Look for small buttons below AI responses
-- AI responses appear in chat bubbles with preference buttons below
-- Preference buttons are often labeled "I prefer this" or have thumbs up icons
-- Look carefully for clickable elements near AI response text
-
-RESPONSE FORMAT (valid JSON only):
-{
-    "actions": [
-        {
-            "action_type": "click",
-            "coordinates": [x, y],
-            "description": "Click on specific element"
-        },
-        {
-            "action_type": "type",
-            "value": "text to type",
-            "description": "Type specific text"
-        }
-    ]
-}
-
-CRITICAL RULES:
-- ALWAYS provide exact coordinates [x, y] for click actions
-- For "prefer" commands: scan ENTIRE screen for preference buttons
-- Look for buttons, links, or clickable text related to preferences
-- If multiple options exist, choose the most visible one
-- Be extra careful with preference button coordinates
-- Return ONLY valid JSON, no explanations outside JSON"""
-
+            # Неизменный системный промпт идет первым, все переменное - в сообщении пользователя
             messages = [
                 {"role": "system", "content": system_prompt},
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "text",
-                            "text": f"Command: '{command}'\n\nAnalyze this yupp.ai screenshot and create action plan with EXACT coordinates:"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{image_base64}"}
-                        }
+                        {"type": "text", "text": f"Command: {command}\n{context}".strip()},
+                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_base64}"}}
                     ]
                 }
             ]
             
-            payload = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": 800,
-                "temperature": 0.1
-            }
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        content = result['choices'][0]['message']['content']
-                        
-                        self.log(f"AI ответ получен ({len(content)} символов)", "AI")
-                        
-                        # Парсим JSON
-                        plan_data = self.parse_json_response(content)
-                        if not plan_data:
-                            return self.get_fallback_actions(command)
-                        
-                        # Создаем действия
-                        actions = []
-                        for action_data in plan_data.get("actions", []):
-                            # Исправляем поля
-                            if "duration" in action_data:
-                                action_data["value"] = str(action_data["duration"])
-                            
-                            action = BrowserAction(
-                                action_type=action_data.get("action_type"),
-                                target=action_data.get("target"),
-                                value=action_data.get("value"),
-                                coordinates=tuple(action_data.get("coordinates", [])) if action_data.get("coordinates") else None,
-                                description=action_data.get("description", "")
-                            )
-                            actions.append(action)
-                        
-                        self.log(f"Создано {len(actions)} действий", "SUCCESS")
-                        return actions
-                    
-                    else:
-                        error_text = await response.text()
-                        self.log(f"API ошибка {response.status}: {error_text[:200]}", "ERROR")
-                        return self.get_fallback_actions(command)
+            # Первый ответ, прошедший строгую проверку схемы, побеждает; медленная модель отменяется
+            # Неуверенный план (клик по несуществующей метке или мимо изображения) - повод спросить
+            # более сильную модель
+            known = {mark.id for mark in marks or ()}
+            
+            def confident(plan: List[Dict]) -> bool:
+                for item in plan:
+                    if item["mark"] is not None and item["mark"] not in known:
+                        return False
+                    if item["point"] is not None and bounds is not None and not (
+                            0 <= item["point"][0] <= bounds[0] and 0 <= item["point"][1] <= bounds[1]):
+                        return False
+                return True
+            
+            request = dict(validator=parse_plan, confident=confident, max_tokens=150,
+                           extra={"response_format": RESPONSE_FORMAT}, purpose="marks_plan" if marks else "plan")
+            if self.batcher:
+                # Одновременные запросы других профилей уходят одним вызовом
+                result = await self.batcher.request(self.router, "plan", messages, **request)
+            else:
+                result = await self.router.request("plan", messages, **request)
+            if not result:
+                return self.get_fallback_actions(command)
+            
+            usage = result.usage or {}
+            self.log(f"AI ответ получен от {result.provider} за {result.latency:.1f}с "
+                     f"({usage.get('completion_tokens', len(result.content))} ток. ответа"
+                     f"{f', {len(marks)} меток' if marks else ''})", "AI")
+            
+            actions = []
+            for item in result.parsed:
+                coordinates = None
+                if item["action_type"] == "click":
+                    if item["mark"] is not None:
+                        coordinates = self.mark_to_coordinates(item["mark"], marks)
+                    elif item["point"] is not None:
+                        x, y = item["point"]
+                        coordinates = (int(x * point_scale / self.click_scale),
+                                       int(y * point_scale / self.click_scale))
+                    if not coordinates:
+                        self.log(f"Клик без цели: метка {item['mark']}", "WARNING")
+                        continue
+                
+                actions.append(BrowserAction(
+                    action_type=item["action_type"],
+                    value=item["value"],
+                    coordinates=coordinates,
+                    description=(f"{item['action_type']} #{item['mark']}" if item["mark"] is not None
+                                 else f"{item['action_type']} {item['value'] or coordinates}")
+                ))
+            
+            if not actions:
+                return self.get_fallback_actions(command)
+            
+            self.log(f"Создано {len(actions)} действий", "SUCCESS")
+            return actions
         
         except Exception as e:
             self.log(f"Ошибка анализа: {e}", "ERROR")
@@ -243,6 +359,7 @@ CRITICAL RULES:
     
     def get_fallback_actions(self, command: str) -> List[BrowserAction]:
         """Резервные действия на основе текстового анализа"""
+        self.ledger.record(outcome="fallback", purpose="plan")
         actions = []
         cmd = command.lower()
         
@@ -275,7 +392,8 @@ CRITICAL RULES:
                 actions.append(BrowserAction(
                     action_type="click",
                     coordinates=(640, 750),  # Ниже для yupp.ai
-                    description="Клик в поле ввода"
+                    description="Клик в поле ввода",
+                    repeatable=True
                 ))
                 
                 # Очищаем поле
@@ -345,10 +463,16 @@ CRITICAL RULES:
                 description="Нажать Enter"
             ))
         
+        for action in actions:
+            action.source = "fallback"
+        
         return actions
     
     async def execute_action(self, action: BrowserAction) -> bool:
         """Выполнение одного действия"""
+        if self.cancel is not None and self.cancel.is_set():
+            self.log(f"Действие '{action.description}' пропущено: запуск отменен", "WARNING")
+            return False
         try:
             self.log(f"Выполнение: {action.description}", "ACTION")
             
@@ -372,6 +496,79 @@ CRITICAL RULES:
             self.log(f"Ошибка выполнения действия: {e}", "ERROR")
             return False
     
+    def default_expectation(self, action: BrowserAction) -> Optional[Expectation]:
+        """Ожидаемый эффект действия: для клика - изменение области вокруг точки"""
+        if action.expect is not None:
+            return action.expect
+        if not self.verify_actions or action.action_type != "click" or not action.coordinates:
+            return None
+        x, y = action.coordinates
+        point = (int(x * self.click_scale), int(y * self.click_scale))
+        return Expectation(kind="region_changes", region=region_around(point, int(120 * self.click_scale)),
+                           repeatable=action.repeatable)
+    
+    async def relocate(self, action: BrowserAction) -> Optional[Tuple[int, int]]:
+        """Повторный дешевый поиск цели клика на текущем экране (без модели); None - не найдена"""
+        if action.source != "dom" or not self.dom or not action.target:
+            return None
+        element = await self.dom.find_async(role="button", texts=[action.target], exact=True)
+        if not element:
+            return None
+        return element.page_center if self.cdp_input else element.center
+    
+    async def execute_verified(self, action: BrowserAction) -> bool:
+        """
+        Действие с проверкой ожидаемого эффекта; клик без эффекта повторяется
+        локально (без обращения к модели): по заново найденной цели, а для
+        repeatable - и со сдвигом точки. Если область цели все же изменилась
+        (эффект поздний или ниже порога), повтора нет - кнопки отправки и выбора
+        не нажимаются дважды.
+        """
+        expect = self.default_expectation(action)
+        if expect is None:
+            return await self.execute_action(action)
+        
+        try:
+            base = await asyncio.to_thread(self.verifier.baseline, expect)
+        except Exception as e:
+            self.log(f"Проверка эффекта недоступна: {e}", "WARNING")
+            return await self.execute_action(action)
+        
+        async def retries():
+            if action.action_type != "click" or not action.coordinates:
+                return
+            # Заново найденная цель - на экране после неудачной попытки, затем сдвиги
+            resolved = await self.relocate(action)
+            if resolved:
+                yield resolved
+            if expect.repeatable:
+                for point in nudge_points(action.coordinates, 3):
+                    yield point
+        
+        tried = [action.coordinates]
+        current = action
+        targets = retries()
+        while current is not None:
+            acted = await self.execute_action(current)
+            if acted and await self.verifier.wait_async(expect, base):
+                self.verifier.record(True, len(tried))
+                return True
+            # Повтор только если область не изменилась вовсе: иначе клик уже сработал
+            if acted and await self.verifier.wait_async(expect, base, any_change=True):
+                self.verifier.late(len(tried))
+                return True
+            current = None
+            async for point in targets:
+                if point not in tried:
+                    tried.append(point)
+                    current = replace(action, coordinates=point)
+                    self.log(f"Эффект не подтвержден, повтор клика по {point}", "WARNING")
+                    break
+        
+        self.verifier.record(False, len(tried))
+        self.log(f"Эффект '{expect.kind}' не подтвержден", "WARNING")
+        return False
+    
     async def click(self, action: BrowserAction) -> bool:
         """Клик по координатам"""
         if not action.coordinates:
@@ -379,23 +576,27 @@ CRITICAL RULES:
             return False
         
         try:
-            # Активируем браузер
-            subprocess.run(['osascript', '-e', '''
-                tell application "SunBrowser" to activate
-            '''])
-            await asyncio.sleep(0.3)
-            
             x, y = action.coordinates
             
-            # Выполняем клик
-            subprocess.run(['osascript', '-e', f'''
-                tell application "System Events"
-                    click at {{{x}, {y}}}
-                end tell
-            '''])
+            if self.cdp_input:
+                # Клик во вкладку без активации окна (координаты страницы)
+                await self.cdp_input.click(x, y)
+            else:
+                # Активируем браузер
+                subprocess.run(['osascript', '-e', '''
+                    tell application "SunBrowser" to activate
+                '''])
+                await self.pause(0.3)
+                
+                # Выполняем клик
+                subprocess.run(['osascript', '-e', f'''
+                    tell application "System Events"
+                        click at {{{x}, {y}}}
+                    end tell
+                '''])
             
             self.log(f"Клик по ({x}, {y})", "SUCCESS")
-            await asyncio.sleep(0.5)
+            await self.pause(0.5)
             return True
             
         except Exception as e:
@@ -409,19 +610,22 @@ CRITICAL RULES:
             return False
         
         try:
-            # Экранируем специальные символы
-            safe_text = action.value.replace('\\', '\\\\').replace('"', '\\"')
-            
-            subprocess.run(['osascript', '-e', f'''
-                tell application "SunBrowser" to activate
-                delay 0.2
-                tell application "System Events"
-                    keystroke "{safe_text}"
-                end tell
-            '''])
+            if self.cdp_input:
+                await self.cdp_input.type_text(action.value)
+            else:
+                # Экранируем специальные символы
+                safe_text = action.value.replace('\\', '\\\\').replace('"', '\\"')
+                
+                subprocess.run(['osascript', '-e', f'''
+                    tell application "SunBrowser" to activate
+                    delay 0.2
+                    tell application "System Events"
+                        keystroke "{safe_text}"
+                    end tell
+                '''])
             
             self.log(f"Введен текст: {action.value[:50]}{'...' if len(action.value) > 50 else ''}", "SUCCESS")
-            await asyncio.sleep(0.5)
+            await self.pause(0.5)
             return True
             
         except Exception as e:
@@ -433,6 +637,12 @@ CRITICAL RULES:
         key = action.value or "Return"
         
         try:
+            if self.cdp_input:
+                await self.cdp_input.press_key(key)
+                self.log(f"Нажата клавиша: {key}", "SUCCESS")
+                await self.pause(0.5)
+                return True
+            
             # Обработка специальных сочетаний
             if "Command" in key and "A" in key:
                 script = '''
@@ -469,7 +679,7 @@ CRITICAL RULES:
             
             subprocess.run(['osascript', '-e', script])
             self.log(f"Нажата клавиша: {key}", "SUCCESS")
-            await asyncio.sleep(0.5)
+            await self.pause(0.5)
             return True
             
         except Exception as e:
@@ -486,6 +696,12 @@ CRITICAL RULES:
             url = 'https://' + url
         
         try:
+            if self.cdp_input:
+                await self.cdp_input.navigate(url)
+                self.log(f"Переход на: {url}", "SUCCESS")
+                await self.pause(3)  # Ждем загрузки
+                return True
+            
             subprocess.run(['osascript', '-e', f'''
                 tell application "SunBrowser"
                     activate
@@ -501,7 +717,7 @@ CRITICAL RULES:
             '''])
             
             self.log(f"Переход на: {url}", "SUCCESS")
-            await asyncio.sleep(3)  # Ждем загрузки
+            await self.pause(3)  # Ждем загрузки
             return True
             
         except Exception as e:
@@ -513,10 +729,10 @@ CRITICAL RULES:
         try:
             wait_time = int(action.value) if action.value else 3
             self.log(f"Ожидание {wait_time} секунд...")
-            await asyncio.sleep(wait_time)
+            await self.pause(wait_time)
             return True
         except:
-            await asyncio.sleep(3)
+            await self.pause(3)
             return True
     
     async def scroll(self, action: BrowserAction) -> bool:
@@ -524,27 +740,110 @@ CRITICAL RULES:
         direction = action.value or "down"
         
         try:
-            key_code = "125" if direction == "down" else "126"  # Стрелка вниз/вверх
-            
-            subprocess.run(['osascript', '-e', f'''
-                tell application "SunBrowser" to activate
-                delay 0.2
-                tell application "System Events"
-                    key code {key_code}
-                end tell
-            '''])
+            if self.cdp_input:
+                await self.cdp_input.scroll(direction)
+            else:
+                key_code = "125" if direction == "down" else "126"  # Стрелка вниз/вверх
+                
+                subprocess.run(['osascript', '-e', f'''
+                    tell application "SunBrowser" to activate
+                    delay 0.2
+                    tell application "System Events"
+                        key code {key_code}
+                    end tell
+                '''])
             
             self.log(f"Прокрутка: {direction}", "SUCCESS")
-            await asyncio.sleep(0.5)
+            await self.pause(0.5)
             return True
             
         except Exception as e:
             self.log(f"Ошибка прокрутки: {e}", "ERROR")
             return False
     
+    def is_prefer_command(self, command: str) -> bool:
+        """Команда нажатия кнопки prefer"""
+        return 'prefer' in command.lower()
+    
+    def detect_prefer(self, screenshot_path: str) -> Optional[Tuple[int, int]]:
+        """Кнопка prefer по UI детектору (самая уверенная, при равенстве - левая)"""
+        try:
+            with Image.open(screenshot_path) as img:
+                detections = [d for d in self.detector.detect(img) if d.label == "prefer"
+                              and d.confidence >= self.detector_accept]
+        except Exception as e:
+            self.log(f"Ошибка UI детектора: {e}", "WARNING")
+            return None
+        if not detections:
+            return None
+        best = max(detections, key=lambda d: (round(d.confidence, 1), -d.box[0]))
+        self.location_memory.record_hit("prefer_button", img.size, tuple(
+            int(value / self.click_scale) for value in best.box))
+        x, y = best.center
+        self.log(f"Кнопка prefer найдена UI детектором ({best.confidence:.2f}, "
+                 f"{self.detector.ms_per_frame():.0f} мс/кадр)", "SUCCESS")
+        return (int(x / self.click_scale), int(y / self.click_scale))
+    
+    def find_remembered_prefer(self, screenshot_path: str) -> Optional[Tuple[int, int]]:
+        """Проверка OCR маленького окна вокруг кнопки prefer из прошлого запуска"""
+        try:
+            import pytesseract
+        except ImportError:
+            return None
+        
+        try:
+            with Image.open(screenshot_path) as img:
+                resolution = img.size
+                region = self.location_memory.search_region("prefer_button", resolution)
+                if not region:
+                    return None
+                
+                # Окно в координатах клика -> пиксели скриншота
+                scale = self.click_scale
+                left, top, width, height = region
+                crop = img.crop((int(left * scale), int(top * scale),
+                                 int((left + width) * scale), int((top + height) * scale)))
+                ocr_data = pytesseract.image_to_data(crop, output_type=pytesseract.Output.DICT)
+            
+            for i, text in enumerate(ocr_data['text']):
+                if 'prefer' in text.lower() and int(ocr_data['conf'][i]) > 50:
+                    box = (left + int(ocr_data['left'][i] / scale), top + int(ocr_data['top'][i] / scale),
+                           int(ocr_data['width'][i] / scale), int(ocr_data['height'][i] / scale))
+                    self.location_memory.record_hit("prefer_button", resolution, box)
+                    self.log(f"Кнопка prefer найдена в запомненной области: {box_center(box)}", "SUCCESS")
+                    return box_center(box)
+            
+            self.location_memory.record_miss("prefer_button", resolution)
+            return None
+            
+        except Exception as e:
+            self.log(f"Ошибка проверки запомненной области: {e}", "WARNING")
+            return None
+    
+    def remember_prefer_click(self, screenshot_path: str, coordinates: Tuple[int, int]):
+        """Запоминаем координаты успешного клика по кнопке prefer"""
+        try:
+            with Image.open(screenshot_path) as img:
+                resolution = img.size
+            self.location_memory.record_point("prefer_button", resolution, coordinates)
+        except Exception as e:
+            self.log(f"Не удалось запомнить координаты: {e}", "WARNING")
+    
     async def execute_command(self, command: str) -> bool:
+        """Выполнение команды (при неудаче - дамп самописца)"""
+        result = False
+        try:
+            with self.log.scope(command=command):
+                result = await self._execute_command(command)
+            return result
+        finally:
+            if not result:
+                self.log.dump("command")
+    
+    async def _execute_command(self, command: str) -> bool:
         """Выполнение команды"""
         self.log(f"Команда: '{command}'", "INFO")
+        self.last_actions = []
         
         # Делаем скриншот
         screenshot_path = await self.take_screenshot()
@@ -552,8 +851,42 @@ CRITICAL RULES:
             return False
         
         try:
+            # Кнопка prefer: сначала DOM, затем дешевая проверка запомненной области
+            actions = None
+            if self.is_prefer_command(command) and self.dom:
+                element = await self.dom.find_async(role="button", texts=["I prefer this", "prefer"])
+                if element:
+                    actions = [BrowserAction(
+                        action_type="click",
+                        coordinates=element.page_center if self.cdp_input else element.center,
+                        description=f"Нажать '{element.text}' (DOM)",
+                        target=element.text,
+                        source="dom"
+                    )]
+            
+            if not actions and self.is_prefer_command(command):
+                coords = self.find_remembered_prefer(screenshot_path)
+                if coords:
+                    actions = [BrowserAction(
+                        action_type="click",
+                        coordinates=coords,
+                        description="Нажать кнопку prefer (запомненная область)",
+                        source="memory"
+                    )]
+            
+            if not actions and self.is_prefer_command(command) and self.detector:
+                coords = await asyncio.to_thread(self.detect_prefer, screenshot_path)
+                if coords:
+                    actions = [BrowserAction(
+                        action_type="click",
+                        coordinates=coords,
+                        description="Нажать кнопку prefer (UI детектор)",
+                        source="detector"
+                    )]
+            
             # Анализируем и планируем
-            actions = await self.analyze_screen(command, screenshot_path)
+            if not actions:
+                actions = await self.analyze_screen(command, screenshot_path)
             
             if not actions:
                 self.log("Не удалось создать план действий", "ERROR")
@@ -561,14 +894,33 @@ CRITICAL RULES:
             
             # Выполняем действия
             success_count = 0
-            for i, action in enumerate(actions):
+            replanned = False
+            i = 0
+            while i < len(actions):
+                action = actions[i]
                 self.log(f"Действие {i+1}/{len(actions)}: {action.description}")
                 
-                if await self.execute_action(action):
+                if await self.execute_verified(action):
                     success_count += 1
-                    await asyncio.sleep(0.8)  # Пауза между действиями
+                    self.last_actions.append({"type": action.action_type, "value": action.value,
+                                              "coordinates": action.coordinates, "source": action.source})
+                    if (action.action_type == "click" and action.source == "ai"
+                            and self.is_prefer_command(command)):
+                        self.remember_prefer_click(screenshot_path, action.coordinates)
+                    await self.pause(0.8)  # Пауза между действиями
                 else:
                     self.log(f"Действие {i+1} не выполнено", "WARNING")
+                    
+                    # Локальные повторы не помогли - один раз перепланируем по новому скриншоту
+                    if action.action_type == "click" and self.verify_actions and not replanned:
+                        replanned = True
+                        new_path = await self.take_screenshot()
+                        if new_path:
+                            self.discard_screenshot(screenshot_path)
+                            screenshot_path = new_path
+                            self.log("Перепланирование по новому скриншоту", "AI")
+                            actions = actions[:i + 1] + await self.analyze_screen(command, screenshot_path)
+                i += 1
             
             result = success_count > 0
             self.log(f"Результат: {success_count}/{len(actions)} действий выполнено", 
@@ -577,25 +929,41 @@ CRITICAL RULES:
             
         finally:
             # Удаляем скриншот
-            try:
-                os.remove(screenshot_path)
-            except:
-                pass
+            self.discard_screenshot(screenshot_path)
     
     async def run_script(self, commands: List[str]) -> bool:
         """Выполнение списка команд"""
         self.log(f"Запуск скрипта из {len(commands)} команд")
         print("=" * 60)
         
-        success_count = 0
+        # Продолжение после сбоя: выполненные команды из журнала не повторяются
+        journal = RunJournal(commands, "ypp_work", self.profile, self.journal_dir,
+                             log=self.log) if self.journal_dir else None
+        start = 0
+        if journal and journal.completed:
+            start = journal.resume_index(await self.current_screen_hash())
+            if start:
+                self.log(f"Продолжение по журналу: команды 1-{start} уже выполнены", "SUCCESS")
+        
+        success_count = start
         
         for i, command in enumerate(commands):
+            if i < start:
+                continue
+            if self.cancel is not None and self.cancel.is_set():
+                self.log("Запуск отменен", "WARNING")
+                break
             self.log(f"Команда {i+1}/{len(commands)}: '{command}'")
+            if journal and i - 1 in journal.completed:
+                # Экран, с которого начинается команда, - состояние после предыдущей
+                journal.mark_screen(i - 1, await self.current_screen_hash())
             
             if await self.execute_command(command):
                 success_count += 1
+                if journal:
+                    journal.complete(i, command, self.last_actions)
                 if i < len(commands) - 1:  # Не ждем после последней команды
-                    await asyncio.sleep(1.5)
+                    await self.pause(1.5)
             else:
                 self.log(f"Команда {i+1} завершилась с ошибками", "WARNING")
         
@@ -603,6 +971,18 @@ CRITICAL RULES:
         result = success_count == len(commands)
         self.log(f"Итог: {success_count}/{len(commands)} команд выполнено успешно", 
                 "SUCCESS" if result else "WARNING")
+        if journal and result:
+            journal.finish()
+        self.log(f"Проверка действий: {self.verifier.stats}")
+        totals = self.ledger.totals()
+        if totals["calls"]:
+            self.log(f"Вызовы моделей: {totals['calls']}, токены {totals['prompt_tokens']}/"
+                     f"{totals['completion_tokens']}, ${totals['cost']:.4f} {totals['outcomes']}")
+            self.log(f"Маршруты моделей: {self.router.summary()}", "DEBUG")
+        try:
+            self.router.save()
+        except OSError as e:
+            self.log(f"Статистика моделей не сохранена: {e}", "WARNING")
         
         return result
 
@@ -698,6 +1078,13 @@ async def main():
         
         else:
             print("❌ Неверный выбор")
+        
+        # Закрываем keep-alive соединения с моделями
+        await automation.vision_client.close()
+        if automation.dom:
+            automation.dom.connection.close()
+        elif automation.cdp_input:
+            automation.cdp_input.connection.close()
     
     except Exception as e:
         print(f"❌ Критическая ошибка: {e}")